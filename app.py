@@ -1,14 +1,38 @@
-from flask import Flask, render_template, request, Response, stream_with_context
+from flask import Flask, render_template, request, Response, stream_with_context, jsonify, url_for, send_file, g
 import requests
 import json
 from datetime import datetime
 import logging
 import time
-from warcio.archiveiterator import ArchiveIterator
 from urllib.parse import urljoin
-import io
 import gzip
+import zlib
 import re
+import queue
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import asset_prefetch
+import async_search
+import capture_map
+import cdx
+import cdx_cache
+import conditional
+import config
+import crawl_registry
+import deadline
+import domain_filter
+import html_rewriter
+import http_client
+import metrics
+import negative_cache
+import record_seek
+import record_store
+import search_strategy
+import single_flight
+import search_tokens
+import warc_stream
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -16,126 +40,65 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+# Fetch the crawl list now rather than on the first search
+crawl_registry.warm()
+
 def get_available_indexes():
-    """Get list of available Common Crawl indexes"""
-    try:
-        response = requests.get("https://index.commoncrawl.org/collinfo.json")
-        if response.status_code == 200:
-            indexes = response.json()
-            # Sort by timestamp in descending order (newest first)
-            return [index['cdx-api'] for index in sorted(indexes, key=lambda x: x['id'], reverse=True)]
-    except Exception as e:
-        logger.error(f"Error fetching Common Crawl indexes: {str(e)}", exc_info=True)
-        return ["https://index.commoncrawl.org/CC-MAIN-2024-04-index"]
+    """Get list of available Common Crawl indexes, newest first"""
+    with metrics.timed('indexes'):
+        return crawl_registry.get_registry().indexes()
 
 def binary_search_indexes(url, indexes):
-    """Binary search through indexes to find the most recent capture of the URL"""
-    logger.debug(f"Starting binary search for URL: {url} across {len(indexes)} indexes")
-    
-    params = {
-        'url': url,
-        'output': 'json',
-        'showNumPages': False,
-        'matchType': 'exact'  # Use exact matching for more precise results
-    }
-
-    left = 0
-    right = len(indexes) - 1
-    last_found_result = None
-    last_found_index = None
-
-    while left <= right:
-        mid = (left + right) // 2
-        mid_index = indexes[mid]
-        
+    """Search through indexes to find the most recent capture of the URL"""
+    logger.debug(f"Starting search for URL: {url} across {len(indexes)} indexes")
+    matches = {}
+
+    def probe(position):
+        index = indexes[position]
         try:
-            logger.debug(f"Trying index: {mid_index} (position {mid})")
-            response = requests.get(mid_index, params=params)
-            
-            if response.status_code == 200 and response.text.strip():
-                results = [json.loads(line) for line in response.text.strip().split('\n')]
-                if results:
-                    results.sort(key=lambda x: x['timestamp'], reverse=True)
-                    last_found_result = results[0]
-                    last_found_index = mid
-                    right = mid - 1
-                else:
-                    left = mid + 1
-            else:
-                left = mid + 1
-            
-            time.sleep(0.2)
-            
+            logger.debug(f"Trying index: {index} (position {position})")
+            matches[position] = cdx.lookup_exact(index, url, timeout=config.HTTP_TIMEOUT, latest=(position == 0))
+            return matches[position] is not None
+        except http_client.Throttled:
+            raise  # Unknown, not a miss
         except Exception as e:
-            logger.error(f"Error searching index {mid_index}: {str(e)}", exc_info=True)
-            left = mid + 1
-            continue
+            logger.error(f"Error searching index {index}: {str(e)}", exc_info=True)
+            return False
 
-    return last_found_result
+    position = search_strategy.find_first(len(indexes), probe)
+    return matches[position] if position is not None else None
 
 def binary_search_domain(domain, indexes):
-    """Binary search to find the domain in indexes"""
-    logger.debug(f"Starting binary search for domain: {domain}")
-    
-    params = {
-        'url': domain,
-        'output': 'json',
-        'showNumPages': False,
-        'matchType': 'domain'
-    }
-
-    left = 0
-    right = len(indexes) - 1
-    last_found_index = None
+    """Search for the newest index holding the domain"""
+    logger.debug(f"Starting search for domain: {domain}")
     timeout = 2  # 2 second timeout for each request
 
-    while left <= right:
-        mid = (left + right) // 2
-        mid_index = indexes[mid]
-        
+    def probe(position):
+        index = indexes[position]
         try:
-            logger.debug(f"Trying index: {mid_index} (position {mid})")
-            response = requests.get(mid_index, params=params, timeout=timeout)
-            
-            if response.status_code == 200 and response.text.strip():
-                last_found_index = mid_index
-                right = mid - 1  # Keep searching newer indexes
-            else:
-                left = mid + 1
-            
-            time.sleep(0.1)  # Reduced delay
-            
+            logger.debug(f"Trying index: {index} (position {position})")
+            return cdx.has_captures(index, domain, 'domain', timeout=timeout, latest=(position == 0))
+        except http_client.Throttled:
+            raise  # Unknown, not a miss
         except requests.Timeout:
-            logger.warning(f"Timeout searching index {mid_index}, moving to next")
-            left = mid + 1
-            continue
+            logger.warning(f"Timeout searching index {index}, moving to next")
+            return False
         except Exception as e:
-            logger.error(f"Error searching index {mid_index}: {str(e)}", exc_info=True)
-            left = mid + 1
-            continue
+            logger.error(f"Error searching index {index}: {str(e)}", exc_info=True)
+            return False
 
-    return last_found_index
+    position = search_strategy.find_first(len(indexes), probe)
+    return indexes[position] if position is not None else None
 
 def linear_search_url(url, index):
     """Linear search for exact URL match within an index"""
     logger.debug(f"Linear searching for URL: {url} in index: {index}")
     
-    params = {
-        'url': url,
-        'output': 'json',
-        'showNumPages': False,
-        'matchType': 'exact'
-    }
-
     try:
-        response = requests.get(index, params=params, timeout=2)
-        if response.status_code == 200 and response.text.strip():
-            results = [json.loads(line) for line in response.text.strip().split('\n')]
-            if results:
-                # Sort by timestamp in descending order
-                results.sort(key=lambda x: x['timestamp'], reverse=True)
-                logger.info(f"Found {len(results)} matches for URL {url}")
-                return results[0]  # Return the most recent match
+        results = cdx.query_cdx(index, url, 'exact', timeout=2)
+        if results:
+            logger.info(f"Found {len(results)} matches for URL {url}")
+            return cdx.newest_record(results)  # Return the most recent match
     except requests.Timeout:
         logger.warning(f"Timeout during linear search for {url}")
     except Exception as e:
@@ -143,61 +106,86 @@ def linear_search_url(url, index):
     
     return None
 
-def search_common_crawl(url):
-    """Two-step search: binary search for domain, then linear search for full URL"""
+def base_domain_of(url):
+    """Extract the domain a URL is searched under (without www.)"""
+    domain_match = re.match(r'^https?://(www\.)?([^/]+)', url)
+    if domain_match:
+        return domain_match.group(2)
+    return url.split('/')[0].strip()
+
+def report(progress, status, percent):
+    """Pass a search progress update to the caller's callback, if any"""
+    if progress is not None:
+        progress(status, percent)
+
+@cdx_cache.cached_search('app')
+def search_common_crawl(url, progress=None):
+    """Two-step search: newest crawl holding the domain, then linear search for full URL.
+
+    progress, if given, is called as progress(status, percent) as the
+    search advances; /search-progress relays these to the browser. The
+    whole search shares one config.SEARCH_DEADLINE budget; when it runs
+    out, DeadlineExceeded is raised instead of reporting a miss.
+    """
+    search_deadline = deadline.Deadline(config.SEARCH_DEADLINE)
     logger.debug(f"Starting search for URL: {url}")
     
     # Get all available indexes
+    report(progress, 'Fetching Common Crawl indexes...', 10)
     indexes = get_available_indexes()
     if not indexes:
         logger.error("No Common Crawl indexes available")
         return None
+    report(progress, f'Found {len(indexes)} Common Crawl indexes...', 20)
 
-    # Extract domain from URL
-    domain_match = re.match(r'^https?://(www\.)?([^/]+)', url)
-    if domain_match:
-        base_domain = domain_match.group(2)
-    else:
-        base_domain = url.split('/')[0].strip()
-    
-    logger.debug(f"Starting binary search for domain: {base_domain}")
+    found_index = find_domain_index(base_domain_of(url), indexes, progress, search_deadline)
+    if not found_index:
+        return None
+    return find_url_from_index(url, indexes, found_index, progress, search_deadline)
+
+def find_domain_index(base_domain, indexes, progress=None, search_deadline=None):
+    """Step 1: search for the newest index holding the domain"""
+    search_deadline = search_deadline or deadline.Deadline(None)
+    logger.debug(f"Starting search for domain: {base_domain}")
+    report(progress, f'Searching for domain: {base_domain}...', 30)
     
-    # Step 1: Binary search for the domain
     domain_variations = [
         base_domain,
         f"www.{base_domain}"
     ]
 
+    # Crawls already known not to hold the domain are skipped
+    negatives = negative_cache.get_negative_cache()
+    search_space = negatives.domain_search_space(base_domain, indexes)
+    probe_failed = False
+    probes = 0
+
     found_index = None
     for domain in domain_variations:
-        # Binary search for domain
-        left = 0
-        right = len(indexes) - 1
-        
-        while left <= right:
-            mid = (left + right) // 2
-            current_index = indexes[mid]
-            
+        def probe(position):
+            nonlocal probe_failed, probes
+            current_index = search_space[position]
+            probes += 1
+            report(progress, f'Checking domain in index {position + 1} of {len(search_space)}...', min(75, 30 + 5 * probes))
             try:
                 logger.debug(f"Checking domain '{domain}' in index: {current_index}")
-                params = {
-                    'url': domain,
-                    'output': 'json',
-                    'matchType': 'domain'
-                }
-                
-                response = requests.get(current_index, params=params, timeout=2)
-                if response.status_code == 200 and response.text.strip():
-                    found_index = current_index
-                    right = mid - 1  # Keep searching newer indexes
-                else:
-                    left = mid + 1
-                
-                time.sleep(0.1)
+                return cdx.has_captures(current_index, domain, 'domain', timeout=search_deadline.timeout(2),
+                                        latest=(position == 0), search_deadline=search_deadline)
+            except cdx.UNKNOWN_ERRORS:
+                raise  # Unknown, not a miss
             except Exception as e:
+                if search_deadline.expired():
+                    raise deadline.DeadlineExceeded()
                 logger.warning(f"Error checking domain in index {current_index}: {str(e)}")
-                left = mid + 1
-                continue
+                probe_failed = True
+                cdx_cache.probe_failed()
+                return False
+
+        # Newest crawl holding the domain, found with the configured strategy
+        with metrics.timed('domain_search'):
+            position = search_strategy.find_first(len(search_space), probe)
+        if position is not None:
+            found_index = search_space[position]
         
         if found_index:
             logger.info(f"Found domain '{domain}' in index: {found_index}")
@@ -205,51 +193,170 @@ def search_common_crawl(url):
 
     if not found_index:
         logger.warning(f"Domain not found in any index: {base_domain}")
-        return None
+        if not probe_failed:
+            negatives.mark_domain_absent(base_domain, indexes)
+    return found_index
 
-    # Step 2: Linear search for the exact URL in the found index and newer indexes
+def find_url_from_index(url, indexes, found_index, progress=None, search_deadline=None):
+    """Step 2: linear search for the exact URL in the found index and newer indexes"""
+    search_deadline = search_deadline or deadline.Deadline(None)
     logger.debug(f"Starting linear search for full URL from found index")
+    report(progress, 'Found domain! Searching for exact URL...', 80)
+    negatives = negative_cache.get_negative_cache()
     start_index = indexes.index(found_index)
-    
-    # Search through the found index and all newer indexes
-    for index in indexes[start_index::-1]:  # Go backwards through newer indexes
+    url_variations = [
+        url.replace('?ver=3.8.1', ''),  # Remove version
+        url.replace('http://', 'https://'),
+        url.replace('https://', 'http://'),
+        url.replace('://www.', '://'),
+        url.replace('://', '://www.')
+    ]
+
+    failures = []
+
+    def check_variant(index, url_variant):
+        logger.debug(f"Checking URL variant {url_variant} in index: {index}")
         try:
-            logger.debug(f"Checking URL in index: {index}")
-            url_variations = [
-                url.replace('?ver=3.8.1', ''),  # Remove version
-                url.replace('http://', 'https://'),
-                url.replace('https://', 'http://'),
-                url.replace('://www.', '://'),
-                url.replace('://', '://www.')
-            ]
-
-            for url_variant in url_variations:
-                params = {
-                    'url': url_variant,
-                    'output': 'json',
-                    'matchType': 'exact'
-                }
-                
-                response = requests.get(index, params=params, timeout=2)
-                if response.status_code == 200 and response.text.strip():
-                    results = [json.loads(line) for line in response.text.strip().split('\n')]
-                    if results:
-                        results.sort(key=lambda x: x['timestamp'], reverse=True)
-                        logger.info(f"Found exact match for URL variant: {url_variant}")
-                        return results[0]
-                
-                time.sleep(0.1)
-        except Exception as e:
-            logger.warning(f"Error checking URL in index {index}: {str(e)}")
-            continue
+            with metrics.timed('variant_lookup'):
+                match = cdx.lookup_exact(index, url_variant, timeout=search_deadline.timeout(2),
+                                         latest=(index == indexes[0]), search_deadline=search_deadline)
+        except cdx.UNKNOWN_ERRORS:
+            raise
+        except Exception:
+            if search_deadline.expired():
+                raise deadline.DeadlineExceeded()
+            failures.append(index)
+            cdx_cache.probe_failed()
+            raise
+        if match:
+            logger.info(f"Found exact match for URL variant: {url_variant}")
+        return match
+
+    # Search through the found index and all newer indexes, going backwards,
+    # skipping crawls an earlier search already found empty
+    url_key = ('app', url)
+    probes = [(index, url_variant)
+              for index in negatives.unchecked_indexes(url_key, indexes, start_index)
+              for url_variant in url_variations]
+    with metrics.timed('url_search'):
+        match = cdx.find_first_match(probes, check_variant, max_workers=config.SEARCH_CONCURRENCY)
+    if match:
+        return match
 
     logger.warning(f"No exact URL match found after searching from index {found_index}")
+    if not failures:
+        negatives.mark_url_absent(url_key, indexes, start_index)
     return None
 
+# Fields of a search result reported by /bulk-lookup, as shown by index()
+RESULT_FIELDS = ('url', 'timestamp', 'filename', 'offset', 'length', 'mime', 'status', 'digest')
+
+def search_domain_group(base_domain, urls, indexes, emit):
+    """Resolve URLs sharing one domain, running the domain search only once.
+
+    emit(url, result, error, partial) is called for every input URL as soon
+    as its result is known; partial marks a search cut short by its
+    deadline (result is then whatever was found in time). Results go
+    through the same search cache as search_common_crawl, so bulk and
+    single lookups share their work.
+    """
+    cache = cdx_cache.get_cache()
+    pending = {}
+    for url in urls:
+        normalized_url = normalize_url(url)
+        if normalized_url in pending:
+            pending[normalized_url].append(url)
+            continue
+        if cache is not None:
+            result = cache.get(cdx_cache.search_key('app', normalized_url))
+            if result is not cdx_cache.MISSING:
+                emit(url, result, None, False)
+                continue
+        pending[normalized_url] = [url]
+    if not pending:
+        return
+
+    try:
+        with cdx_cache.search_outcome() as domain_outcome:
+            found_index = find_domain_index(base_domain, indexes, search_deadline=deadline.Deadline(config.SEARCH_DEADLINE))
+    except Exception as e:
+        logger.error(f"Error searching for domain {base_domain}: {str(e)}")
+        for originals in pending.values():
+            for url in originals:
+                emit(url, None, str(e), isinstance(e, deadline.DeadlineExceeded))
+        return
+
+    for normalized_url, originals in pending.items():
+        error, partial = None, False
+        try:
+            result = None
+            with cdx_cache.search_outcome() as outcome:
+                if domain_outcome.failed:
+                    cdx_cache.probe_failed()
+                if found_index:
+                    result = find_url_from_index(normalized_url, indexes, found_index,
+                                                 search_deadline=deadline.Deadline(config.SEARCH_DEADLINE))
+            if cache is not None:
+                cdx_cache.cache_search_result(cache, cdx_cache.search_key('app', normalized_url), result, outcome)
+        except deadline.DeadlineExceeded as e:
+            result, error, partial = e.partial, str(e), True
+        except Exception as e:
+            logger.error(f"Error searching for {normalized_url}: {str(e)}")
+            result, error = None, str(e)
+        for url in originals:
+            emit(url, result, error, partial)
+
+def bulk_search(urls, workers=None):
+    """Yield (url, result, error, partial) for every URL, in completion order.
+
+    URLs are grouped by domain and the groups are resolved concurrently on
+    `workers` threads (config.BULK_CONCURRENCY by default).
+    """
+    indexes = get_available_indexes()
+    if not indexes:
+        logger.error("No Common Crawl indexes available")
+        for url in urls:
+            yield url, None, 'No Common Crawl indexes available', False
+        return
+
+    groups = {}
+    for url in urls:
+        groups.setdefault(base_domain_of(normalize_url(url)), []).append(url)
+    logger.info(f"Bulk lookup of {len(urls)} URLs across {len(groups)} domains")
+
+    results = queue.Queue()
+
+    def run_group(base_domain, group):
+        # Every URL must get exactly one line, or the stream would wait for it forever
+        remaining = Counter(group)
+
+        def emit(url, result, error, partial):
+            remaining[url] -= 1
+            results.put((url, result, error, partial))
+
+        error = 'Lookup did not complete'
+        try:
+            search_domain_group(base_domain, group, indexes, emit)
+        except Exception as e:
+            logger.error(f"Error in bulk lookup of {base_domain}: {str(e)}", exc_info=True)
+            error = str(e)
+        for url in remaining.elements():
+            results.put((url, None, error, False))
+
+    executor = ThreadPoolExecutor(max_workers=max(1, workers or config.BULK_CONCURRENCY))
+    try:
+        for base_domain, group in groups.items():
+            metrics.submit(executor, run_group, base_domain, group)
+        for _ in range(len(urls)):
+            yield results.get()
+    finally:
+        # A client that disconnects early should not keep the groups running
+        executor.shutdown(wait=False, cancel_futures=True)
+
 def fetch_wayback_content(wayback_url):
     logger.debug(f"Fetching content from Wayback Machine: {wayback_url}")
     try:
-        response = requests.get(wayback_url)
+        response = http_client.get(wayback_url)
         logger.debug(f"Wayback Machine response status: {response.status_code}")
         
         if response.status_code == 200:
@@ -296,100 +403,130 @@ def format_timestamp(timestamp):
         logger.error(f"Error formatting timestamp {timestamp}: {str(e)}")
         return timestamp
 
+def fix_url(url_str, base_url):
+    """Resolve a reference found in archived content against its page URL"""
+    if url_str.startswith('//'):
+        return 'https:' + url_str
+    elif url_str.startswith('/'):
+        return urljoin(base_url, url_str)
+    elif not url_str.startswith(('http://', 'https://', 'data:', '#', 'mailto:')):
+        return urljoin(base_url, url_str)
+    return url_str
+
 def fetch_common_crawl_content(result):
-    """Fetch content directly from Common Crawl WARC file"""
+    """Fetch content directly from Common Crawl WARC file.
+
+    Returns (chunks, content_type) where chunks is a generator of rewritten
+    bytes read straight from the WARC record, or (None, None) on failure.
+    Payloads already in the record store are read from disk instead.
+    """
     try:
-        filename = result['filename']
-        offset = int(result['offset'])
-        length = int(result['length'])
-        
-        s3_url = f"https://data.commoncrawl.org/{filename}"
-        headers = {'Range': f'bytes={offset}-{offset+length-1}'}
-        response = requests.get(s3_url, headers=headers, stream=True)
-        
-        if response.status_code == 206:
-            stream = io.BytesIO(response.content)
-            for record in ArchiveIterator(stream):
-                if record.rec_type == 'response':
-                    http_headers = record.http_headers
-                    if http_headers is None:
-                        continue
-                    
-                    content = record.content_stream().read().decode('utf-8', errors='ignore')
-                    base_url = result['url']
-
-                    # Fix relative URLs in the content
-                    def fix_url(url_str):
-                        if url_str.startswith('//'):
-                            return 'https:' + url_str
-                        elif url_str.startswith('/'):
-                            return urljoin(base_url, url_str)
-                        elif not url_str.startswith(('http://', 'https://', 'data:', '#', 'mailto:')):
-                            return urljoin(base_url, url_str)
-                        return url_str
-
-                    # Process all URLs in the content
-                    def process_urls(match):
-                        quote_char = match.group(1) or ''
-                        url = match.group(2)
-                        fixed_url = fix_url(url)
-                        return f'/asset?url={fixed_url}'
-
-                    # Replace URLs in different contexts
-                    content = re.sub(r'src=(["\']?)([^"\'\s>]+)', lambda m: f'src={m.group(1)}/asset?url={fix_url(m.group(2))}', content)
-                    content = re.sub(r'href=(["\']?)([^"\'\s>]+)', lambda m: f'href={m.group(1)}/asset?url={fix_url(m.group(2))}', content)
-                    content = re.sub(r'url\((["\']?)([^"\'\)]+)(["\']?)\)', lambda m: f'url({m.group(1)}/asset?url={fix_url(m.group(2))}{m.group(3)})', content)
-
-                    logger.debug("Successfully extracted and processed HTML content")
-                    return content
-                    
-        logger.error(f"Failed to fetch WARC content. Status code: {response.status_code}")
-        return None
-        
+        crawl = crawl_id_of(result['filename'])
+        timestamp = result.get('timestamp')
+        store = record_store.get_store()
+        stored = store.get(result.get('digest')) if store is not None else None
+        if store is not None:
+            metrics.CACHE_LOOKUPS.inc('record_store', 'miss' if stored is None else 'hit')
+        if stored is not None:
+            logger.debug(f"Serving {result['url']} from record store")
+            payload = record_store.iter_stored(stored)
+            return stream_rewritten_content(payload, result['url'], crawl, timestamp), stored.content_type or 'text/html'
+
+        response, record = warc_stream.open_record(result['filename'], result['offset'], result['length'])
+        if record is None:
+            return None, None
+        content_type = warc_stream.content_type(record, 'text/html')
+        payload = warc_stream.iter_payload(response, record)
+        if store is not None and result.get('digest'):
+            payload = store.tee(result['digest'], record, payload)
+        return stream_rewritten_content(payload, result['url'], crawl, timestamp), content_type
     except Exception as e:
         logger.error(f"Error fetching Common Crawl content: {str(e)}", exc_info=True)
-        return None
+        return None, None
+
+def stream_rewritten_content(payload, base_url, crawl=None, timestamp=None):
+    """Yield payload chunks with links pointed at /asset, prefetching the assets.
+
+    crawl and timestamp identify the page's own capture; they are passed on
+    to /asset so its assets are looked up in that crawl first.
+    """
+    # Every rewritten asset is queued for prefetching, counted in this render's batch
+    prefetcher = asset_prefetch.get_prefetcher()
+    batch = prefetcher.new_batch()
+    asset_urls = set()
+    queued = set()
+
+    # url= stays last: rewritten URLs are not escaped and may hold their own '&'
+    hint = ''
+    if crawl:
+        hint += f'crawl={crawl}&'
+    if timestamp:
+        hint += f'ts={timestamp}&'
+
+    def rewrite(kind, url_str):
+        fixed_url = fix_url(url_str, base_url)
+        # href= only prefetches stylesheets, icons and the like, not linked pages
+        if fixed_url.startswith(('http://', 'https://')) and (kind != 'href' or is_asset_path(url_str)):
+            asset_urls.add((clean_asset_url(fixed_url), crawl, timestamp))
+        return f'/asset?{hint}url={fixed_url}'
 
-def fetch_asset_from_common_crawl(url):
-    """Fetch assets (CSS, JS, images) from Common Crawl"""
     try:
-        logger.debug(f"Searching for asset in Common Crawl: {url}")
-        result = search_common_crawl(url)
-        
-        if not result:
-            logger.warning(f"Asset not found in Common Crawl index: {url}")
-            return None, None
+        for output in html_rewriter.rewrite_stream(payload, rewrite):
+            # Hand newly seen assets to the prefetcher while the page is still streaming
+            new_urls = asset_urls - queued
+            if new_urls and len(queued) < config.PREFETCH_MAX_ASSETS:
+                new_urls = sorted(new_urls)[:config.PREFETCH_MAX_ASSETS - len(queued)]
+                queued.update(new_urls)
+                prefetcher.submit(batch, new_urls, resolve_asset)
+            yield output
+        logger.debug("Successfully streamed and processed archived content")
+    finally:
+        payload.close()
 
-        logger.debug(f"Found asset in Common Crawl: {result['filename']}")
-        filename = result['filename']
-        offset = int(result['offset'])
-        length = int(result['length'])
-        
-        s3_url = f"https://data.commoncrawl.org/{filename}"
-        headers = {'Range': f'bytes={offset}-{offset+length-1}'}
-        
-        logger.debug(f"Fetching asset from S3: {s3_url}")
-        response = requests.get(s3_url, headers=headers, stream=True)
-        
-        if response.status_code == 206:
-            stream = io.BytesIO(response.content)
-            for record in ArchiveIterator(stream):
-                if record.rec_type == 'response':
-                    http_headers = record.http_headers
-                    content_type = http_headers.get_header('Content-Type', '') if http_headers else None
-                    
-                    content = record.content_stream().read()
-                    logger.info(f"Successfully fetched asset: {url} ({content_type})")
-                    return content, content_type
-            
-            logger.warning(f"No valid record found in WARC for: {url}")
-        else:
-            logger.error(f"Failed to fetch from S3. Status: {response.status_code}")
+def fetch_asset_record(url, result):
+    """Fetch the payload of an asset's CDX record, preferring the record store.
+
+    Returns (content, content_type, encoding): a payload captured in a
+    passthrough Content-Encoding (gzip, deflate) is kept as captured and
+    encoding names it; otherwise encoding is None. Concurrent fetches of the
+    same record share one Range request. A failed fetch raises.
+    """
+    key = ('record', result['filename'], result['offset'], result['length'])
+    return single_flight.get_single_flight().do(key, lambda: _fetch_asset_record(url, result))
+
+def _fetch_asset_record(url, result):
+    try:
+        store = record_store.get_store()
+        stored = store.get(result.get('digest')) if store is not None else None
+        if store is not None:
+            metrics.CACHE_LOOKUPS.inc('record_store', 'miss' if stored is None else 'hit')
+        if stored is not None:
+            logger.info(f"Serving asset from record store: {url} ({stored.content_type})")
+            return stored, stored.content_type, None
+
+        response, record = warc_stream.open_record(result['filename'], result['offset'], result['length'])
+        if record is not None:
+            content_type = record.http_headers.get_header('Content-Type', '')
+            encoding = warc_stream.content_encoding(record)
+            if encoding is not None:
+                # Kept compressed as captured; the record store only holds decoded payloads
+                content = b''.join(warc_stream.iter_payload(response, record, raw=True))
+                logger.info(f"Successfully fetched {encoding} asset: {url} ({content_type})")
+                return content, content_type, encoding
+            payload = warc_stream.iter_payload(response, record)
+            if store is not None and result.get('digest'):
+                payload = store.tee(result['digest'], record, payload)
+            content = b''.join(payload)
+            logger.info(f"Successfully fetched asset: {url} ({content_type})")
+            # Serve the stored copy when it was small enough to keep
+            stored = store.get(result['digest']) if store is not None and result.get('digest') else None
+            return stored or content, content_type, None
         
-        return None, None
+        logger.warning(f"No valid record found in WARC for: {url}")
+        return None, None, None
     except Exception as e:
         logger.error(f"Error fetching asset {url}: {str(e)}", exc_info=True)
-        return None, None
+        raise
 
 # Add these helper functions for better URL handling and logging
 def clean_asset_url(url):
@@ -421,6 +558,151 @@ def clean_asset_url(url):
         logger.error(f"Error cleaning asset URL {url}: {str(e)}")
         return url
 
+ASSET_CONTENT_TYPES = {
+    'css': 'text/css',
+    'js': 'application/javascript',
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'gif': 'image/gif',
+    'svg': 'image/svg+xml',
+    'webp': 'image/webp',
+    'ico': 'image/x-icon',
+    'woff': 'font/woff',
+    'woff2': 'font/woff2',
+    'ttf': 'font/ttf',
+    'eot': 'application/vnd.ms-fontobject'
+}
+
+def is_asset_path(url):
+    """Check whether a URL looks like a page asset rather than a link to another page"""
+    path = url.split('?', 1)[0].split('#', 1)[0]
+    ext = path.rsplit('.', 1)[-1].lower() if '.' in path.rsplit('/', 1)[-1] else ''
+    return ext in ASSET_CONTENT_TYPES
+
+def crawl_id_of(filename):
+    """Extract the crawl id (e.g. CC-MAIN-2024-10) from a WARC filename"""
+    match = re.search(r'CC-MAIN-\d{4}-\d{2}', filename or '')
+    return match.group(0) if match else None
+
+def find_asset_in_crawl(url, crawl, timestamp=None, errors=None):
+    """Exact lookups for an asset in its page's crawl, then in neighbouring crawls.
+
+    Returns the capture closest to timestamp (newest if no timestamp), or None.
+    Lookups that fail are appended to errors, if given.
+    """
+    registry = crawl_registry.get_registry()
+    position = registry.position_of_id(crawl)
+    if position is None:
+        return None
+    indexes = registry.indexes()
+
+    candidates = [position]
+    for distance in range(1, config.ASSET_AFFINITY_NEIGHBOURS + 1):
+        candidates.extend(p for p in (position - distance, position + distance) if 0 <= p < len(indexes))
+
+    variations = [url, url.replace('://www.', '://'), url.replace('https://', 'http://')]
+    variations = list(dict.fromkeys(variations))
+
+    maps = capture_map.get_capture_maps()
+
+    def check(index, url_variant):
+        # One paginated pull per (crawl, host) answers every later lookup for that host
+        try:
+            records = maps.lookup(index, url_variant) if maps is not None else None
+            if records is None:
+                records = cdx.query_cdx(index, url_variant, 'exact', timeout=2, latest=(index == indexes[0]))
+        except Exception as e:
+            if errors is not None:
+                errors.append(e)
+            raise
+        if timestamp:
+            return cdx.closest_record(records, timestamp)
+        return cdx.newest_record(records)
+
+    probes = [(indexes[p], url_variant) for p in candidates for url_variant in variations]
+    return cdx.find_first_match(probes, check, max_workers=config.SEARCH_CONCURRENCY)
+
+def asset_captures(url, crawl=None, timestamp=None, errors=None):
+    """Yield candidate captures of a cleaned asset URL, best first.
+
+    When the referencing page's crawl is known, that crawl and its
+    neighbours are tried first; then the global search for the URL and for
+    common variations of it. Only CDX lookups run here, nothing is fetched.
+    Lookups that fail are appended to errors, if given.
+    """
+    if crawl:
+        try:
+            result = find_asset_in_crawl(url, crawl, timestamp, errors)
+        except Exception as e:
+            logger.error(f"Error searching for asset {url} in {crawl}: {str(e)}")
+            if errors is not None:
+                errors.append(e)
+            result = None
+        if result:
+            logger.debug(f"Found asset {url} near its page's crawl {crawl}")
+            yield result
+
+    variations = [
+        url,
+        url.replace('www.', ''),  # Try without www
+        url.replace('https://', 'http://'),  # Try HTTP
+        re.sub(r'https?://(?:www\.)?', 'https://www.', url)  # Force www
+    ]
+    for variant in dict.fromkeys(variations):
+        try:
+            logger.debug(f"Searching for asset in Common Crawl: {variant}")
+            result = search_common_crawl(variant)
+        except Exception as e:
+            logger.error(f"Error searching for asset {variant}: {str(e)}", exc_info=True)
+            if errors is not None:
+                errors.append(e)
+            result = getattr(e, 'partial', None)
+        if result:
+            yield result
+
+class AssetUnavailable(Exception):
+    """An asset could not be resolved because a lookup or fetch failed; it may still exist"""
+
+def resolve_asset(url, crawl=None, timestamp=None):
+    """Find a cleaned asset URL in Common Crawl and fetch it.
+
+    Returns (content, content_type, capture, encoding), where capture is
+    the CDX record served and encoding the Content-Encoding content is
+    still in (see fetch_asset_record), or all None if nothing was found.
+    Raises AssetUnavailable instead when it was not found but a lookup or
+    fetch failed along the way, so the outage is not taken for a miss.
+    """
+    errors = []
+    for capture in asset_captures(url, crawl, timestamp, errors):
+        try:
+            content, content_type, encoding = fetch_asset_record(url, capture)
+        except Exception as e:
+            errors.append(e)
+            continue
+        if content is None:
+            continue
+        content_type = content_type or 'application/octet-stream'
+        # Determine content type from file extension if not provided
+        if content_type == 'application/octet-stream':
+            ext = url.split('.')[-1].lower() if '.' in url else ''
+            content_type = ASSET_CONTENT_TYPES.get(ext, 'application/octet-stream')
+        return content, content_type, capture, encoding
+
+    if errors:
+        raise AssetUnavailable(f"Asset lookup failed: {str(errors[0])}") from errors[0]
+    logger.warning(f"Asset not found in Common Crawl index: {url}")
+    return None, None, None, None
+
+def decode_payload(content, encoding):
+    """Undo a passthrough Content-Encoding for a client that does not accept it"""
+    if encoding == 'gzip':
+        return gzip.decompress(content)
+    try:
+        return zlib.decompress(content)
+    except zlib.error:
+        return zlib.decompress(content, -zlib.MAX_WBITS)  # raw deflate, as some servers send
+
 # Update the serve_asset route with better error handling
 @app.route('/asset')
 def serve_asset():
@@ -433,70 +715,142 @@ def serve_asset():
         url = clean_asset_url(original_url)
         logger.info(f"Asset request - Original: {original_url} -> Cleaned: {url}")
         
-        content, warc_content_type = fetch_asset_from_common_crawl(url)
+        prefetcher = asset_prefetch.get_prefetcher()
+        crawl = request.args.get('crawl') or None
+        timestamp = request.args.get('ts') or None
+        if timestamp and not timestamp.isdigit():
+            timestamp = None
+        key = (url, crawl, timestamp)
+        cache_control = {'Cache-Control': 'public, max-age=31536000'}
+        capture = None
+
+        # Revalidations are answered from the CDX lookup alone, without fetching the record
+        if conditional.is_conditional(request):
+            capture = next(asset_captures(*key), None)
+            if capture is not None and conditional.not_modified(request, capture):
+                logger.info(f"Asset not modified: {url}")
+                return conditional.not_modified_response(request, capture, cache_control)
+
+        # A seek into media not fetched yet inflates only what the range needs
+        if request.headers.get('Range') and prefetcher.peek(key) is None:
+            capture = capture or next(asset_captures(*key), None)
+            partial = record_seek.range_response(request, capture, cache_control) if capture else None
+            if partial is not None:
+                logger.info(f"Serving range of asset {url}: {partial.headers.get('Content-Range')}")
+                return partial
+
+        content, content_type, capture, encoding = prefetcher.get(key, resolve_asset)
+        if isinstance(content, record_store.StoredPayload):
+            # The cache only points into the record store, which may have evicted the payload since;
+            # reading it back through the store also marks it as recently used
+            stored = record_store.get_store().get(content.digest)
+            if stored is None:
+                logger.info(f"Stored asset {url} was evicted, fetching it again")
+                prefetcher.discard(key)
+                content, content_type, capture, encoding = prefetcher.get(key, resolve_asset)
+            else:
+                content = stored
         
+        if isinstance(content, record_store.StoredPayload):
+            logger.info(f"Successfully serving stored asset {url} with type {content_type}")
+            response = send_file(content.path, mimetype=content_type, max_age=31536000, conditional=False, etag=False)
+            response.headers.update(conditional.validator_headers(capture, conditional.was_encoded(content.headers)))
+            return conditional.make_ranged(response, request, content.size)
         if content is not None:
-            content_type = warc_content_type or 'application/octet-stream'
-            
-            # Determine content type from file extension if not provided
-            if content_type == 'application/octet-stream':
-                ext = url.split('.')[-1].lower() if '.' in url else ''
-                content_types = {
-                    'css': 'text/css',
-                    'js': 'application/javascript',
-                    'png': 'image/png',
-                    'jpg': 'image/jpeg',
-                    'jpeg': 'image/jpeg',
-                    'gif': 'image/gif',
-                    'svg': 'image/svg+xml',
-                    'webp': 'image/webp',
-                    'ico': 'image/x-icon',
-                    'woff': 'font/woff',
-                    'woff2': 'font/woff2',
-                    'ttf': 'font/ttf',
-                    'eot': 'application/vnd.ms-fontobject'
-                }
-                content_type = content_types.get(ext, 'application/octet-stream')
-            
             logger.info(f"Successfully serving asset {url} with type {content_type}")
-            return Response(content, 
-                          headers={
-                              'Cache-Control': 'public, max-age=31536000',
-                              'Content-Type': content_type
-                          })
-        
-        # Try alternative URL variations if the asset wasn't found
-        variations = [
-            url.replace('www.', ''),  # Try without www
-            url.replace('https://', 'http://'),  # Try HTTP
-            re.sub(r'https?://(?:www\.)?', 'https://www.', url)  # Force www
-        ]
-        
-        for variant in variations:
-            logger.debug(f"Trying variant URL: {variant}")
-            content, warc_content_type = fetch_asset_from_common_crawl(variant)
-            if content is not None:
-                logger.info(f"Found asset using variant URL: {variant}")
-                return Response(content, 
-                              headers={
-                                  'Cache-Control': 'public, max-age=31536000',
-                                  'Content-Type': warc_content_type or 'application/octet-stream'
-                              })
+            headers = dict(cache_control, **{'Content-Type': content_type})
+            decoded = False
+            if encoding is not None:
+                # Sent compressed as captured to clients that accept it
+                headers['Vary'] = 'Accept-Encoding'
+                if conditional.accepts_encoding(request, encoding):
+                    headers['Content-Encoding'] = encoding
+                else:
+                    content, decoded = decode_payload(content, encoding), True
+            headers.update(conditional.validator_headers(capture, decoded))
+            return conditional.make_ranged(Response(content, headers=headers), request, len(content))
         
         logger.warning(f"Asset not found after trying variations: {url}")
         return f"Asset not found: {url}", 404
 
+    except AssetUnavailable as e:
+        logger.warning(f"Asset unavailable {original_url}: {str(e)}")
+        return f"Asset temporarily unavailable: {str(e)}", 503, {'Retry-After': '30'}
     except Exception as e:
         logger.error(f"Error serving asset {original_url}: {str(e)}", exc_info=True)
         return f"Error serving asset: {str(e)}", 500
 
+@app.before_request
+def start_request_timings():
+    g.start_time = time.perf_counter()
+    metrics.start_timings()
+
+@app.after_request
+def add_server_timing(response):
+    """Count the response and report the request's stage timings in a Server-Timing header.
+
+    Streamed bodies are still being produced at this point, so their
+    header holds only the stages that ran before the first byte.
+    """
+    endpoint = request.endpoint or 'unknown'
+    metrics.RESPONSES.inc(endpoint, str(response.status_code))
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - g.start_time, endpoint)
+    timings = metrics.current_timings()
+    if timings:
+        response.headers['Server-Timing'] = metrics.server_timing(timings)
+    return response
+
+# Totals kept by other modules, read when /metrics is scraped
+metrics.gauge('cc_hedge_requests', 'CDX requests sent, hedged and won by the hedge', ('kind',),
+              lambda: {(kind,): count for kind, count in http_client.hedge_stats.items()})
+metrics.gauge('cc_single_flight_calls', 'Coalesced calls, shared results and calls in flight', ('kind',),
+              lambda: {(kind,): count for kind, count in single_flight.get_single_flight().get_stats().items()})
+
+def domain_filter_metrics():
+    filters = domain_filter.get_domain_filters()
+    return {(kind,): value for kind, value in filters.get_stats().items()} if filters is not None else {}
+
+metrics.gauge('cc_domain_filter', 'Domain filter checks, savings and false positives', ('kind',), domain_filter_metrics)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Stage timings and counters in the Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/prefetch-stats')
+def prefetch_stats():
+    """Hit/miss counters for the asset prefetch of one page render, or of the latest renders without ?id="""
+    prefetcher = asset_prefetch.get_prefetcher()
+    if not request.args.get('id'):
+        return jsonify([batch.stats() for batch in prefetcher.recent_batches()])
+    batch = prefetcher.get_batch(request.args['id'])
+    if batch is None:
+        return jsonify({'error': 'Unknown prefetch batch'}), 404
+    return jsonify(batch.stats())
+
+@app.route('/search-strategy-stats')
+def search_strategy_stats():
+    """Probe counts and latency per crawl search strategy"""
+    return jsonify({'strategy': search_strategy.get_strategy().name,
+                    'strategies': search_strategy.get_stats().get_stats()})
+
+@app.route('/domain-filter-stats')
+def domain_filter_stats():
+    """Probe savings and measured false-positive rate of the domain filters"""
+    filters = domain_filter.get_domain_filters()
+    if filters is None:
+        return jsonify({'error': 'Domain filters are disabled'}), 404
+    return jsonify(filters.get_stats())
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
     result = None
-    content = None
+    content_url = None
     url = None
     formatted_timestamp = None
     crawl_index = None
+    additional_info = None
+    partial = False
     
     if request.method == 'POST':
         url = request.form.get('url')
@@ -507,7 +861,16 @@ def index():
                 normalized_url = normalize_url(url)
                 logger.debug(f"Searching for normalized URL: {normalized_url}")
                 
-                result = search_common_crawl(normalized_url)
+                # A search token from /search-progress carries the result already found
+                redeemed = search_tokens.get_search_tokens().redeem(request.form.get('search_token'), normalized_url)
+                if redeemed is not search_tokens.MISSING:
+                    result, partial = redeemed
+                else:
+                    try:
+                        result = search_common_crawl(normalized_url)
+                    except deadline.DeadlineExceeded as e:
+                        logger.warning(f"Search for {normalized_url} ran out of time")
+                        result, partial = e.partial, True
                 if result:
                     logger.debug(f"Found result: {result}")
                     formatted_timestamp = format_timestamp(result['timestamp'])
@@ -515,7 +878,24 @@ def index():
                         parts = result['filename'].split('/')
                         if len(parts) > 2:
                             crawl_index = parts[1]
-                    content = fetch_common_crawl_content(result)
+                    additional_info = {
+                        'status_code': result.get('status', 'N/A'),
+                        'mime_type': result.get('mime', 'N/A'),
+                        'length': result.get('length', 'N/A'),
+                        'offset': result.get('offset', 'N/A'),
+                        'filename': result.get('filename', 'N/A'),
+                        'languages': result.get('languages', 'N/A'),
+                        'charset': result.get('charset', 'N/A'),
+                        'digest': result.get('digest', 'N/A')
+                    }
+                    # The archived page itself is streamed into the iframe by /page-content
+                    content_url = url_for('page_content',
+                                          filename=result['filename'],
+                                          offset=result['offset'],
+                                          length=result['length'],
+                                          url=result['url'],
+                                          timestamp=result['timestamp'],
+                                          digest=result.get('digest', ''))
                 else:
                     logger.warning("No results found in Common Crawl")
             except Exception as e:
@@ -523,157 +903,144 @@ def index():
     
     return render_template('index.html', 
                          result=result, 
-                         content=content, 
+                         content_url=content_url, 
                          url=url, 
                          formatted_timestamp=formatted_timestamp,
-                         crawl_index=crawl_index)
+                         crawl_index=crawl_index,
+                         additional_info=additional_info,
+                         partial=partial)
+
+@app.route('/api/search')
+def api_search():
+    """JSON search through the async engine, on its long-lived background loop"""
+    url = request.args.get('url')
+    if not url:
+        return jsonify({'error': 'No URL provided'}), 400
+    try:
+        result = async_search.run(async_search.search_common_crawl(normalize_url(url)))
+    except deadline.DeadlineExceeded as e:
+        # Not a miss: the budget ran out, so say so rather than answering 404
+        return jsonify({'url': url, 'result': e.partial, 'partial': True}), 200 if e.partial else 504
+    return jsonify({'url': url, 'result': result}), 200 if result else 404
+
+def parse_url_list(req):
+    """Read the URLs of a bulk request: a JSON array, or JSONL/plain lines (body or 'file' upload)"""
+    if req.is_json:
+        items = req.get_json(silent=True)
+        if not isinstance(items, list):
+            raise ValueError('Expected a JSON array of URLs')
+    else:
+        upload = req.files.get('file')
+        data = upload.read() if upload else req.get_data()
+        items = []
+        for line in data.decode('utf-8', errors='ignore').splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            items.append(json.loads(line) if line[0] in '{"' else line)
+
+    urls = []
+    for item in items:
+        url = item.get('url') if isinstance(item, dict) else item
+        if not isinstance(url, str) or not url.strip():
+            raise ValueError(f"Invalid URL entry: {item!r}")
+        urls.append(url.strip())
+    return urls
+
+@app.route('/bulk-lookup', methods=['POST'])
+def bulk_lookup():
+    """Look up many URLs at once, streaming one NDJSON line per URL as it resolves"""
+    try:
+        urls = parse_url_list(request)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not urls:
+        return jsonify({'error': 'No URLs provided'}), 400
+    if len(urls) > config.BULK_MAX_URLS:
+        return jsonify({'error': f"At most {config.BULK_MAX_URLS} URLs per request"}), 413
+
+    def generate():
+        for url, result, error, partial in bulk_search(urls):
+            line = {'url': url, 'result': {field: result.get(field) for field in RESULT_FIELDS} if result else None}
+            if error:
+                line['error'] = error
+            if partial:
+                line['partial'] = True
+            yield json.dumps(line) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/page-content')
+def page_content():
+    """Stream an archived page with its links rewritten to /asset"""
+    result = {key: request.args.get(key) for key in ('filename', 'offset', 'length', 'url')}
+    if not all(result.values()):
+        return "Missing record parameters", 400
+    result['digest'] = request.args.get('digest')
+    result['timestamp'] = request.args.get('timestamp')
+
+    chunks, content_type = fetch_common_crawl_content(result)
+    if chunks is None:
+        return "Archived content could not be retrieved", 502
+    return Response(stream_with_context(chunks), content_type=content_type)
 
 @app.route('/search-progress')
 def search_progress():
-    @stream_with_context
+    """Run a search, streaming its progress as server-sent events.
+
+    The final event carries a search token for the result, which the form
+    submission redeems so the page render does not search a second time.
+    """
+    url = request.args.get('url')
+
+    def event(data):
+        return f"data: {json.dumps(data)}\n\n"
+
     def generate():
-        url = request.args.get('url')
-        
         if not url:
-            status_data = {'status': 'Error: No URL provided', 'progress': 100, 'complete': True}
-            yield f"data: {json.dumps(status_data)}\n\n"
+            yield event({'status': 'Error: No URL provided', 'progress': 100, 'complete': True})
             return
-            
+
         normalized_url = normalize_url(url)
-        
-        try:
-            status_data = {'status': 'Fetching Common Crawl indexes...', 'progress': 10}
-            yield f"data: {json.dumps(status_data)}\n\n"
-            
-            indexes = get_available_indexes()
-            if not indexes:
-                status_data = {'status': 'No indexes available', 'progress': 100, 'complete': True}
-                yield f"data: {json.dumps(status_data)}\n\n"
-                return
-                
-            total_indexes = len(indexes)
-            status_data = {'status': f'Found {total_indexes} Common Crawl indexes...', 'progress': 20}
-            yield f"data: {json.dumps(status_data)}\n\n"
-            
-            # Extract domain from URL
-            domain_match = re.match(r'^https?://(www\.)?([^/]+)', normalized_url)
-            if domain_match:
-                base_domain = domain_match.group(2)
-            else:
-                base_domain = normalized_url.split('/')[0].strip()
-            
-            status_data = {'status': f'Binary searching for domain: {base_domain}...', 'progress': 30}
-            yield f"data: {json.dumps(status_data)}\n\n"
-            
-            # Binary search for domain
-            domain_variations = [base_domain, f"www.{base_domain}"]
-            found_index = None
-            
-            for domain in domain_variations:
-                left = 0
-                right = len(indexes) - 1
-                
-                while left <= right:
-                    mid = (left + right) // 2
-                    current_index = indexes[mid]
-                    
-                    progress = 30 + int(((total_indexes - (right - left)) / total_indexes) * 40)
-                    status_data = {
-                        'status': f'Checking domain in index {mid + 1} of {total_indexes}...',
-                        'progress': progress
-                    }
-                    yield f"data: {json.dumps(status_data)}\n\n"
-                    
-                    try:
-                        params = {
-                            'url': domain,
-                            'output': 'json',
-                            'matchType': 'domain'
-                        }
-                        
-                        response = requests.get(current_index, params=params, timeout=2)
-                        if response.status_code == 200 and response.text.strip():
-                            found_index = current_index
-                            right = mid - 1  # Keep searching newer indexes
-                            status_data = {
-                                'status': f'Found domain in index {mid + 1}, checking newer indexes...',
-                                'progress': progress + 5
-                            }
-                            yield f"data: {json.dumps(status_data)}\n\n"
-                        else:
-                            left = mid + 1
-                        
-                        time.sleep(0.1)
-                    except Exception as e:
-                        logger.warning(f"Error checking index {current_index}: {str(e)}")
-                        left = mid + 1
-                        continue
-                
-                if found_index:
-                    break
-            
-            if not found_index:
-                status_data = {
-                    'status': 'Domain not found in any index',
-                    'progress': 100,
-                    'complete': True
-                }
-                yield f"data: {json.dumps(status_data)}\n\n"
-                return
-            
-            # Search for exact URL in found index
-            status_data = {
-                'status': 'Found domain! Searching for exact URL...',
-                'progress': 80
-            }
-            yield f"data: {json.dumps(status_data)}\n\n"
-            
-            url_variations = [
-                normalized_url.replace('?ver=3.8.1', ''),
-                normalized_url.replace('http://', 'https://'),
-                normalized_url.replace('https://', 'http://'),
-                normalized_url.replace('://www.', '://'),
-                normalized_url.replace('://', '://www.')
-            ]
-            
-            for url_variant in url_variations:
-                try:
-                    params = {
-                        'url': url_variant,
-                        'output': 'json',
-                        'matchType': 'exact'
-                    }
-                    
-                    response = requests.get(found_index, params=params, timeout=2)
-                    if response.status_code == 200 and response.text.strip():
-                        results = [json.loads(line) for line in response.text.strip().split('\n')]
-                        if results:
-                            status_data = {
-                                'status': 'Found exact match! Loading content...',
-                                'progress': 100,
-                                'complete': True
-                            }
-                            yield f"data: {json.dumps(status_data)}\n\n"
-                            return
-                except Exception as e:
-                    logger.warning(f"Error checking URL variant: {str(e)}")
-                    continue
-            
-            status_data = {
-                'status': 'URL not found in index',
-                'progress': 100,
-                'complete': True
-            }
-            yield f"data: {json.dumps(status_data)}\n\n"
-            
-        except Exception as e:
-            logger.error(f"Error in search progress: {str(e)}")
-            status_data = {
-                'status': f'Error: {str(e)}',
-                'progress': 100,
-                'complete': True
-            }
-            yield f"data: {json.dumps(status_data)}\n\n"
+        updates = queue.Queue()
+        outcome = {}
+
+        def run():
+            # Stage timings so far ride along with every progress event
+            metrics.start_timings()
+            try:
+                outcome['result'] = search_common_crawl(
+                    normalized_url, progress=lambda status, percent: updates.put(
+                        {'status': status, 'progress': percent, 'timings': metrics.current_timings()}))
+            except deadline.DeadlineExceeded as e:
+                outcome['result'], outcome['partial'] = e.partial, True
+            except Exception as e:
+                logger.error(f"Error in search progress: {str(e)}")
+                outcome['error'] = str(e)
+            finally:
+                outcome['timings'] = metrics.current_timings()
+                updates.put(None)
+
+        # The search runs on its own thread so updates reach the browser as they happen
+        threading.Thread(target=run, daemon=True).start()
+        while True:
+            update = updates.get()
+            if update is None:
+                break
+            yield event(update)
+
+        if 'error' in outcome:
+            yield event({'status': f"Error: {outcome['error']}", 'progress': 100, 'complete': True,
+                         'timings': outcome['timings']})
+            return
+        result, partial = outcome['result'], outcome.get('partial', False)
+        token = search_tokens.get_search_tokens().issue(normalized_url, result, partial)
+        if partial:
+            status = 'Search ran out of time; showing what was found' if result else 'Search ran out of time'
+        else:
+            status = 'Found exact match! Loading content...' if result else 'URL not found in any index'
+        yield event({'status': status, 'progress': 100, 'complete': True, 'token': token, 'partial': partial,
+                     'timings': outcome['timings']})
 
     return Response(
         generate(),
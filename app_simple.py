@@ -1,39 +1,42 @@
-from flask import Flask, render_template, request, Response, stream_with_context
-import requests
+from flask import Flask, render_template, request, Response, stream_with_context, send_file
 import json
 from datetime import datetime
 import logging
 import re
 import mimetypes
-import gzip
-import io
-import email
-from functools import lru_cache
+
+import cdx
+import cdx_cache
+import conditional
+import config
+import crawl_registry
+import deadline
+import negative_cache
+import record_seek
+import record_store
+import search_strategy
+import warc_stream
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
-@lru_cache(maxsize=100)
+# Fetch the crawl list now rather than on the first search
+crawl_registry.warm()
+
 def get_available_indexes():
-    """Get list of available Common Crawl indexes"""
-    try:
-        response = requests.get(
-            "https://index.commoncrawl.org/collinfo.json",
-            timeout=10,
-            headers={'User-Agent': 'CommonCrawlSearch/1.0'}
-        )
-        if response.status_code == 200:
-            indexes = response.json()
-            return [index['cdx-api'] for index in sorted(indexes, key=lambda x: x['id'], reverse=True)]
-    except Exception as e:
-        logger.error(f"Error fetching indexes: {str(e)}")
-        return ["https://index.commoncrawl.org/CC-MAIN-2024-04-index"]
+    """Get list of available Common Crawl indexes, newest first"""
+    return crawl_registry.get_registry().indexes()
 
-@lru_cache(maxsize=100)
+@cdx_cache.cached_search('simple')
 def search_common_crawl(url):
-    """Search for URL in Common Crawl indexes using binary search"""
+    """Search for URL in Common Crawl indexes, newest crawl holding the domain first.
+
+    The search shares one config.SEARCH_DEADLINE budget; when it runs out,
+    DeadlineExceeded is raised with any capture found so far as `partial`.
+    """
+    search_deadline = deadline.Deadline(config.SEARCH_DEADLINE)
     indexes = get_available_indexes()
     if not indexes:
         return None
@@ -41,36 +44,38 @@ def search_common_crawl(url):
     domain = re.match(r'^https?://(www\.)?([^/]+)', url)
     domain = domain.group(2) if domain else url.split('/')[0].strip()
     
-    # Binary search for domain
+    # Search for the domain, skipping crawls already known not to hold it
+    negatives = negative_cache.get_negative_cache()
+    search_space = negatives.domain_search_space(domain, indexes)
+    probe_failed = False
     found_index = None
     for domain_variant in [domain, f"www.{domain}"]:
-        left = 0
-        right = len(indexes) - 1
-        
-        while left <= right:
-            mid = (left + right) // 2
-            current_index = indexes[mid]
-            
+        def probe(position):
+            nonlocal probe_failed
+            current_index = search_space[position]
             try:
-                response = requests.get(
-                    current_index,
-                    params={'url': domain_variant, 'output': 'json', 'matchType': 'domain'},
-                    timeout=5,
-                    headers={'User-Agent': 'CommonCrawlSearch/1.0'}
-                )
-                if response.status_code == 200 and response.text.strip():
-                    found_index = current_index
-                    right = mid - 1  # Keep searching newer indexes
-                else:
-                    left = mid + 1
+                return cdx.has_captures(current_index, domain_variant, 'domain', timeout=search_deadline.timeout(5),
+                                        latest=(position == 0), search_deadline=search_deadline)
+            except cdx.UNKNOWN_ERRORS:
+                raise  # Unknown, not a miss
             except Exception as e:
+                if search_deadline.expired():
+                    raise deadline.DeadlineExceeded()
                 logger.warning(f"Error checking index {current_index}: {str(e)}")
-                left = mid + 1
+                probe_failed = True
+                cdx_cache.probe_failed()
+                return False
+
+        position = search_strategy.find_first(len(search_space), probe)
+        if position is not None:
+            found_index = search_space[position]
         
         if found_index:
             break
 
     if not found_index:
+        if not probe_failed:
+            negatives.mark_domain_absent(domain, indexes)
         return None
 
     # Search for exact URL in found index and newer indexes
@@ -83,25 +88,30 @@ def search_common_crawl(url):
         url.replace('://', '://www.')
     ]
 
-    # Search through the found index and all newer indexes
-    for index in indexes[start_index::-1]:  # Go backwards through newer indexes
-        for url_variant in url_variations:
-            try:
-                response = requests.get(
-                    index,
-                    params={'url': url_variant, 'output': 'json', 'matchType': 'exact'},
-                    timeout=5,
-                    headers={'User-Agent': 'CommonCrawlSearch/1.0'}
-                )
-                if response.status_code == 200 and response.text.strip():
-                    results = [json.loads(line) for line in response.text.strip().split('\n')]
-                    if results:
-                        results.sort(key=lambda x: x['timestamp'], reverse=True)
-                        return results[0]
-            except Exception as e:
-                logger.warning(f"Error checking URL variant: {str(e)}")
+    failures = []
+
+    def check_variant(index, url_variant):
+        try:
+            return cdx.lookup_exact(index, url_variant, timeout=search_deadline.timeout(5),
+                                    latest=(index == indexes[0]), search_deadline=search_deadline)
+        except cdx.UNKNOWN_ERRORS:
+            raise
+        except Exception:
+            if search_deadline.expired():
+                raise deadline.DeadlineExceeded()
+            failures.append(index)
+            cdx_cache.probe_failed()
+            raise
 
-    return None
+    # Search through the found index and all newer indexes, going backwards
+    url_key = ('simple', url)
+    probes = [(index, url_variant)
+              for index in negatives.unchecked_indexes(url_key, indexes, start_index)
+              for url_variant in url_variations]
+    match = cdx.find_first_match(probes, check_variant, max_workers=config.SEARCH_CONCURRENCY)
+    if match is None and not failures:
+        negatives.mark_url_absent(url_key, indexes, start_index)
+    return match
 
 def normalize_url(url):
     """Normalize URL for searching"""
@@ -126,13 +136,18 @@ def index():
     if not url:
         return render_template('index.html')
 
-    result = search_common_crawl(normalize_url(url))
+    partial = False
+    try:
+        result = search_common_crawl(normalize_url(url))
+    except deadline.DeadlineExceeded as e:
+        result, partial = e.partial, True
     if not result:
-        return render_template('index.html', url=url)
+        return render_template('index.html', url=url, partial=partial)
 
     return render_template('index.html',
         result=result,
         url=url,
+        partial=partial,
         formatted_timestamp=format_timestamp(result['timestamp']),
         crawl_index=result['filename'].split('/')[1] if result.get('filename') else None,
         additional_info={
@@ -157,59 +172,99 @@ def search_progress():
             return
 
         normalized_url = normalize_url(url)
-        result = search_common_crawl(normalized_url)
+        partial = False
+        try:
+            result = search_common_crawl(normalized_url)
+        except deadline.DeadlineExceeded as e:
+            result, partial = e.partial, True
         
         if result:
             crawl_id = re.search(r'CC-MAIN-\d{4}-\d{2}', result['filename'])
             crawl_label = crawl_id.group(0) if crawl_id else 'Unknown Crawl'
-            yield f"data: {json.dumps({'status': f'Found exact match in {crawl_label}! Loading content...', 'progress': 100, 'complete': True})}\n\n"
+            status = f'Found exact match in {crawl_label}! Loading content...'
+            if partial:
+                status = 'Search ran out of time; showing what was found'
+            yield f"data: {json.dumps({'status': status, 'progress': 100, 'complete': True, 'partial': partial})}\n\n"
+        elif partial:
+            yield f"data: {json.dumps({'status': 'Search ran out of time', 'progress': 100, 'complete': True, 'partial': True})}\n\n"
         else:
             yield f"data: {json.dumps({'status': 'URL not found', 'progress': 100, 'complete': True})}\n\n"
 
     return Response(generate(), mimetype='text/event-stream')
 
+def download_name(url, mime_type):
+    """Attachment filename for a download: the URL's last path segment with an extension matching its type"""
+    ext = mimetypes.guess_extension(mime_type, strict=False) or '.txt'
+    filename = url.split('/')[-1].split('?')[0] or 'archived_file'
+    if not filename.endswith(ext):
+        filename = f"{filename.rsplit('.', 1)[0] if '.' in filename else filename}{ext}"
+    return filename
+
 @app.route('/download-file')
 def download_file():
     url = request.args.get('url')
-    result = search_common_crawl(normalize_url(url))
+    try:
+        result = search_common_crawl(normalize_url(url))
+    except deadline.DeadlineExceeded as e:
+        # Whatever was found in time beats failing the download
+        result = e.partial
     
     if not result or not all(result.get(k) for k in ['filename', 'offset', 'length']):
         return 'File not found', 404
 
+    # A repeat download the client still holds is answered from the (cached) search alone
+    if conditional.not_modified(request, result):
+        return conditional.not_modified_response(request, result)
+
     try:
-        response = requests.get(
-            f"https://data.commoncrawl.org/{result['filename']}",
-            headers={'Range': f"bytes={result['offset']}-{int(result['offset'])+int(result['length'])-1}"},
-            stream=True
-        )
-        
-        if response.status_code not in [200, 206]:
-            return 'File not found', 404
+        store = record_store.get_store()
+        stored = store.get(result.get('digest')) if store is not None else None
+        encoding = None
+        if stored is not None:
+            response, record = None, None
+            content_type = stored.content_type or ''
+        else:
+            # A seek into a large download inflates only from the nearest checkpoint of the record
+            partial = record_seek.range_response(request, result)
+            if partial is not None:
+                partial.headers['Content-Disposition'] = f'attachment;filename={download_name(url, partial.mimetype)}'
+                return partial
+            response, record = warc_stream.open_record(result['filename'], result['offset'], result['length'])
+            if record is None:
+                return 'File not found', 404
+            content_type = warc_stream.content_type(record, '')
+            encoding = warc_stream.content_encoding(record)
+            if encoding is not None and not conditional.accepts_encoding(request, encoding):
+                encoding = None
 
-        raw_data = gzip.GzipFile(fileobj=io.BytesIO(response.content)) if result['filename'].endswith('.gz') else io.BytesIO(response.content)
-        warc_data = raw_data.read()
-        parts = warc_data.split(b'\r\n\r\n', 2)
-        
-        if len(parts) < 3:
-            return 'Error processing file', 500
+        mime_type = content_type.split(';')[0].strip() or result.get('mime', 'application/octet-stream')
+        filename = download_name(url, mime_type)
 
-        http_response = email.message_from_string(parts[1].decode('utf-8', errors='ignore'))
-        content = parts[2]
-        
-        mime_type = http_response.get_content_type() or result.get('mime', 'application/octet-stream')
-        ext = mimetypes.guess_extension(mime_type, strict=False) or '.txt'
-        
-        filename = url.split('/')[-1].split('?')[0] or 'archived_file'
-        if not filename.endswith(ext):
-            filename = f"{filename.rsplit('.', 1)[0] if '.' in filename else filename}{ext}"
+        if stored is not None:
+            download = send_file(stored.path, mimetype=mime_type, as_attachment=True, download_name=filename,
+                                 conditional=False, etag=False)
+            download.headers.update(conditional.validator_headers(result, conditional.was_encoded(stored.headers)))
+            return conditional.make_ranged(download, request, stored.size)
 
+        headers = {'Content-Disposition': f'attachment;filename={filename}'}
+        decoded = encoding is None and bool(record.http_headers.get_header('Content-Encoding'))
+        if encoding is not None:
+            # Sent compressed as captured rather than decompressed here and recompressed on the way out
+            payload = warc_stream.iter_payload(response, record, raw=True)
+            headers['Content-Encoding'] = encoding
+        else:
+            # The payload is decompressed and sent chunk by chunk as the client reads it,
+            # and kept in the record store for the next download of the same content
+            payload = warc_stream.iter_payload(response, record)
+            if store is not None and result.get('digest'):
+                payload = store.tee(result['digest'], record, payload)
+        if encoding is not None or decoded:
+            headers['Vary'] = 'Accept-Encoding'
+        headers.update(conditional.validator_headers(result, decoded))
         return Response(
-            content,
+            stream_with_context(payload),
             mimetype=mime_type,
-            headers={
-                'Content-Disposition': f'attachment;filename={filename}',
-                'Content-Length': str(len(content))
-            }
+            headers=headers
         )
 
     except Exception as e:
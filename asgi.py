@@ -0,0 +1,51 @@
+"""ASGI entry point: `uvicorn asgi:application`
+
+/api/search is served natively on the event loop by the async search engine,
+so one process can hold many concurrent searches; every other route is
+passed through to the Flask app.
+"""
+import json
+import logging
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+
+import async_search
+import deadline
+from app import app as flask_app, normalize_url
+
+logger = logging.getLogger(__name__)
+
+flask_application = WsgiToAsgi(flask_app)
+
+async def send_json(send, status, payload):
+    body = json.dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+async def search_endpoint(scope, receive, send):
+    query = parse_qs(scope.get('query_string', b'').decode('utf-8'))
+    url = query.get('url', [''])[0]
+    if not url:
+        await send_json(send, 400, {'error': 'No URL provided'})
+        return
+    try:
+        result = await async_search.search_common_crawl(normalize_url(url))
+    except deadline.DeadlineExceeded as e:
+        await send_json(send, 200 if e.partial else 504, {'url': url, 'result': e.partial, 'partial': True})
+        return
+    except Exception as e:
+        logger.error(f"Error in async search for {url}: {str(e)}", exc_info=True)
+        await send_json(send, 500, {'error': str(e)})
+        return
+    await send_json(send, 200 if result else 404, {'url': url, 'result': result})
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] == '/api/search':
+        await search_endpoint(scope, receive, send)
+    else:
+        await flask_application(scope, receive, send)
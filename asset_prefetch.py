@@ -0,0 +1,184 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+class PrefetchBatch:
+    """Counters for the assets prefetched on behalf of one page render"""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex[:12]
+        self.created = time.time()
+        self.queued = 0
+        self.resolved = 0
+        self.not_found = 0
+        self.errors = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def count(self, field):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'id': self.id,
+                'queued': self.queued,
+                'resolved': self.resolved,
+                'not_found': self.not_found,
+                'errors': self.errors,
+                'pending': self.queued - self.resolved - self.not_found - self.errors,
+                'hits': self.hits,
+                'misses': self.misses,
+                'age': round(time.time() - self.created, 3)
+            }
+
+class AssetPrefetcher:
+    """Resolves a page's assets ahead of the browser asking for them.
+
+    Keys are tuples whose first item is the cleaned asset URL; resolve is
+    called as resolve(*key). Assets found are kept in a byte-bounded LRU;
+    misses are not, nor is anything when resolve raises (a failed lookup
+    or fetch), so a later request looks again. A request for an asset that is still being prefetched
+    waits for that fetch instead of starting its own.
+
+    Asset URLs carry nothing render-specific, so browsers can cache them;
+    the first request for a key after a render counts as that render's
+    hit or miss.
+    """
+
+    def __init__(self, cache_bytes, workers, max_batches=256, max_claims=65536):
+        self.cache_bytes = cache_bytes
+        self.max_batches = max_batches
+        self.max_claims = max_claims
+        self._cache = OrderedDict()
+        self._cache_size = 0
+        self._inflight = {}
+        self._batches = OrderedDict()
+        # Key -> batch of the latest render that referenced it, until first requested
+        self._claims = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='asset-prefetch')
+
+    def new_batch(self):
+        batch = PrefetchBatch()
+        with self._lock:
+            self._batches[batch.id] = batch
+            while len(self._batches) > self.max_batches:
+                self._batches.popitem(last=False)
+        return batch
+
+    def get_batch(self, batch_id):
+        with self._lock:
+            return self._batches.get(batch_id)
+
+    def recent_batches(self, limit=20):
+        """The latest `limit` batches, newest first"""
+        with self._lock:
+            return list(reversed(self._batches.values()))[:limit]
+
+    def _store(self, key, value):
+        if value[0] is None:
+            return
+        # Payloads kept in the record store cost only their metadata here
+        size = len(key[0]) + (len(value[0]) if isinstance(value[0], bytes) else 0)
+        if size > self.cache_bytes:
+            return
+        with self._lock:
+            previous = self._cache.pop(key, None)
+            if previous is not None:
+                self._cache_size -= previous[1]
+            self._cache[key] = (value, size)
+            self._cache_size += size
+            while self._cache_size > self.cache_bytes:
+                _, (_, evicted_size) = self._cache.popitem(last=False)
+                self._cache_size -= evicted_size
+
+    def _run(self, key, resolve, batch):
+        try:
+            value = resolve(*key)
+            self._store(key, value)
+        except Exception as e:
+            logger.warning(f"Prefetch failed for {key[0]}: {str(e)}")
+            batch.count('errors')
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        batch.count('resolved' if value[0] is not None else 'not_found')
+        return value
+
+    def submit(self, batch, keys, resolve):
+        """Queue resolve(*key) for each key not already cached or in flight"""
+        with self._lock:
+            for key in keys:
+                self._claims[key] = batch
+                self._claims.move_to_end(key)
+            while len(self._claims) > self.max_claims:
+                self._claims.popitem(last=False)
+            todo = [key for key in keys if key not in self._cache and key not in self._inflight]
+            for key in todo:
+                self._inflight[key] = metrics.submit(self._executor, self._run, key, resolve, batch)
+        for _ in todo:
+            batch.count('queued')
+        logger.info(f"Prefetch batch {batch.id}: queued {len(todo)} of {len(keys)} assets")
+
+    def peek(self, key):
+        """Return the cached result for key, or None; never resolves or waits"""
+        with self._lock:
+            entry = self._cache.get(key)
+            return entry[0] if entry is not None else None
+
+    def discard(self, key):
+        """Drop the cached result for key, e.g. once what it points to has gone"""
+        with self._lock:
+            entry = self._cache.pop(key, None)
+            if entry is not None:
+                self._cache_size -= entry[1]
+
+    def get(self, key, resolve):
+        """Return resolve(*key), served from the prefetch cache when possible"""
+        with self._lock:
+            batch = self._claims.pop(key, None)
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+            future = self._inflight.get(key)
+
+        if entry is None and future is not None:
+            try:
+                entry = (future.result(timeout=config.PREFETCH_WAIT_TIMEOUT), 0)
+            except Exception:
+                entry = None
+
+        if entry is not None:
+            if batch:
+                batch.count('hits')
+            return entry[0]
+
+        if batch:
+            batch.count('misses')
+        value = resolve(*key)
+        self._store(key, value)
+        return value
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+def get_prefetcher():
+    """Return the process-wide asset prefetcher"""
+    global _prefetcher
+    if _prefetcher is None:
+        with _prefetcher_lock:
+            if _prefetcher is None:
+                _prefetcher = AssetPrefetcher(config.ASSET_CACHE_BYTES, config.PREFETCH_WORKERS)
+    return _prefetcher
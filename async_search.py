@@ -0,0 +1,343 @@
+import asyncio
+import atexit
+import io
+import json
+import logging
+import os
+import re
+import threading
+from urllib.parse import urlsplit
+
+import aiohttp
+from warcio.archiveiterator import ArchiveIterator
+
+import cdx
+import cdx_cache
+import config
+import crawl_registry
+import deadline
+import http_client
+import domain_filter
+import negative_cache
+import rate_limit
+import search_strategy
+import single_flight
+import warc_stream
+import zipnum
+
+logger = logging.getLogger(__name__)
+
+class AsyncCommonCrawlClient:
+    """aiohttp client for the CDX API and data.commoncrawl.org.
+
+    aiohttp sessions belong to one event loop, so a session (with its own
+    bounded connection pool) is kept per running loop: the ASGI server's,
+    and the background loop the Flask app submits searches to (see run()).
+    Requests draw from the same per-host rate limiter as the threaded code,
+    waiting with asyncio.sleep so throttled searches yield the loop to
+    others. Limiter, cache and domain filter calls may block on SQLite or
+    disk, so they run in worker threads.
+    """
+
+    def __init__(self, pool_size, pool_size_per_host):
+        self.pool_size = pool_size
+        self.pool_size_per_host = pool_size_per_host
+        self._sessions = {}
+
+    def _session(self):
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            # Drop sessions whose loops are gone
+            for old_loop in [l for l in self._sessions if l.is_closed()]:
+                del self._sessions[old_loop]
+            connector = aiohttp.TCPConnector(limit=self.pool_size, limit_per_host=self.pool_size_per_host)
+            session = aiohttp.ClientSession(
+                connector=connector,
+                headers={'User-Agent': config.USER_AGENT},
+                timeout=aiohttp.ClientTimeout(total=config.HTTP_TIMEOUT)
+            )
+            self._sessions[loop] = session
+        return session
+
+    async def close(self):
+        """Close the session belonging to the running loop"""
+        session = self._sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+    async def get(self, url, params=None, headers=None, timeout=None):
+        """GET url and return (status, body bytes); retries and raises like http_client.get"""
+        session = self._session()
+        host = urlsplit(url).hostname
+        limiter = rate_limit.get_limiter()
+        kwargs = {'timeout': aiohttp.ClientTimeout(total=timeout)} if timeout else {}
+        for attempt in range(config.RATE_LIMIT_RETRIES + 1):
+            await asyncio.sleep(await asyncio.to_thread(limiter.reserve, host))
+            try:
+                async with session.get(url, params=params, headers=headers, **kwargs) as response:
+                    if response.status not in http_client.THROTTLE_STATUSES:
+                        body = await response.read()
+                        if response.status >= 500:
+                            await asyncio.to_thread(limiter.failed, host)
+                        else:
+                            await asyncio.to_thread(limiter.succeeded, host)
+                        return response.status, body
+                    status, retry_after = response.status, response.headers.get('Retry-After')
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                await asyncio.to_thread(limiter.failed, host)
+                raise
+            delay = await asyncio.to_thread(limiter.throttled, host, retry_after)
+            logger.warning(f"{host} answered {status}, retry {attempt + 1} in {delay:.1f}s")
+        raise http_client.Throttled(f"{host} is still throttling after {config.RATE_LIMIT_RETRIES} retries")
+
+    async def query_cdx(self, index, url, match_type='exact', timeout=2, latest=False, limit=None):
+        """Async counterpart of cdx.query_cdx, sharing its caches and local indexes"""
+        local = zipnum.get_local_index(index)
+        if local is not None:
+            return await asyncio.to_thread(local.query, url, match_type, limit)
+
+        cache = cdx_cache.get_cache()
+        key = cdx_cache.cdx_key(index, url, match_type if limit is None else f"{match_type}:{limit}")
+        if cache is not None:
+            records = await asyncio.to_thread(cache.get, key)
+            if records is not cdx_cache.MISSING:
+                return records
+
+        async def fetch():
+            params = {'url': url, 'output': 'json', 'matchType': match_type}
+            if limit is not None:
+                params['limit'] = str(limit)
+            status, body = await self.get(index, params=params, timeout=timeout)
+            text = body.decode('utf-8', errors='ignore').strip()
+            records = [json.loads(line) for line in text.split('\n')] if status == 200 and text else []
+
+            if cache is not None and status in (200, 404):
+                await asyncio.to_thread(cache.set, key, records, cdx_cache.crawl_ttl(latest))
+            return records
+        return await single_flight.get_async_single_flight().do(('cdx', key), fetch)
+
+    async def has_captures(self, index, url, match_type='domain', timeout=2, latest=False):
+        filters = domain_filter.get_domain_filters() if match_type == 'domain' else None
+        if filters is not None:
+            known = await asyncio.to_thread(filters.check, index, url)
+            if known is not None:
+                return known
+        present = bool(await self.query_cdx(index, url, match_type, timeout=timeout, latest=latest, limit=1))
+        if filters is not None:
+            await asyncio.to_thread(filters.record, index, url, present)
+        return present
+
+    async def lookup_exact(self, index, url, timeout=2, latest=False):
+        return cdx.newest_record(await self.query_cdx(index, url, 'exact', timeout=timeout, latest=latest))
+
+    async def fetch_record(self, filename, offset, length):
+        """Range-fetch a WARC record; returns (payload, content_type) or (None, None).
+
+        Concurrent fetches of the same record share one request.
+        """
+        key = ('record', filename, offset, length)
+        return await single_flight.get_async_single_flight().do(key, lambda: self._fetch_record(filename, offset, length))
+
+    async def _fetch_record(self, filename, offset, length):
+        status, body = await self.get(
+            f"{warc_stream.DATA_URL}/{filename}",
+            headers={'Range': warc_stream.record_range(offset, length)}
+        )
+        if status != 206:
+            logger.error(f"Failed to fetch WARC record from {filename}. Status: {status}")
+            return None, None
+        # Decompression and parsing are CPU work, kept off the event loop
+        return await asyncio.to_thread(parse_record, body)
+
+def parse_record(data):
+    """Return (payload, content_type) of the first response record in data"""
+    for record in ArchiveIterator(io.BytesIO(data)):
+        if record.rec_type == 'response' and record.http_headers is not None:
+            return record.content_stream().read(), record.http_headers.get_header('Content-Type', '')
+    return None, None
+
+async def first_match(probes, lookup, max_concurrency):
+    """Async counterpart of cdx.find_first_match.
+
+    Probes run concurrently (at most max_concurrency at once) but results
+    are consumed in probe order, so the first hit returned is the one the
+    serial loop would find; the remaining probes are then cancelled.
+    Returns (result, failed) where failed tells whether any probe errored.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    failed = False
+
+    async def run(probe):
+        async with semaphore:
+            return await lookup(*probe)
+
+    tasks = [asyncio.ensure_future(run(probe)) for probe in probes]
+    try:
+        for probe, task in zip(probes, tasks):
+            try:
+                result = await task
+            except http_client.Throttled:
+                raise  # Unknown, not a miss: the search must not go past this probe
+            except Exception as e:
+                logger.warning(f"Error probing {probe}: {str(e)}")
+                failed = True
+                continue
+            if result is not None:
+                return result, failed
+        return None, failed
+    finally:
+        for task in tasks:
+            task.cancel()
+
+_client = None
+
+def get_client():
+    """Return the process-wide async client"""
+    global _client
+    if _client is None:
+        _client = AsyncCommonCrawlClient(config.ASYNC_POOL_SIZE, config.HTTP_POOL_SIZE)
+    return _client
+
+_loop = None
+_loop_pid = None
+_loop_lock = threading.Lock()
+
+def _background_loop():
+    global _loop, _loop_pid
+    # A forked worker inherits the loop object but not the thread running it
+    if _loop_pid != os.getpid():
+        with _loop_lock:
+            if _loop_pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='async-search', daemon=True).start()
+                _loop, _loop_pid = loop, os.getpid()
+    return _loop
+
+@atexit.register
+def _close_background_loop():
+    """Close the background loop's session on exit, so its connections are shut down cleanly"""
+    if _loop_pid == os.getpid() and _client is not None:
+        try:
+            asyncio.run_coroutine_threadsafe(_client.close(), _loop).result(timeout=5)
+        except Exception as e:
+            logger.debug(f"Could not close the async session: {str(e)}")
+
+def run(coro):
+    """Run a coroutine on the process-wide background loop and return its result.
+
+    For threaded (WSGI) callers: every call shares the loop, and so the
+    client's pooled session, instead of opening a session per request.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop()).result()
+
+async def binary_search_domain(domain, indexes):
+    """Async search for the newest index holding domain; returns (index, failed)"""
+    client = get_client()
+    failed = False
+
+    async def probe(position):
+        nonlocal failed
+        try:
+            return await client.has_captures(indexes[position], domain, 'domain', timeout=2, latest=(position == 0))
+        except http_client.Throttled:
+            raise  # Unknown, not a miss
+        except Exception as e:
+            logger.warning(f"Error checking domain in index {indexes[position]}: {str(e)}")
+            failed = True
+            return False
+
+    position = await search_strategy.find_first_async(len(indexes), probe)
+    return (indexes[position] if position is not None else None), failed
+
+async def search_common_crawl(url):
+    """Async version of app.search_common_crawl; same algorithm, caches and results"""
+    cache = cdx_cache.get_cache()
+    cache_key = cdx_cache.search_key('app', url)
+    if cache is not None:
+        result = await asyncio.to_thread(cache.get, cache_key)
+        if result is not cdx_cache.MISSING:
+            return result
+
+    async def search():
+        try:
+            with cdx_cache.search_outcome() as outcome:
+                result = await asyncio.wait_for(_search(url), config.SEARCH_DEADLINE or None)
+        except asyncio.TimeoutError:
+            # Not cached and not a miss: the budget ran out before the answer was known
+            raise deadline.DeadlineExceeded()
+        if cache is not None:
+            await asyncio.to_thread(cdx_cache.cache_search_result, cache, cache_key, result, outcome)
+        return result
+    # Concurrent searches for the same URL share one run
+    return await single_flight.get_async_single_flight().do(cache_key, search)
+
+async def _search(url):
+    client = get_client()
+    registry = await asyncio.to_thread(crawl_registry.get_registry)
+    indexes = registry.indexes()
+    if not indexes:
+        logger.error("No Common Crawl indexes available")
+        return None
+
+    domain_match = re.match(r'^https?://(www\.)?([^/]+)', url)
+    base_domain = domain_match.group(2) if domain_match else url.split('/')[0].strip()
+
+    # Step 1: search for the domain, skipping crawls known not to hold it
+    negatives = negative_cache.get_negative_cache()
+    search_space = negatives.domain_search_space(base_domain, indexes)
+    probe_failed = False
+    found_index = None
+    for domain in (base_domain, f"www.{base_domain}"):
+        found_index, failed = await binary_search_domain(domain, search_space)
+        if failed:
+            probe_failed = True
+            cdx_cache.probe_failed()
+        if found_index:
+            logger.info(f"Found domain '{domain}' in index: {found_index}")
+            break
+
+    if not found_index:
+        logger.warning(f"Domain not found in any index: {base_domain}")
+        if not probe_failed:
+            negatives.mark_domain_absent(base_domain, indexes)
+        return None
+
+    # Step 2: the exact URL in the found index and newer ones, probed concurrently
+    start_index = indexes.index(found_index)
+    url_variations = [
+        url.replace('?ver=3.8.1', ''),
+        url.replace('http://', 'https://'),
+        url.replace('https://', 'http://'),
+        url.replace('://www.', '://'),
+        url.replace('://', '://www.')
+    ]
+
+    async def check_variant(index, url_variant):
+        return await client.lookup_exact(index, url_variant, timeout=2, latest=(index == indexes[0]))
+
+    url_key = ('app', url)
+    probes = [(index, url_variant)
+              for index in negatives.unchecked_indexes(url_key, indexes, start_index)
+              for url_variant in url_variations]
+    match, failed = await first_match(probes, check_variant, config.SEARCH_CONCURRENCY)
+    if failed:
+        cdx_cache.probe_failed()
+    if match:
+        return match
+
+    logger.warning(f"No exact URL match found after searching from index {found_index}")
+    if not failed:
+        negatives.mark_url_absent(url_key, indexes, start_index)
+    return None
+
+async def fetch_common_crawl_content(result):
+    """Async fetch of a search result's payload; returns (payload, content_type)"""
+    return await get_client().fetch_record(result['filename'], result['offset'], result['length'])
+
+async def fetch_asset_from_common_crawl(url):
+    """Async search plus range fetch for an asset; returns (payload, content_type)"""
+    result = await search_common_crawl(url)
+    if not result:
+        return None, None
+    return await get_client().fetch_record(result['filename'], result['offset'], result['length'])
@@ -0,0 +1,395 @@
+"""Stand-in Common Crawl servers for benchmarks.
+
+build_corpus() writes a synthetic set of crawls: WARC files holding pages,
+their assets and downloadable files, plus one ZipNum CDX index per crawl.
+FakeCommonCrawl serves it over HTTP the way Common Crawl does: collinfo.json
+and the CDX API on one server, Range requests for WARC files on another,
+each with a configurable latency profile.
+
+    python bench/fake_commoncrawl.py --corpus /tmp/cc-corpus --cdx-profile commoncrawl
+
+then point an app at it with CC_COLLINFO_URL and CC_DATA_URL.
+"""
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import zipnum
+
+CORPUS_VERSION = 1
+
+class LatencyProfile:
+    """Delay (and optional throttling) applied to every request a fake server answers.
+
+    base and jitter are in milliseconds; a `slow_rate` share of requests
+    takes `slow` ms instead, and a `throttle_rate` share is answered 429.
+    """
+
+    def __init__(self, base=0.0, jitter=0.0, slow_rate=0.0, slow=0.0, throttle_rate=0.0, seed=None):
+        self.base = base
+        self.jitter = jitter
+        self.slow_rate = slow_rate
+        self.slow = slow
+        self.throttle_rate = throttle_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, spec, seed=None):
+        """Parse a named profile or a spec such as base=40,jitter=20,slow=0.02:800,throttle=0.01"""
+        if spec in PROFILES:
+            return cls(**PROFILES[spec], seed=seed)
+        values = {}
+        for item in filter(None, spec.split(',')):
+            name, _, value = item.partition('=')
+            if name == 'slow':
+                rate, _, delay = value.partition(':')
+                values['slow_rate'], values['slow'] = float(rate), float(delay)
+            elif name == 'throttle':
+                values['throttle_rate'] = float(value)
+            elif name in ('base', 'jitter'):
+                values[name] = float(value)
+            else:
+                raise ValueError(f"Unknown latency setting: {name}")
+        return cls(**values, seed=seed)
+
+    def sample(self):
+        """Return (delay in seconds, throttled) for one request"""
+        with self._lock:
+            if self.throttle_rate and self._random.random() < self.throttle_rate:
+                return self.base / 1000, True
+            if self.slow_rate and self._random.random() < self.slow_rate:
+                return self.slow / 1000, False
+            return max(0.0, self.base + self._random.uniform(-self.jitter, self.jitter)) / 1000, False
+
+    def describe(self):
+        return {'base': self.base, 'jitter': self.jitter, 'slow_rate': self.slow_rate,
+                'slow': self.slow, 'throttle_rate': self.throttle_rate}
+
+# Named latency profiles (milliseconds)
+PROFILES = {
+    'none': {},
+    'lan': {'base': 2, 'jitter': 1},
+    'commoncrawl': {'base': 150, 'jitter': 100, 'slow_rate': 0.02, 'slow': 2000},
+    'commoncrawl-data': {'base': 60, 'jitter': 40, 'slow_rate': 0.01, 'slow': 1000},
+    'throttled': {'base': 150, 'jitter': 100, 'throttle_rate': 0.05},
+}
+
+def crawl_ids(count):
+    """Crawl ids newest first, four weeks apart"""
+    ids = []
+    for i in range(count):
+        year, week = 2024 - i // 12, 50 - 4 * (i % 12)
+        ids.append(f"CC-MAIN-{year}-{week:02d}")
+    return ids
+
+def payload_digest(body):
+    return 'sha1:' + base64.b32encode(hashlib.sha1(body).digest()).decode('ascii')
+
+def warc_record(url, timestamp, content_type, body):
+    """One gzip member holding a WARC response record, as Common Crawl stores them"""
+    http = (f"HTTP/1.1 200 OK\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n").encode('ascii') + body
+    date = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.strptime(timestamp, '%Y%m%d%H%M%S'))
+    headers = (f"WARC/1.0\r\nWARC-Type: response\r\nWARC-Record-ID: <urn:uuid:{uuid.uuid4()}>\r\n"
+               f"WARC-Target-URI: {url}\r\nWARC-Date: {date}\r\n"
+               f"WARC-Payload-Digest: {payload_digest(body)}\r\n"
+               f"Content-Type: application/http; msgtype=response\r\nContent-Length: {len(http)}\r\n\r\n")
+    return gzip.compress(headers.encode('utf-8') + http + b'\r\n\r\n')
+
+def _page(rng, domain, assets, links, size):
+    head = ''.join(f'<link rel="stylesheet" href="/{path}">' if path.endswith('.css')
+                   else f'<script src="/{path}"></script>' if path.endswith('.js')
+                   else f'<img src="https://{domain}/{path}">'
+                   for path in assets)
+    body = ''.join(f'<a href="/{link}">{link}</a> ' for link in links)
+    filler = ' '.join(rng.choice(('lorem', 'ipsum', 'dolor', 'sit', 'amet', 'archive')) for _ in range(size // 6))
+    return f'<html><head>{head}</head><body>{body}<p>{filler}</p></body></html>'.encode('utf-8')
+
+def _asset(rng, path, images, size):
+    if path.endswith('.css'):
+        rules = ''.join(f'.b{i}{{background:url("/{image}")}}' for i, image in enumerate(images))
+        return 'text/css', (rules + ' ' * size).encode('utf-8')[:max(size, len(rules))]
+    if path.endswith('.js'):
+        return 'application/javascript', (f'var data="{"x" * size}";').encode('utf-8')
+    return 'image/jpeg', rng.randbytes(size)
+
+def build_corpus(directory, crawls=8, domains=40, pages=10, assets=4, missing=10,
+                 page_kb=16, asset_kb=8, download_kb=1024, warc_files=2, seed=0):
+    """Write a synthetic crawl corpus and return its manifest.
+
+    Every domain appears in the crawls from some position back to the oldest
+    (so crawl searches see the layout they assume), with its pages, assets
+    and one PDF captured once per crawl. `missing` extra domains appear in
+    no crawl. The corpus is reused when directory already holds one built
+    with the same settings.
+    """
+    settings = dict(crawls=crawls, domains=domains, pages=pages, assets=assets, missing=missing,
+                    page_kb=page_kb, asset_kb=asset_kb, download_kb=download_kb,
+                    warc_files=warc_files, seed=seed, version=CORPUS_VERSION)
+    manifest_path = os.path.join(directory, 'corpus.json')
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get('settings') == settings:
+            return manifest
+
+    rng = random.Random(seed)
+    ids = crawl_ids(crawls)
+    manifest = {'settings': settings, 'crawls': ids, 'pages': [], 'downloads': [], 'missing': []}
+    site_names = [f"site{n:04d}.test" for n in range(domains + missing)]
+    sites = site_names[:domains]
+    manifest['missing'] = [f"https://{domain}/page-{n}" for domain in site_names[domains:] for n in range(2)]
+    # Position of the newest crawl holding each domain, skewed towards recent crawls
+    newest = {domain: min(int(rng.expovariate(1.0) * crawls / 3), crawls - 1) for domain in sites}
+
+    for position, crawl in enumerate(ids):
+        crawl_dir = os.path.join('crawl-data', crawl, 'segments', '1700000000000.00', 'warc')
+        os.makedirs(os.path.join(directory, 'data', crawl_dir), exist_ok=True)
+        names = [os.path.join(crawl_dir, f"{crawl}-{n:05d}.warc.gz") for n in range(warc_files)]
+        handles = [open(os.path.join(directory, 'data', name), 'wb') for name in names]
+        records = []
+        year, week = int(crawl.split('-')[2]), int(crawl.split('-')[3])
+        try:
+            for number, domain in enumerate(sites):
+                if position < newest[domain]:
+                    continue
+                timestamp = f"{year}{1 + (week - 1) * 12 // 53:02d}{1 + number % 28:02d}120000"
+                images = [f"img/photo-{n}.jpg" for n in range(assets)]
+                static = ['static/site.css', 'static/app.js']
+                captures = []
+                for n in range(pages):
+                    path = '' if n == 0 else f"page-{n}"
+                    links = [f"page-{m}" for m in range(1, pages) if m != n][:5]
+                    captures.append((f"https://{domain}/{path}", 'text/html',
+                                     _page(rng, domain, static + images, links, page_kb * 1024)))
+                for path in static + images:
+                    captures.append((f"https://{domain}/{path}",) + _asset(rng, path, images, asset_kb * 1024))
+                captures.append((f"https://{domain}/files/report.pdf", 'application/pdf', rng.randbytes(download_kb * 1024)))
+
+                for url, content_type, body in captures:
+                    n = rng.randrange(warc_files)
+                    data = warc_record(url, timestamp, content_type, body)
+                    offset = handles[n].tell()
+                    handles[n].write(data)
+                    records.append({'url': url, 'timestamp': timestamp, 'mime': content_type.split(';')[0],
+                                    'status': '200', 'digest': payload_digest(body).split(':', 1)[1],
+                                    'length': str(len(data)), 'offset': str(offset), 'filename': names[n]})
+        finally:
+            for handle in handles:
+                handle.close()
+        zipnum.write_zipnum(os.path.join(directory, 'cdx', crawl), records, lines_per_block=500)
+
+        # The newest capture of each URL is what a search should find
+        for record in records:
+            if position == newest[record['url'].split('/')[2]]:
+                if record['mime'] == 'text/html':
+                    manifest['pages'].append(record)
+                elif record['mime'] == 'application/pdf':
+                    manifest['downloads'].append(record['url'])
+
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f)
+    return manifest
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeCommonCrawl/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type='application/json', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.fake.count('bytes_sent', len(body))
+
+    def do_GET(self):
+        delay, throttled = self.server.profile.sample()
+        if delay:
+            time.sleep(delay)
+        if throttled:
+            self.server.fake.count('throttled')
+            self._send(429, b'Slow down', 'text/plain', {'Retry-After': '1'})
+            return
+        self.handle_get(urlsplit(self.path))
+
+class _IndexHandler(_Handler):
+    """collinfo.json and the CDX API"""
+
+    def handle_get(self, parts):
+        fake = self.server.fake
+        if parts.path == '/collinfo.json':
+            fake.count('collinfo')
+            self._send(200, json.dumps(fake.collinfo()).encode('utf-8'))
+            return
+        match = re.match(r'^/(CC-MAIN-[\d-]+?)-index$', parts.path)
+        index = fake.index(match.group(1)) if match else None
+        if index is None:
+            self._send(404, b'{"message": "No such index"}')
+            return
+
+        params = {name: values[-1] for name, values in parse_qs(parts.query).items()}
+        url = params.get('url', '')
+        match_type = params.get('matchType', 'exact')
+        limit = int(params['limit']) if params.get('limit', '').isdigit() else None
+        try:
+            records = index.query(url, match_type, limit=limit)
+        except ValueError as e:
+            self._send(400, json.dumps({'message': str(e)}).encode('utf-8'))
+            return
+        if params.get('showNumPages') == 'true':
+            fake.count('cdx_pages')
+            # Everything fits in one page here
+            self._send(200, json.dumps({'pages': 1 if records else 0, 'pageSize': 5, 'blocks': 1}).encode('utf-8'))
+            return
+        fake.count('cdx')
+        if not records or params.get('page', '0') != '0':
+            self._send(404, json.dumps({'message': f"No Captures found for: {url}"}).encode('utf-8'))
+            return
+        body = ''.join(json.dumps(record) + '\n' for record in records).encode('utf-8')
+        self._send(200, body, 'text/x-ndjson')
+
+class _DataHandler(_Handler):
+    """WARC files, with Range support"""
+
+    def handle_get(self, parts):
+        fake = self.server.fake
+        root = os.path.join(fake.directory, 'data')
+        path = os.path.normpath(os.path.join(root, parts.path.lstrip('/')))
+        if not path.startswith(root + os.sep) or not os.path.isfile(path):
+            self._send(404, b'Not found', 'text/plain')
+            return
+        fake.count('warc')
+        size = os.path.getsize(path)
+        match = re.match(r'^bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+        start, end = 0, size - 1
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            if start > end:
+                self._send(416, b'', 'text/plain', {'Content-Range': f"bytes */{size}"})
+                return
+        with open(path, 'rb') as f:
+            f.seek(start)
+            body = f.read(end - start + 1)
+        if match:
+            self._send(206, body, 'application/octet-stream', {'Content-Range': f"bytes {start}-{end}/{size}"})
+        else:
+            self._send(200, body, 'application/octet-stream')
+
+class FakeCommonCrawl:
+    """The index and data servers for one corpus, run on background threads.
+
+    Request counts per kind (collinfo, cdx, cdx_pages, warc, throttled) and
+    bytes sent are kept in `stats`.
+    """
+
+    def __init__(self, directory, cdx_profile=None, data_profile=None, host='127.0.0.1'):
+        self.directory = os.path.abspath(directory)
+        self.host = host
+        self.cdx_profile = cdx_profile or LatencyProfile()
+        self.data_profile = data_profile or LatencyProfile()
+        with open(os.path.join(self.directory, 'corpus.json')) as f:
+            self.manifest = json.load(f)
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._indexes = {}
+        self._servers = []
+
+    def count(self, kind, amount=1):
+        with self._lock:
+            self.stats[kind] = self.stats.get(kind, 0) + amount
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats)
+
+    def index(self, crawl):
+        with self._lock:
+            if crawl not in self._indexes:
+                directory = os.path.join(self.directory, 'cdx', crawl)
+                self._indexes[crawl] = zipnum.ZipNumIndex(directory) if os.path.isdir(directory) else None
+            return self._indexes[crawl]
+
+    def collinfo(self):
+        return [{'id': crawl, 'name': f"{crawl} Index", 'cdx-api': f"{self.index_url}/{crawl}-index"}
+                for crawl in self.manifest['crawls']]
+
+    def _serve(self, handler, profile, port):
+        server = ThreadingHTTPServer((self.host, port), handler)
+        server.daemon_threads = True
+        server.fake = self
+        server.profile = profile
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self._servers.append(server)
+        return f"http://{self.host}:{server.server_address[1]}"
+
+    def start(self, index_port=0, data_port=0):
+        self.index_url = self._serve(_IndexHandler, self.cdx_profile, index_port)
+        self.data_url = self._serve(_DataHandler, self.data_profile, data_port)
+        return self
+
+    def stop(self):
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+        self._servers = []
+
+def add_corpus_arguments(parser):
+    parser.add_argument('--corpus', default=os.path.join('.cc_cache', 'bench_corpus'), help='Corpus directory (built if missing)')
+    parser.add_argument('--crawls', type=int, default=8)
+    parser.add_argument('--domains', type=int, default=40)
+    parser.add_argument('--pages', type=int, default=10, help='Pages per domain')
+    parser.add_argument('--assets', type=int, default=4, help='Images per domain, besides one stylesheet and one script')
+    parser.add_argument('--page-kb', type=int, default=16)
+    parser.add_argument('--asset-kb', type=int, default=8)
+    parser.add_argument('--download-kb', type=int, default=1024)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cdx-profile', default='lan', help=f"Latency of the CDX server: one of {', '.join(PROFILES)} or a spec")
+    parser.add_argument('--data-profile', default='lan', help='Latency of the WARC server, as --cdx-profile')
+
+def corpus_from_args(args):
+    return build_corpus(args.corpus, crawls=args.crawls, domains=args.domains, pages=args.pages,
+                        assets=args.assets, page_kb=args.page_kb, asset_kb=args.asset_kb,
+                        download_kb=args.download_kb, seed=args.seed)
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a synthetic crawl corpus like Common Crawl')
+    add_corpus_arguments(parser)
+    parser.add_argument('--index-port', type=int, default=8081)
+    parser.add_argument('--data-port', type=int, default=8082)
+    args = parser.parse_args()
+
+    manifest = corpus_from_args(args)
+    fake = FakeCommonCrawl(args.corpus, LatencyProfile.parse(args.cdx_profile, args.seed),
+                           LatencyProfile.parse(args.data_profile, args.seed)).start(args.index_port, args.data_port)
+    print(f"CC_COLLINFO_URL={fake.index_url}/collinfo.json")
+    print(f"CC_DATA_URL={fake.data_url}")
+    print(f"{len(manifest['pages'])} pages, e.g. {manifest['pages'][0]['url']}")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        fake.stop()
+
+if __name__ == '__main__':
+    main()
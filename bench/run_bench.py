@@ -0,0 +1,286 @@
+"""Benchmark app.py or app_simple.py end to end against the stand-in servers.
+
+The app runs in a subprocess pointed at FakeCommonCrawl (see
+fake_commoncrawl.py) with a fresh cache directory; each scenario sends
+concurrent requests and reports p50/p95/p99 latency of the successful
+ones, errors and the requests the app made to the fake servers. Results,
+with the app's peak RSS, are written as JSON so runs can be compared; a
+run where any request failed exits with status 1:
+
+    python bench/run_bench.py --app app.py --requests 200 --concurrency 8 --out before.json
+    python bench/run_bench.py --app app.py --requests 200 --concurrency 8 --baseline before.json
+
+Settings under test are passed through with --env, e.g.
+--env CC_SEARCH_STRATEGY=binary.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from html import unescape
+
+import requests
+
+from fake_commoncrawl import FakeCommonCrawl, LatencyProfile, add_corpus_arguments, corpus_from_args
+
+import config
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ASSET_LINK = re.compile(r'(?:src|href)=["\']?(/asset\?[^"\'\s>]+)|url\(["\']?(/asset\?[^"\'\)]+)')
+
+_local = threading.local()
+
+def session():
+    """One keep-alive session per load thread"""
+    if getattr(_local, 'session', None) is None:
+        _local.session = requests.Session()
+    return _local.session
+
+def scenario_search(base, corpus, rng):
+    """POST / for a captured page, or now and then a URL of a domain in no crawl"""
+    url = rng.choice(corpus['missing']) if rng.random() < 0.2 else rng.choice(corpus['pages'])['url']
+    response = session().post(f"{base}/", data={'url': url}, timeout=120)
+    return response.status_code == 200, {}
+
+def scenario_page(base, corpus, rng):
+    """GET /page-content for a capture, then every /asset it links to, like a browser render"""
+    capture = rng.choice(corpus['pages'])
+    params = {key: capture[key] for key in ('filename', 'offset', 'length', 'url', 'timestamp', 'digest')}
+    response = session().get(f"{base}/page-content", params=params, timeout=120)
+    if response.status_code != 200:
+        return False, {}
+    links = {unescape(a or b) for a, b in ASSET_LINK.findall(response.text)}
+    ok = True
+    for link in sorted(links):
+        ok = session().get(base + link, timeout=120).status_code == 200 and ok
+    return ok, {'assets': len(links)}
+
+def scenario_download(base, corpus, rng):
+    """GET /download-file for a captured PDF, reading the whole body"""
+    response = session().get(f"{base}/download-file", params={'url': rng.choice(corpus['downloads'])},
+                             stream=True, timeout=120)
+    size = sum(len(chunk) for chunk in response.iter_content(64 * 1024))
+    return response.status_code == 200, {'bytes': size}
+
+SCENARIOS = {
+    'search': scenario_search,
+    'page': scenario_page,
+    'download': scenario_download,
+}
+
+# Scenarios each app serves
+APP_SCENARIOS = {
+    'app.py': ['search', 'page'],
+    'app_simple.py': ['search', 'download'],
+}
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def proc_status(pid, field):
+    """A size field (e.g. VmHWM, VmRSS) of /proc/<pid>/status in bytes; None where /proc is unavailable"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def start_app(app, fake, workdir, env_overrides, rate_limit):
+    """Run the app with Flask's threaded server on a free port; return (process, base URL, log path)"""
+    port = free_port()
+    module = os.path.splitext(app)[0]
+    env = dict(os.environ,
+               CC_COLLINFO_URL=f"{fake.index_url}/collinfo.json",
+               CC_DATA_URL=fake.data_url,
+               CC_CACHE_DIR=os.path.join(workdir, 'cache'),
+               CC_LOCAL_INDEX_DIR='',
+               CC_RATE_LIMIT_RATE=str(rate_limit))
+    env.update(env_overrides)
+    log_path = os.path.join(workdir, f"{module}.log")
+    log = open(log_path, 'w')
+    process = subprocess.Popen(
+        [sys.executable, '-c', f"import {module}; {module}.app.run(host='127.0.0.1', port={port}, threaded=True)"],
+        cwd=REPO_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{app} exited with status {process.returncode}; see {log_path}")
+        try:
+            requests.get(f"{base}/", timeout=2)
+            return process, base, log_path
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{app} did not start within 60 seconds; see {log_path}")
+
+def run_scenario(name, base, corpus, fake, pid, count, concurrency, seed):
+    """Send count requests of one scenario with `concurrency` in flight; return its report"""
+    scenario = SCENARIOS[name]
+    before = fake.get_stats()
+    latencies = []
+    errors = 0
+    extras = {}
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        rng = random.Random(seed * 1000003 + i)
+        start = time.perf_counter()
+        try:
+            ok, extra = scenario(base, corpus, rng)
+        except requests.RequestException:
+            ok, extra = False, {}
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append((elapsed, ok))
+            errors += 0 if ok else 1
+            for key, value in extra.items():
+                extras[key] = extras.get(key, 0) + value
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(count)))
+    wall = time.perf_counter() - start
+
+    after = fake.get_stats()
+    outbound = {kind: after.get(kind, 0) - before.get(kind, 0) for kind in after}
+    # Failures (often fast 500s or slow timeouts) would skew the percentiles either way
+    ms = [1000 * latency for latency, ok in latencies if ok]
+
+    def rounded(value):
+        return round(value, 2) if value is not None else None
+
+    return {
+        'requests': count,
+        'errors': errors,
+        'wall_seconds': round(wall, 3),
+        'throughput_rps': round(count / wall, 2) if wall else None,
+        'p50_ms': rounded(percentile(ms, 50)),
+        'p95_ms': rounded(percentile(ms, 95)),
+        'p99_ms': rounded(percentile(ms, 99)),
+        'mean_ms': rounded(sum(ms) / len(ms) if ms else None),
+        'max_ms': rounded(max(ms, default=None)),
+        'outbound': outbound,
+        'outbound_per_request': round(sum(v for k, v in outbound.items() if k != 'bytes_sent') / count, 2),
+        'totals': extras,
+        'rss_bytes': proc_status(pid, 'VmRSS'),
+    }
+
+def compare(results, baseline):
+    """Print latency changes against an earlier run"""
+    for key in ('rate_limit', 'data_rate_limit'):
+        old, new = baseline.get('settings', {}).get(key), results['settings'].get(key)
+        if old != new:
+            print(f"note: {key} differs from the baseline ({old} -> {new})")
+    for name, report in results['scenarios'].items():
+        old = baseline.get('scenarios', {}).get(name)
+        if not old:
+            continue
+        changes = []
+        if old.get('errors') != report['errors']:
+            changes.append(f"errors {old.get('errors')} -> {report['errors']}")
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'outbound_per_request'):
+            if old.get(key) and report[key] is not None:
+                changes.append(f"{key} {old[key]} -> {report[key]} ({100 * (report[key] - old[key]) / old[key]:+.1f}%)")
+        print(f"{name}: " + ', '.join(changes))
+    old_rss, new_rss = baseline.get('peak_rss_bytes'), results.get('peak_rss_bytes')
+    if old_rss and new_rss:
+        print(f"peak RSS {old_rss // 1024} KiB -> {new_rss // 1024} KiB ({100 * (new_rss - old_rss) / old_rss:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the apps against local stand-in Common Crawl servers')
+    parser.add_argument('--app', choices=sorted(APP_SCENARIOS), default='app.py')
+    parser.add_argument('--scenarios', help='Comma-separated scenarios (default: all the app serves)')
+    parser.add_argument('--requests', type=int, default=100, help='Requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--rate-limit', type=float, default=config.RATE_LIMIT_RATE,
+                        help=f'CC_RATE_LIMIT_RATE for the app (default: as configured, {config.RATE_LIMIT_RATE:g}; 0 = off)')
+    parser.add_argument('--env', action='append', default=[], metavar='NAME=VALUE', help='Extra environment for the app')
+    parser.add_argument('--out', help='Where to write the JSON results')
+    parser.add_argument('--baseline', help='Earlier results JSON to compare against')
+    parser.add_argument('--keep', action='store_true', help='Keep the work directory (app log, caches)')
+    add_corpus_arguments(parser)
+    args = parser.parse_args()
+
+    scenarios = args.scenarios.split(',') if args.scenarios else APP_SCENARIOS[args.app]
+    env_overrides = dict(item.split('=', 1) for item in args.env)
+    corpus = corpus_from_args(args)
+    cdx_profile = LatencyProfile.parse(args.cdx_profile, args.seed)
+    data_profile = LatencyProfile.parse(args.data_profile, args.seed + 1)
+    fake = FakeCommonCrawl(args.corpus, cdx_profile, data_profile).start()
+    workdir = tempfile.mkdtemp(prefix='cc-bench-')
+    process = None
+    try:
+        process, base, log_path = start_app(args.app, fake, workdir, env_overrides, args.rate_limit)
+        results = {
+            'app': args.app,
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'settings': {
+                'requests': args.requests,
+                'concurrency': args.concurrency,
+                'rate_limit': args.rate_limit,
+                'data_rate_limit': float(env_overrides.get('CC_RATE_LIMIT_DATA_RATE', config.RATE_LIMIT_DATA_RATE)),
+                'env': env_overrides,
+                'corpus': corpus['settings'],
+                'cdx_profile': cdx_profile.describe(),
+                'data_profile': data_profile.describe(),
+            },
+            'scenarios': {},
+        }
+        for name in scenarios:
+            print(f"Running {name}: {args.requests} requests, {args.concurrency} concurrent", file=sys.stderr)
+            results['scenarios'][name] = run_scenario(name, base, corpus, fake, process.pid,
+                                                      args.requests, args.concurrency, args.seed)
+        results['peak_rss_bytes'] = proc_status(process.pid, 'VmHWM')
+        if args.keep:
+            results['workdir'] = workdir
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        fake.stop()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(results, indent=2)
+    out = args.out or f"bench_{os.path.splitext(args.app)[0]}_{time.strftime('%Y%m%d-%H%M%S')}.json"
+    with open(out, 'w') as f:
+        f.write(output + '\n')
+    print(output)
+    print(f"Results written to {out}", file=sys.stderr)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+    failed = {name: report['errors'] for name, report in results['scenarios'].items() if report['errors']}
+    if failed:
+        counts = ', '.join(f"{name} {errors}/{args.requests}" for name, errors in failed.items())
+        print(f"warning: requests failed ({counts}); latencies cover successful requests only", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+import json
+import logging
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import config
+import http_client
+import zipnum
+
+logger = logging.getLogger(__name__)
+
+def host_of(url):
+    """Return the lower-cased host of url without a leading www."""
+    if '://' not in url:
+        url = 'http://' + url
+    host = (urlsplit(url).hostname or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
+def url_key(url):
+    """Canonicalise a URL the way the CDX server matches it (SURT: lower-cased, no www., sorted query)"""
+    return zipnum.surt(url)
+
+class CaptureMap:
+    """All captures of one host in one crawl, sorted by normalised URL.
+
+    Records are kept as their JSON lines, so a map costs roughly what the
+    CDX server sent; lookups are a bisect over the sorted keys.
+    """
+
+    def __init__(self, rows):
+        rows.sort(key=lambda row: row[0])
+        self.keys = [row[0] for row in rows]
+        self.lines = [row[1] for row in rows]
+        self.size = sum(len(key) + len(line) for key, line in rows)
+
+    def lookup(self, url):
+        """Return every capture of url in this map (empty list if none)"""
+        key = url_key(url)
+        start = bisect_left(self.keys, key)
+        end = bisect_right(self.keys, key, lo=start)
+        return [json.loads(line) for line in self.lines[start:end]]
+
+class CaptureMaps:
+    """LRU of CaptureMaps per (CDX index, host), bounded by total size.
+
+    A map is built on first use from a paginated matchType=host pull.
+    Hosts with more than max_pages pages of captures are not mapped; for
+    those lookup() returns None and callers query the CDX server directly.
+    """
+
+    def __init__(self, max_bytes, max_pages, max_entries=10000):
+        self.max_bytes = max_bytes
+        self.max_pages = max_pages
+        self.max_entries = max_entries
+        self._maps = OrderedDict()
+        self._size = 0
+        self._building = {}
+        self._lock = threading.Lock()
+
+    def _fetch_rows(self, index, host):
+        params = {'url': host, 'matchType': 'host', 'output': 'json'}
+        response = http_client.get(index, params=dict(params, showNumPages='true'), timeout=10)
+        if response.status_code == 404:
+            return []
+        if response.status_code != 200:
+            raise RuntimeError(f"Page count request failed with status {response.status_code}")
+        pages = int(response.json().get('pages', 0))
+        if pages > self.max_pages:
+            logger.debug(f"Not mapping {host} in {index}: {pages} pages")
+            return None
+
+        rows = []
+        for page in range(pages):
+            response = http_client.get(index, params=dict(params, page=page), timeout=30, stream=True)
+            try:
+                if response.status_code == 404:
+                    continue
+                if response.status_code != 200:
+                    raise RuntimeError(f"Page {page} failed with status {response.status_code}")
+                for line in response.iter_lines():
+                    if line:
+                        line = line.decode('utf-8')
+                        rows.append((url_key(json.loads(line)['url']), line))
+            finally:
+                response.close()
+        return rows
+
+    def _build(self, index, host):
+        rows = self._fetch_rows(index, host)
+        if rows is None:
+            return False
+        capture_map = CaptureMap(rows)
+        logger.info(f"Built capture map for {host} in {index}: {len(capture_map.keys)} captures, {capture_map.size} bytes")
+        return capture_map
+
+    def get_map(self, index, host):
+        """Return the CaptureMap for (index, host), building it if needed; None if unavailable"""
+        key = (index, host)
+        with self._lock:
+            if key in self._maps:
+                self._maps.move_to_end(key)
+                return self._maps[key] or None
+            event = self._building.get(key)
+            owner = event is None
+            if owner:
+                event = self._building[key] = threading.Event()
+
+        if not owner:
+            event.wait(timeout=30)
+            with self._lock:
+                return self._maps.get(key) or None
+
+        try:
+            capture_map = self._build(index, host)
+        except Exception as e:
+            logger.warning(f"Could not build capture map for {host} in {index}: {str(e)}")
+            capture_map = None
+        finally:
+            with self._lock:
+                del self._building[key]
+            event.set()
+
+        if capture_map is not None:
+            self._store(key, capture_map)
+        return capture_map or None
+
+    def _store(self, key, capture_map):
+        # Hosts too large to map are remembered as False so they are not retried
+        size = capture_map.size if capture_map else 0
+        with self._lock:
+            previous = self._maps.pop(key, None)
+            if previous:
+                self._size -= previous.size
+            self._maps[key] = capture_map
+            self._size += size
+            while (self._size > self.max_bytes and len(self._maps) > 1) or len(self._maps) > self.max_entries:
+                _, evicted = self._maps.popitem(last=False)
+                if evicted:
+                    self._size -= evicted.size
+
+    def lookup(self, index, url):
+        """Return the captures of url in index from the host's map, or None if it has no map"""
+        if zipnum.get_local_index(index) is not None:
+            return None  # Local indexes answer exact lookups directly
+        capture_map = self.get_map(index, host_of(url))
+        if capture_map is None:
+            return None
+        return capture_map.lookup(url)
+
+_capture_maps = None
+_capture_maps_lock = threading.Lock()
+
+def get_capture_maps():
+    """Return the process-wide capture maps, or None when disabled"""
+    global _capture_maps
+    if not config.CAPTURE_MAP_ENABLED:
+        return None
+    if _capture_maps is None:
+        with _capture_maps_lock:
+            if _capture_maps is None:
+                _capture_maps = CaptureMaps(config.CAPTURE_MAP_MAX_BYTES, config.CAPTURE_MAP_MAX_PAGES)
+    return _capture_maps
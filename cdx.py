@@ -0,0 +1,158 @@
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import cdx_cache
+import deadline
+import domain_filter
+import http_client
+import metrics
+import single_flight
+import zipnum
+
+logger = logging.getLogger(__name__)
+
+def query_cdx(index, url, match_type='exact', timeout=2, latest=False, limit=None, search_deadline=None):
+    """Query one CDX index and return the parsed records (empty list on a miss).
+
+    Crawls with a local ZipNum index are answered from disk. Otherwise
+    definite answers (200 or 404) are kept in the persistent cache; pass
+    latest=True for the newest crawl so its entries expire sooner. Waits
+    for the rate limiter are bounded by search_deadline, if given.
+    """
+    local = zipnum.get_local_index(index)
+    if local is not None:
+        metrics.CACHE_LOOKUPS.inc('cdx', 'local')
+        return local.query(url, match_type, limit=limit)
+
+    cache = cdx_cache.get_cache()
+    key = cdx_cache.cdx_key(index, url, match_type if limit is None else f"{match_type}:{limit}")
+    if cache is not None:
+        records = cache.get(key)
+        if records is not cdx_cache.MISSING:
+            metrics.CACHE_LOOKUPS.inc('cdx', 'hit')
+            return records
+        metrics.CACHE_LOOKUPS.inc('cdx', 'miss')
+
+    def fetch():
+        params = {
+            'url': url,
+            'output': 'json',
+            'matchType': match_type
+        }
+        if limit is not None:
+            params['limit'] = limit
+        with metrics.timed('cdx_request'):
+            response = http_client.hedged_get(index, params=params, timeout=timeout, search_deadline=search_deadline)
+        if response.status_code == 200 and response.text.strip():
+            records = [json.loads(line) for line in response.text.strip().split('\n')]
+        else:
+            records = []
+
+        if cache is not None and response.status_code in (200, 404):
+            cache.set(key, records, cdx_cache.crawl_ttl(latest))
+        return records
+
+    # Identical queries already in flight share that request
+    return single_flight.get_single_flight().do(('cdx', key), fetch)
+
+def has_captures(index, url, match_type='domain', timeout=2, latest=False, search_deadline=None):
+    """Return True if index holds any capture for url under match_type.
+
+    Domain probes are answered from the crawl's domain filter when it can
+    tell, and their results are fed back into it.
+    """
+    filters = domain_filter.get_domain_filters() if match_type == 'domain' else None
+    if filters is not None:
+        known = filters.check(index, url)
+        metrics.CACHE_LOOKUPS.inc('domain_filter', 'miss' if known is None else 'hit')
+        if known is not None:
+            return known
+    present = bool(query_cdx(index, url, match_type, timeout=timeout, latest=latest, limit=1,
+                             search_deadline=search_deadline))
+    if filters is not None:
+        filters.record(index, url, present)
+    return present
+
+def newest_record(records):
+    """Return the most recent capture from a list of CDX records"""
+    if not records:
+        return None
+    return max(records, key=lambda x: x['timestamp'])
+
+def closest_record(records, timestamp):
+    """Return the capture nearest to a YYYYMMDDhhmmss timestamp"""
+    if not records:
+        return None
+    return min(records, key=lambda x: abs(int(x['timestamp']) - int(timestamp)))
+
+def lookup_exact(index, url, timeout=2, latest=False, search_deadline=None):
+    """Return the newest exact capture of url in index, or None"""
+    return newest_record(query_cdx(index, url, 'exact', timeout=timeout, latest=latest, search_deadline=search_deadline))
+
+# Probe failures that leave the answer unknown; never treated as misses
+UNKNOWN_ERRORS = (http_client.Throttled, deadline.DeadlineExceeded)
+
+def _with_partial(error, results, position):
+    """Attach the first hit found past an unresolved probe to a DeadlineExceeded"""
+    if isinstance(error, deadline.DeadlineExceeded):
+        later = [results[pos] for pos in sorted(results)
+                 if pos > position and results[pos] is not None and not isinstance(results[pos], Exception)]
+        if later:
+            error.partial = later[0]
+    return error
+
+def find_first_match(probes, lookup, max_workers=1):
+    """Return the first non-None lookup(*probe) result in probe order.
+
+    With max_workers > 1 the probes are issued concurrently, but a hit is only
+    returned once every probe ahead of it has come back empty, so the answer is
+    the same one the serial loop would give. Probes still queued at that point
+    are cancelled. A probe that stays throttled or runs out of search time
+    raises (see UNKNOWN_ERRORS) once every probe ahead of it missed, rather
+    than counting as a miss.
+    """
+    probes = list(probes)
+    if not probes:
+        return None
+
+    def run(probe):
+        try:
+            return lookup(*probe)
+        except UNKNOWN_ERRORS as e:
+            # Unknown, not a miss: the search must not go past this probe
+            return e
+        except Exception as e:
+            logger.warning(f"Error probing {probe}: {str(e)}")
+            return None
+
+    if max_workers <= 1:
+        for probe in probes:
+            result = run(probe)
+            if isinstance(result, UNKNOWN_ERRORS):
+                raise result
+            if result is not None:
+                return result
+        return None
+
+    results = {}
+    next_pos = 0
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(probes)))
+    try:
+        pending = {metrics.submit(executor, run, probe): pos for pos, probe in enumerate(probes)}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[pending.pop(future)] = future.result()
+
+            # Advance over the resolved prefix; the first hit there is final
+            while next_pos in results:
+                if isinstance(results[next_pos], UNKNOWN_ERRORS):
+                    raise _with_partial(results[next_pos], results, next_pos)
+                if results[next_pos] is not None:
+                    logger.debug(f"Probe {next_pos + 1} of {len(probes)} won, cancelling {len(pending)} outstanding")
+                    return results[next_pos]
+                next_pos += 1
+        return None
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,224 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import config
+import deadline
+import metrics
+import single_flight
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    expires REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+"""
+
+class CDXCache:
+    """SQLite-backed cache for CDX responses and search results.
+
+    The database file is shared by every worker process (WAL mode). Entries
+    carry their own expiry time, and once the stored values exceed max_bytes
+    the least recently read entries are evicted first. A read only records
+    its access time when the stored one is over touch_interval seconds old,
+    so hits on hot keys do not all queue for the write lock.
+    """
+
+    def __init__(self, path, max_bytes, evict_every=50, touch_interval=60):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self.touch_interval = touch_interval
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        """Return the cached value for key, or MISSING if absent or expired"""
+        try:
+            conn = self._connect()
+            row = conn.execute('SELECT value, expires, accessed FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return MISSING
+            value, expires, accessed = row
+            now = time.time()
+            if expires < now:
+                conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+                return MISSING
+            if now - accessed > self.touch_interval:
+                conn.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+            return json.loads(value)
+        except sqlite3.Error as e:
+            logger.warning(f"Cache read failed for {key}: {str(e)}")
+            return MISSING
+
+    def set(self, key, value, ttl):
+        """Store a JSON-serialisable value for ttl seconds"""
+        try:
+            data = json.dumps(value)
+            now = time.time()
+            self._connect().execute(
+                'INSERT OR REPLACE INTO entries (key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?)',
+                (key, data, len(key) + len(data), now + ttl, now)
+            )
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"Cache write failed for {key}: {str(e)}")
+            return
+
+        with self._lock:
+            self._writes += 1
+            due = self._writes % self.evict_every == 0
+        if due:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until under budget"""
+        try:
+            conn = self._connect()
+            conn.execute('DELETE FROM entries WHERE expires < ?', (time.time(),))
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            excess = total - self.max_bytes
+            freed = 0
+            victims = []
+            for key, size in conn.execute('SELECT key, size FROM entries ORDER BY accessed'):
+                victims.append((key,))
+                freed += size
+                if freed >= excess:
+                    break
+            conn.executemany('DELETE FROM entries WHERE key = ?', victims)
+            logger.debug(f"Evicted {len(victims)} cache entries ({freed} bytes)")
+        except sqlite3.Error as e:
+            logger.warning(f"Cache eviction failed: {str(e)}")
+
+    def clear(self):
+        self._connect().execute('DELETE FROM entries')
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Return the process-wide cache, or None when caching is disabled"""
+    global _cache
+    if not config.CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = CDXCache(config.CACHE_PATH, config.CACHE_MAX_BYTES)
+    return _cache
+
+def cdx_key(index, url, match_type):
+    return f"cdx|{index}|{match_type}|{url}"
+
+def search_key(namespace, url):
+    return f"search|{namespace}|{url}"
+
+def crawl_ttl(latest):
+    """Old crawls never change; the newest one may still be growing"""
+    return config.CACHE_TTL_LATEST if latest else config.CACHE_TTL_OLD
+
+class SearchOutcome:
+    """What a search met besides its result; see search_outcome()"""
+
+    def __init__(self):
+        self.failed = False
+
+# Outcome of the search running in the current context, shared with its worker threads and tasks
+_outcome = contextvars.ContextVar('cc_search_outcome', default=None)
+
+@contextmanager
+def search_outcome():
+    """Track probe failures of the search run inside the block.
+
+    A miss found while some probes failed (network errors, not empty
+    answers) is only a guess, so callers leave it out of the cache.
+    """
+    outcome = SearchOutcome()
+    token = _outcome.set(outcome)
+    try:
+        yield outcome
+    finally:
+        _outcome.reset(token)
+
+def probe_failed():
+    """Record that a probe of the current search failed rather than missed"""
+    outcome = _outcome.get()
+    if outcome is not None:
+        outcome.failed = True
+
+def cache_search_result(cache, key, result, outcome):
+    """Store a search result, unless it is a miss that failed probes may have caused"""
+    if result or not outcome.failed:
+        cache.set(key, result, config.CACHE_TTL_SEARCH if result else config.CACHE_TTL_SEARCH_MISS)
+
+def cached_search(namespace):
+    """Decorator caching a search function's result per URL in the shared cache.
+
+    Concurrent misses for the same URL are coalesced into one search. A
+    miss is only cached when no probe failed (see search_outcome()).
+    """
+    def decorator(func):
+        def counted(url, **kwargs):
+            try:
+                result = func(url, **kwargs)
+            except deadline.DeadlineExceeded:
+                metrics.SEARCHES.inc(namespace, 'deadline')
+                raise
+            except Exception:
+                metrics.SEARCHES.inc(namespace, 'error')
+                raise
+            metrics.SEARCHES.inc(namespace, 'found' if result else 'not_found')
+            return result
+
+        @functools.wraps(func)
+        def wrapper(url, **kwargs):
+            cache = get_cache()
+            key = search_key(namespace, url)
+            if cache is None:
+                return single_flight.get_single_flight().do(key, lambda: counted(url, **kwargs))
+            result = cache.get(key)
+            if result is not MISSING:
+                logger.debug(f"Search cache hit for {url}")
+                metrics.CACHE_LOOKUPS.inc('search', 'hit')
+                return result
+            metrics.CACHE_LOOKUPS.inc('search', 'miss')
+
+            def search():
+                with search_outcome() as outcome:
+                    result = counted(url, **kwargs)
+                cache_search_result(cache, key, result, outcome)
+                return result
+            # Concurrent searches for the same URL share one run
+            return single_flight.get_single_flight().do(key, search)
+        return wrapper
+    return decorator
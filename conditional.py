@@ -0,0 +1,118 @@
+from datetime import datetime, timezone
+from email.utils import format_datetime
+
+from flask import Response
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+
+class RangeNotSatisfiable(Exception):
+    """A Range request that starts past the end of the payload"""
+
+def etag(digest, decoded=False):
+    """Strong ETag for a capture's payload, from its CDX digest.
+
+    A payload whose captured Content-Encoding was removed before sending
+    is a different representation, so it gets a tag of its own.
+    """
+    tag = (digest or '').split(':')[-1]
+    if not tag:
+        return None
+    return f'"{tag}-identity"' if decoded else f'"{tag}"'
+
+def capture_time(timestamp):
+    """Capture time of a YYYYMMDDhhmmss CDX timestamp, or None"""
+    try:
+        return datetime.strptime(timestamp or '', '%Y%m%d%H%M%S').replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+def validator_headers(capture, decoded=False):
+    """ETag and Last-Modified headers for a CDX capture"""
+    headers = {}
+    tag = etag(capture.get('digest'), decoded)
+    if tag:
+        headers['ETag'] = tag
+    captured = capture_time(capture.get('timestamp'))
+    if captured:
+        headers['Last-Modified'] = format_datetime(captured, usegmt=True)
+    return headers
+
+def is_conditional(req):
+    return bool(req.headers.get('If-None-Match') or req.headers.get('If-Modified-Since'))
+
+def _matched_etag(req, capture):
+    """The ETag of ours the client's If-None-Match names; either representation counts"""
+    tag = etag(capture.get('digest'))
+    if tag is None:
+        return None
+    if req.if_none_match.star_tag:
+        return tag
+    for value in req.if_none_match.as_set(include_weak=True):
+        if f'"{value}"' in (tag, etag(capture.get('digest'), decoded=True)):
+            return f'"{value}"'
+    return None
+
+def not_modified(req, capture):
+    """Whether the client's copy of this capture is current (If-None-Match, else If-Modified-Since)"""
+    if req.headers.get('If-None-Match'):
+        return _matched_etag(req, capture) is not None
+    since = req.if_modified_since
+    captured = capture_time(capture.get('timestamp'))
+    if since is None or captured is None:
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return captured <= since
+
+def not_modified_response(req, capture, headers=None):
+    """A 304 carrying the capture's validators and any extra headers (e.g. Cache-Control)"""
+    response = Response(status=304)
+    response.headers.update(validator_headers(capture))
+    if req.headers.get('If-None-Match'):
+        response.headers['ETag'] = _matched_etag(req, capture)
+    response.headers.update(headers or {})
+    return response
+
+def accepts_encoding(req, encoding):
+    """Whether the client accepts a body in this Content-Encoding"""
+    return req.accept_encodings[encoding] > 0
+
+def was_encoded(headers):
+    """Whether stored (name, value) HTTP headers carried a Content-Encoding (stored payloads are decoded)"""
+    return any(name.lower() == 'content-encoding' for name, _ in headers or [])
+
+def byte_range(req, length, capture, decoded=False):
+    """The (start, stop) of the request's byte range of a `length`-byte payload.
+
+    None means the whole payload is sent: no Range header, an If-Range
+    that no longer matches, or several ranges at once.
+    """
+    requested = req.range
+    if requested is None or requested.units != 'bytes' or len(requested.ranges) != 1:
+        return None
+    if req.headers.get('If-Range'):
+        if req.if_range.etag is not None:
+            if f'"{req.if_range.etag}"' != etag(capture.get('digest'), decoded):
+                return None
+        else:
+            captured = capture_time(capture.get('timestamp'))
+            since = req.if_range.date
+            if since is not None and since.tzinfo is None:
+                since = since.replace(tzinfo=timezone.utc)
+            if captured is None or since is None or captured > since:
+                return None
+    span = requested.range_for_length(length)
+    if span is None:
+        raise RangeNotSatisfiable(f"Range outside of {length} bytes")
+    return span
+
+def range_not_satisfiable(length):
+    response = Response('Requested range not satisfiable', status=416, mimetype='text/plain')
+    response.headers['Content-Range'] = f"bytes */{length}"
+    return response
+
+def make_ranged(response, req, length):
+    """Apply Range/If-Range (and If-None-Match) to a complete response whose validators are set"""
+    try:
+        return response.make_conditional(req, accept_ranges=True, complete_length=length)
+    except RequestedRangeNotSatisfiable:
+        return range_not_satisfiable(length)
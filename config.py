@@ -0,0 +1,93 @@
+import os
+
+# Settings shared by app.py and app_simple.py. Every value can be overridden
+# through an environment variable of the same name.
+
+USER_AGENT = os.environ.get('CC_USER_AGENT', 'CommonCrawlSearch/1.0')
+
+# HTTP transport
+HTTP_POOL_CONNECTIONS = int(os.environ.get('CC_HTTP_POOL_CONNECTIONS', 4))  # number of hosts kept pooled
+HTTP_POOL_SIZE = int(os.environ.get('CC_HTTP_POOL_SIZE', 16))  # keep-alive connections per host
+HTTP_TIMEOUT = float(os.environ.get('CC_HTTP_TIMEOUT', 10))
+HTTP_RETRIES = int(os.environ.get('CC_HTTP_RETRIES', 2))
+HTTP_BACKOFF = float(os.environ.get('CC_HTTP_BACKOFF', 0.3))
+STREAM_CHUNK_SIZE = int(os.environ.get('CC_STREAM_CHUNK_SIZE', 64 * 1024))
+DATA_URL = os.environ.get('CC_DATA_URL', 'https://data.commoncrawl.org')  # WARC files are range-fetched from here
+
+# Crawl collection list (collinfo.json); its cdx-api entries are the CDX endpoints used
+COLLINFO_URL = os.environ.get('CC_COLLINFO_URL', 'https://index.commoncrawl.org/collinfo.json')
+CRAWL_REFRESH_INTERVAL = int(os.environ.get('CC_CRAWL_REFRESH_INTERVAL', 3600))
+
+# Async engine (async_search.py, asgi.py)
+ASYNC_POOL_SIZE = int(os.environ.get('CC_ASYNC_POOL_SIZE', 100))  # total open connections per event loop
+
+# Search
+SEARCH_STRATEGY = os.environ.get('CC_SEARCH_STRATEGY', 'galloping')  # how crawls are probed: galloping or binary
+SEARCH_DEADLINE = float(os.environ.get('CC_SEARCH_DEADLINE', 20))  # seconds per search, all probes included; 0 = none
+HEDGE_ENABLED = os.environ.get('CC_HEDGE_ENABLED', '1') != '0'
+HEDGE_PERCENTILE = float(os.environ.get('CC_HEDGE_PERCENTILE', 95))  # CDX requests slower than this get a duplicate
+HEDGE_MIN_DELAY = float(os.environ.get('CC_HEDGE_MIN_DELAY', 0.05))
+HEDGE_SAMPLES = int(os.environ.get('CC_HEDGE_SAMPLES', 200))  # recent latencies kept per host
+HEDGE_WORKERS = int(os.environ.get('CC_HEDGE_WORKERS', 32))
+SEARCH_CONCURRENCY = int(os.environ.get('CC_SEARCH_CONCURRENCY', 4))  # 1 = serial probing
+SEARCH_TOKEN_TTL = int(os.environ.get('CC_SEARCH_TOKEN_TTL', 300))  # seconds a /search-progress result waits for the page render
+BULK_CONCURRENCY = int(os.environ.get('CC_BULK_CONCURRENCY', 4))  # domains resolved in parallel by /bulk-lookup
+BULK_MAX_URLS = int(os.environ.get('CC_BULK_MAX_URLS', 10000))
+
+# Persistent CDX/search cache, shared by all worker processes
+CACHE_ENABLED = os.environ.get('CC_CACHE_ENABLED', '1') != '0'
+CACHE_DIR = os.environ.get('CC_CACHE_DIR', '.cc_cache')
+CACHE_PATH = os.environ.get('CC_CACHE_PATH', os.path.join(CACHE_DIR, 'cdx_cache.sqlite3'))
+CACHE_MAX_BYTES = int(os.environ.get('CC_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+CACHE_TTL_OLD = int(os.environ.get('CC_CACHE_TTL_OLD', 30 * 24 * 3600))  # finished crawls
+CACHE_TTL_LATEST = int(os.environ.get('CC_CACHE_TTL_LATEST', 3600))  # newest crawl
+CACHE_TTL_SEARCH = int(os.environ.get('CC_CACHE_TTL_SEARCH', 6 * 3600))
+CACHE_TTL_SEARCH_MISS = int(os.environ.get('CC_CACHE_TTL_SEARCH_MISS', 600))
+
+# Adaptive per-host rate limit for CDX and WARC requests
+RATE_LIMIT_RATE = float(os.environ.get('CC_RATE_LIMIT_RATE', 10))  # requests per second per index host; 0 disables
+RATE_LIMIT_DATA_RATE = float(os.environ.get('CC_RATE_LIMIT_DATA_RATE', 0))  # for the DATA_URL host; 0 = unlimited
+RATE_LIMIT_BURST = float(os.environ.get('CC_RATE_LIMIT_BURST', 5))
+RATE_LIMIT_MIN_RATE = float(os.environ.get('CC_RATE_LIMIT_MIN_RATE', 0.5))  # floor after repeated throttling
+RATE_LIMIT_RETRIES = int(os.environ.get('CC_RATE_LIMIT_RETRIES', 3))  # retries of a 429/503 response
+RATE_LIMIT_BACKOFF = float(os.environ.get('CC_RATE_LIMIT_BACKOFF', 1.0))  # first wait without Retry-After, doubled per retry
+RATE_LIMIT_MAX_WAIT = float(os.environ.get('CC_RATE_LIMIT_MAX_WAIT', 60))
+RATE_LIMIT_SHARED = os.environ.get('CC_RATE_LIMIT_SHARED', '0') == '1'  # share buckets across worker processes
+RATE_LIMIT_PATH = os.environ.get('CC_RATE_LIMIT_PATH', os.path.join(CACHE_DIR, 'rate_limit.sqlite3'))
+
+# In-memory cache of domains/URLs found in no crawl
+NEGATIVE_CACHE_SIZE = int(os.environ.get('CC_NEGATIVE_CACHE_SIZE', 10000))
+NEGATIVE_CACHE_TTL = int(os.environ.get('CC_NEGATIVE_CACHE_TTL', 24 * 3600))
+
+# Per-crawl Bloom filters of domains, checked before domain probes
+DOMAIN_FILTER_ENABLED = os.environ.get('CC_DOMAIN_FILTER_ENABLED', '1') != '0'
+DOMAIN_FILTER_DIR = os.environ.get('CC_DOMAIN_FILTER_DIR', os.path.join(CACHE_DIR, 'domain_filters'))
+DOMAIN_FILTER_CAPACITY = int(os.environ.get('CC_DOMAIN_FILTER_CAPACITY', 200000))  # domains per crawl for probe-filled filters
+DOMAIN_FILTER_FP_RATE = float(os.environ.get('CC_DOMAIN_FILTER_FP_RATE', 0.001))
+DOMAIN_FILTER_VERIFY_RATE = float(os.environ.get('CC_DOMAIN_FILTER_VERIFY_RATE', 0.01))  # filter hits still probed to measure false positives
+
+# Asset prefetching during page renders
+PREFETCH_WORKERS = int(os.environ.get('CC_PREFETCH_WORKERS', 8))
+PREFETCH_MAX_ASSETS = int(os.environ.get('CC_PREFETCH_MAX_ASSETS', 200))  # per page
+PREFETCH_WAIT_TIMEOUT = float(os.environ.get('CC_PREFETCH_WAIT_TIMEOUT', 30))
+ASSET_CACHE_BYTES = int(os.environ.get('CC_ASSET_CACHE_BYTES', 128 * 1024 * 1024))
+ASSET_AFFINITY_NEIGHBOURS = int(os.environ.get('CC_ASSET_AFFINITY_NEIGHBOURS', 1))  # crawls either side of the page's crawl
+
+# Content-addressed store of decoded WARC payloads, keyed by CDX digest
+RECORD_STORE_ENABLED = os.environ.get('CC_RECORD_STORE_ENABLED', '1') != '0'
+RECORD_STORE_DIR = os.environ.get('CC_RECORD_STORE_DIR', os.path.join(CACHE_DIR, 'records'))
+RECORD_STORE_MAX_BYTES = int(os.environ.get('CC_RECORD_STORE_MAX_BYTES', 1024 * 1024 * 1024))
+RECORD_STORE_MAX_RECORD = int(os.environ.get('CC_RECORD_STORE_MAX_RECORD', 64 * 1024 * 1024))
+
+# Inflate-state checkpoints for serving byte ranges of records not in the store
+RANGE_CHECKPOINT_INTERVAL = int(os.environ.get('CC_RANGE_CHECKPOINT_INTERVAL', 1024 * 1024))  # decoded bytes
+RANGE_CHECKPOINT_MAX = int(os.environ.get('CC_RANGE_CHECKPOINT_MAX', 1024))  # ~32 KiB each
+
+# Per-(crawl, host) capture maps used for asset lookups
+CAPTURE_MAP_ENABLED = os.environ.get('CC_CAPTURE_MAP_ENABLED', '1') != '0'
+CAPTURE_MAP_MAX_BYTES = int(os.environ.get('CC_CAPTURE_MAP_MAX_BYTES', 64 * 1024 * 1024))
+CAPTURE_MAP_MAX_PAGES = int(os.environ.get('CC_CAPTURE_MAP_MAX_PAGES', 3))  # larger hosts fall back to exact queries
+
+# Directory of downloaded ZipNum indexes, one <crawl id>/ folder each with
+# cluster.idx and cdx-NNNNN.gz; crawls found there are searched locally
+LOCAL_INDEX_DIR = os.environ.get('CC_LOCAL_INDEX_DIR', '')
@@ -0,0 +1,183 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from datetime import date
+
+import cdx_cache
+import config
+import http_client
+
+logger = logging.getLogger(__name__)
+
+COLLINFO_URL = config.COLLINFO_URL
+FALLBACK_COLLECTIONS = [{
+    'id': 'CC-MAIN-2024-04',
+    'name': 'January 2024 Index',
+    'cdx-api': 'https://index.commoncrawl.org/CC-MAIN-2024-04-index'
+}]
+
+CrawlCollection = namedtuple('CrawlCollection', ['id', 'name', 'cdx_api', 'crawl_date'])
+
+def parse_crawl_date(crawl_id):
+    """Return the start date of a crawl from its id (CC-MAIN-YYYY-WW), if known"""
+    match = re.match(r'^CC-MAIN-(\d{4})-(\d{2})$', crawl_id)
+    if match:
+        try:
+            return date.fromisocalendar(int(match.group(1)), int(match.group(2)), 1)
+        except ValueError:
+            pass
+    match = re.match(r'^CC-MAIN-(\d{4})', crawl_id)
+    if match:
+        return date(int(match.group(1)), 1, 1)
+    return None
+
+def parse_collections(collinfo):
+    """Turn collinfo.json entries into CrawlCollection tuples, newest first"""
+    collections = [
+        CrawlCollection(
+            id=entry['id'],
+            name=entry.get('name', entry['id']),
+            cdx_api=entry['cdx-api'],
+            crawl_date=parse_crawl_date(entry['id'])
+        )
+        for entry in collinfo
+    ]
+    collections.sort(key=lambda c: c.id, reverse=True)
+    return collections
+
+class CrawlRegistry:
+    """Holds the Common Crawl collection list and refreshes it in the background.
+
+    The list is fetched once on first use, then re-fetched every
+    refresh_interval seconds by a daemon thread. A failed refresh keeps
+    serving the last good copy. Until a fetch has succeeded (the cached or
+    fallback list is in use), it is retried after retry_interval seconds,
+    doubling up to refresh_interval.
+    """
+
+    def __init__(self, url=COLLINFO_URL, refresh_interval=3600, retry_interval=5):
+        self.url = url
+        self.refresh_interval = refresh_interval
+        self.retry_interval = retry_interval
+        self._collections = None
+        self._by_api = {}
+        self._by_id = {}
+        self._indexes = []
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.last_refresh = None
+
+    def _set(self, collections):
+        self._by_api = {c.cdx_api: position for position, c in enumerate(collections)}
+        self._by_id = {c.id: position for position, c in enumerate(collections)}
+        self._indexes = [c.cdx_api for c in collections]
+        self._collections = collections
+
+    def refresh(self):
+        """Fetch collinfo.json; returns True if the list was updated"""
+        try:
+            response = http_client.get(self.url, timeout=10)
+            if response.status_code != 200:
+                logger.warning(f"Collection list refresh failed with status {response.status_code}")
+                return False
+            collinfo = response.json()
+            collections = parse_collections(collinfo)
+            if not collections:
+                logger.warning("Collection list refresh returned no crawls")
+                return False
+        except Exception as e:
+            logger.error(f"Error fetching Common Crawl indexes: {str(e)}", exc_info=True)
+            return False
+
+        with self._lock:
+            self._set(collections)
+            self.last_refresh = time.time()
+        cache = cdx_cache.get_cache()
+        if cache is not None:
+            cache.set('collinfo', collinfo, config.CACHE_TTL_OLD)
+        logger.info(f"Loaded {len(collections)} Common Crawl collections (newest {collections[0].id})")
+        return True
+
+    def _load(self):
+        if self.refresh():
+            return
+        cache = cdx_cache.get_cache()
+        collinfo = cache.get('collinfo') if cache is not None else cdx_cache.MISSING
+        if collinfo is not cdx_cache.MISSING:
+            logger.warning("Using cached collection list")
+            self._set(parse_collections(collinfo))
+        else:
+            logger.warning("Using fallback collection list")
+            self._set(parse_collections(FALLBACK_COLLECTIONS))
+
+    def _refresh_loop(self):
+        retry = self.retry_interval
+        while True:
+            if self.last_refresh is None:
+                time.sleep(retry)
+                retry = min(retry * 2, self.refresh_interval)
+            else:
+                time.sleep(self.refresh_interval)
+            self.refresh()
+
+    def start(self):
+        """Load the list if needed and make sure this process has a refresh thread"""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            if self._collections is None:
+                self._load()
+            # Threads do not survive a fork, so each worker starts its own
+            self._thread = threading.Thread(target=self._refresh_loop, name='crawl-registry', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def collections(self):
+        """Return the crawl collections, newest first"""
+        self.start()
+        return self._collections
+
+    def indexes(self):
+        """Return the CDX API endpoints, newest first"""
+        self.start()
+        return self._indexes
+
+    def latest(self):
+        return self.collections()[0]
+
+    def position(self, cdx_api):
+        """Return the position of a CDX endpoint in the newest-first list, or None"""
+        self.start()
+        return self._by_api.get(cdx_api)
+
+    def position_of_id(self, crawl_id):
+        """Return the position of a crawl id (e.g. CC-MAIN-2024-10) in the newest-first list, or None"""
+        self.start()
+        return self._by_id.get(crawl_id)
+
+    def is_latest(self, cdx_api):
+        return self.position(cdx_api) == 0
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_registry():
+    """Return the process-wide registry, loading it on first use"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = CrawlRegistry(refresh_interval=config.CRAWL_REFRESH_INTERVAL)
+    _registry.start()
+    return _registry
+
+def warm():
+    """Start loading the registry in the background, so the first search does not pay for it"""
+    threading.Thread(target=get_registry, name='crawl-registry-warm', daemon=True).start()
@@ -0,0 +1,47 @@
+import time
+
+class DeadlineExceeded(Exception):
+    """A search ran out of time before its answer was known.
+
+    Not a miss: nothing is cached or marked absent. `partial` holds a
+    capture found before time ran out while crawls the search would have
+    preferred were still unchecked, so it may not be the best match, or
+    None.
+    """
+
+    def __init__(self, message='Search deadline exceeded', partial=None):
+        super().__init__(message)
+        self.partial = partial
+
+class Deadline:
+    """Time budget of one search, shared by every request it makes"""
+
+    def __init__(self, budget):
+        self.expires = time.monotonic() + budget if budget else None
+
+    def remaining(self):
+        """Seconds left, or None when there is no budget"""
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self):
+        return self.expires is not None and time.monotonic() >= self.expires
+
+    def check(self):
+        """Raise DeadlineExceeded once the budget is spent"""
+        if self.expired():
+            raise DeadlineExceeded()
+
+    def sleep(self, seconds):
+        """Sleep for seconds, or raise DeadlineExceeded at once if that would overrun the budget"""
+        remaining = self.remaining()
+        if remaining is not None and seconds > remaining:
+            raise DeadlineExceeded()
+        time.sleep(seconds)
+
+    def timeout(self, default):
+        """Timeout for the next request: default, cut down to the time left"""
+        self.check()
+        remaining = self.remaining()
+        return default if remaining is None else min(default, remaining)
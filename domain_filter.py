@@ -0,0 +1,248 @@
+"""Per-crawl Bloom filters of the domains each crawl is known to hold.
+
+    python domain_filter.py        # build complete filters from CC_LOCAL_INDEX_DIR
+"""
+import atexit
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import struct
+import threading
+
+import config
+import zipnum
+
+logger = logging.getLogger(__name__)
+
+def domain_key(domain):
+    """Lower-case a domain and drop a leading www., as domain queries do"""
+    domain = domain.strip().lower().rstrip('.')
+    return domain[4:] if domain.startswith('www.') else domain
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings, using double hashing on one blake2b digest."""
+
+    def __init__(self, size_bits, hashes, bits=None):
+        self.size_bits = size_bits
+        self.hashes = hashes
+        self.bits = bits if bits is not None else bytearray((size_bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity, fp_rate):
+        capacity = max(1, capacity)
+        size_bits = max(64, int(-capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        hashes = max(1, round(size_bits / capacity * math.log(2)))
+        return cls(size_bits, hashes)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1, h2 = struct.unpack('<QQ', digest)
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size_bits
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+class CrawlDomainFilter:
+    """Domains present in one crawl.
+
+    A filter built from the crawl's full index is complete: a domain it
+    does not contain is definitely absent. One filled from probe results
+    only knows about domains seen so far, so there a miss means "ask the
+    CDX server" and only hits save a probe.
+    """
+
+    def __init__(self, bloom, complete=False):
+        self.bloom = bloom
+        self.complete = complete
+        self.dirty = 0
+
+    def add(self, domain):
+        key = domain_key(domain)
+        if key not in self.bloom:
+            self.bloom.add(key)
+            self.dirty += 1
+
+    def check(self, domain):
+        """True if probably present, False if definitely absent, None if unknown"""
+        if domain_key(domain) in self.bloom:
+            return True
+        return False if self.complete else None
+
+    def save(self, path):
+        header = json.dumps({'size_bits': self.bloom.size_bits, 'hashes': self.bloom.hashes,
+                             'complete': self.complete}).encode('utf-8')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(header + b'\n')
+            f.write(self.bloom.bits)
+        os.replace(tmp_path, path)
+        self.dirty = 0
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            header = json.loads(f.readline())
+            bits = bytearray(f.read())
+        if len(bits) != (header['size_bits'] + 7) // 8:
+            raise ValueError(f"Truncated domain filter {path}")
+        bloom = BloomFilter(header['size_bits'], header['hashes'], bits)
+        return cls(bloom, header.get('complete', False))
+
+class DomainFilters:
+    """CrawlDomainFilters per CDX index, persisted under one directory.
+
+    check() answers a domain probe from the filter when it can and counts
+    how many CDX requests that saved. A fraction of filter hits
+    (verify_rate) is still sent to the CDX server to measure the real
+    false-positive rate.
+    """
+
+    def __init__(self, directory, capacity, fp_rate, verify_rate, save_every=100):
+        self.directory = directory
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.verify_rate = verify_rate
+        self.save_every = save_every
+        self._filters = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            'checks': 0,
+            'saved_absent': 0,
+            'saved_present': 0,
+            'unknown': 0,
+            'verified': 0,
+            'false_positives': 0
+        }
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, crawl_id):
+        return os.path.join(self.directory, f"{crawl_id}.bloom")
+
+    def _filter(self, index):
+        crawl_id = zipnum.crawl_id_of_index(index)
+        if crawl_id is None:
+            return None
+        if crawl_id not in self._filters:
+            path = self._path(crawl_id)
+            try:
+                self._filters[crawl_id] = CrawlDomainFilter.load(path)
+            except (OSError, ValueError):
+                self._filters[crawl_id] = CrawlDomainFilter(BloomFilter.for_capacity(self.capacity, self.fp_rate))
+        return self._filters[crawl_id]
+
+    def _count(self, field):
+        with self._lock:
+            self.stats[field] += 1
+
+    def check(self, index, domain):
+        """Return True/False when the filter can answer without a probe, else None"""
+        with self._lock:
+            domain_filter = self._filter(index)
+            answer = domain_filter.check(domain) if domain_filter is not None else None
+        self._count('checks')
+        if answer is None:
+            self._count('unknown')
+            return None
+        if answer is False:
+            self._count('saved_absent')
+            return False
+        if random.random() < self.verify_rate:
+            return None  # Let this probe through; record() reports the outcome
+        self._count('saved_present')
+        return True
+
+    def record(self, index, domain, present):
+        """Feed a probe result back into the crawl's filter"""
+        with self._lock:
+            domain_filter = self._filter(index)
+            if domain_filter is None:
+                return
+            # A probe for a domain the filter holds is one of the sampled verifications
+            verified = domain_filter.check(domain) is True
+            if present:
+                domain_filter.add(domain)
+            should_save = domain_filter.dirty >= self.save_every
+        if verified:
+            self._count('verified')
+            if not present:
+                self._count('false_positives')
+        if should_save:
+            self.save()
+
+    def add_complete(self, crawl_id, domain_filter):
+        """Install a complete filter for a crawl (built from its full index)"""
+        with self._lock:
+            self._filters[crawl_id] = domain_filter
+            domain_filter.save(self._path(crawl_id))
+
+    def save(self):
+        """Write every filter with unsaved additions to disk"""
+        with self._lock:
+            for crawl_id, domain_filter in self._filters.items():
+                if domain_filter.dirty:
+                    try:
+                        domain_filter.save(self._path(crawl_id))
+                    except OSError as e:
+                        logger.warning(f"Could not save domain filter for {crawl_id}: {str(e)}")
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['crawls'] = len(self._filters)
+        saved = stats['saved_absent'] + stats['saved_present']
+        stats['probes_saved_rate'] = saved / stats['checks'] if stats['checks'] else 0.0
+        stats['false_positive_rate'] = stats['false_positives'] / stats['verified'] if stats['verified'] else 0.0
+        return stats
+
+def domains_of_host_key(host_key):
+    """Yield the domain keys a SURT host key counts under, e.g. com,example,blog -> blog.example.com, example.com"""
+    labels = [label.split(':', 1)[0] for label in host_key.split(',')]  # drop a port on the last label
+    for end in range(len(labels), 1, -1):
+        yield '.'.join(reversed(labels[:end]))
+
+def build_from_local_index(crawl_id, fp_rate=None):
+    """Build a complete CrawlDomainFilter from a crawl's local ZipNum index"""
+    index = zipnum.ZipNumIndex(os.path.join(config.LOCAL_INDEX_DIR, crawl_id))
+    domains = set()
+    for host_key in index.host_keys():
+        domains.update(domains_of_host_key(host_key))
+    domain_filter = CrawlDomainFilter(BloomFilter.for_capacity(len(domains), fp_rate or config.DOMAIN_FILTER_FP_RATE),
+                                      complete=True)
+    for domain in domains:
+        domain_filter.bloom.add(domain)
+    logger.info(f"Built domain filter for {crawl_id}: {len(domains)} domains")
+    return domain_filter
+
+_filters = None
+_filters_lock = threading.Lock()
+
+def get_domain_filters():
+    """Return the process-wide domain filters, or None when disabled"""
+    global _filters
+    if not config.DOMAIN_FILTER_ENABLED:
+        return None
+    if _filters is None:
+        with _filters_lock:
+            if _filters is None:
+                _filters = DomainFilters(config.DOMAIN_FILTER_DIR, config.DOMAIN_FILTER_CAPACITY,
+                                         config.DOMAIN_FILTER_FP_RATE, config.DOMAIN_FILTER_VERIFY_RATE)
+                atexit.register(_filters.save)
+    return _filters
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    if not config.LOCAL_INDEX_DIR:
+        raise SystemExit("Set CC_LOCAL_INDEX_DIR to the directory of downloaded ZipNum indexes")
+    filters = get_domain_filters() or DomainFilters(config.DOMAIN_FILTER_DIR, config.DOMAIN_FILTER_CAPACITY,
+                                                   config.DOMAIN_FILTER_FP_RATE, config.DOMAIN_FILTER_VERIFY_RATE)
+    for crawl_id in sorted(os.listdir(config.LOCAL_INDEX_DIR)):
+        if os.path.exists(os.path.join(config.LOCAL_INDEX_DIR, crawl_id, 'cluster.idx')):
+            filters.add_complete(crawl_id, build_from_local_index(crawl_id))
@@ -0,0 +1,226 @@
+"""Batch extractor: resolve a list of URLs and write their records to one WARC.
+
+    python extract.py urls.txt -o out.warc.gz
+
+URLs are resolved with the app's search (grouped by domain, on a worker
+pool); the matching records are then sorted by (WARC filename, offset) and
+their raw gzip members are range-fetched and appended to the output as-is,
+which keeps the output a valid .warc.gz without recompressing anything.
+
+Progress is kept next to the output file, so an interrupted job can be
+rerun with the same arguments and carries on where it stopped:
+
+    out.warc.gz.resolved.jsonl   one {"url", "result"} line per resolved URL
+    out.warc.gz.plan.jsonl       the records to write, in write order
+    out.warc.gz.progress.json    records written and output size so far
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+import http_client
+import warc_stream
+from app import bulk_search
+
+logger = logging.getLogger('extract')
+
+# Upper bound on one coalesced Range request over adjacent records
+MAX_RUN_BYTES = 16 * 1024 * 1024
+
+def read_urls(path):
+    """Read URLs from a text file (one per line) or a JSONL file of strings/{"url": ...}.
+
+    Raises ValueError naming the line for an entry that is not a URL, such
+    as an object without a "url" key, rather than resolving it as None.
+    """
+    urls = []
+    with open(path, encoding='utf-8', errors='ignore') as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                item = json.loads(line) if line[0] in '{"' else line
+            except ValueError as e:
+                raise ValueError(f"{path}:{number}: invalid JSON: {str(e)}")
+            url = item.get('url') if isinstance(item, dict) else item
+            if not isinstance(url, str) or not url.strip():
+                raise ValueError(f"{path}:{number}: invalid URL entry: {item!r}")
+            urls.append(url.strip())
+    return urls
+
+def load_resolved(path):
+    """Return {url: result} from a previous run's resolved file"""
+    resolved = {}
+    if not os.path.exists(path):
+        return resolved
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # Torn last line of an interrupted run
+            resolved[entry['url']] = entry['result']
+    return resolved
+
+def resolve(urls, resolved_path, workers):
+    """Resolve every URL not in the resolved file, appending results as they come in"""
+    resolved = load_resolved(resolved_path)
+    pending = list(dict.fromkeys(url for url in urls if url not in resolved))
+    logger.info(f"{len(resolved)} URLs already resolved, {len(pending)} to go")
+    if not pending:
+        return resolved
+
+    failed = 0
+    with open(resolved_path, 'a', encoding='utf-8') as f:
+        for done, (url, result, error, partial) in enumerate(bulk_search(pending, workers=workers), 1):
+            if error or partial:
+                # Not recorded, so the next run retries it
+                failed += 1
+                logger.warning(f"Could not resolve {url}: {error}")
+            else:
+                resolved[url] = result
+                f.write(json.dumps({'url': url, 'result': result}) + '\n')
+                f.flush()
+            if done % 1000 == 0:
+                logger.info(f"Resolved {done}/{len(pending)} URLs")
+    if failed:
+        logger.warning(f"{failed} URLs failed to resolve; rerun to retry them")
+    return resolved
+
+def plan_records(resolved):
+    """Return the unique records to extract, sorted by (filename, offset)"""
+    records = {}
+    for result in resolved.values():
+        if result and result.get('filename'):
+            key = (result['filename'], int(result['offset']))
+            records[key] = int(result['length'])
+    return [(filename, offset, length) for (filename, offset), length in sorted(records.items())]
+
+def extend_plan(records, plan_path):
+    """Return the write plan, appending records a previous run's plan lacks.
+
+    The plan is fixed once written, so records resolved by a later run
+    (e.g. retried failures) go after it instead of shifting what the saved
+    progress points at.
+    """
+    plan = []
+    if os.path.exists(plan_path):
+        with open(plan_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    plan.append(tuple(json.loads(line)))
+                except ValueError:
+                    break  # Torn last line; it is rewritten below
+    planned = set(plan)
+    new = [record for record in records if record not in planned]
+    if new or not os.path.exists(plan_path):
+        tmp_path = plan_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in plan + new:
+                f.write(json.dumps(record) + '\n')
+        os.replace(tmp_path, plan_path)
+    return plan + new
+
+def plan_runs(records):
+    """Group sorted records into runs of adjacent byte ranges in the same file"""
+    runs = []
+    for filename, offset, length in records:
+        if runs:
+            run = runs[-1]
+            run_end = run['offset'] + run['length']
+            if (run['filename'] == filename and run_end == offset
+                    and run['length'] + length <= MAX_RUN_BYTES):
+                run['length'] += length
+                run['count'] += 1
+                continue
+        runs.append({'filename': filename, 'offset': offset, 'length': length, 'count': 1})
+    return runs
+
+def fetch_run(run):
+    """Range-fetch the raw (still gzip-compressed) bytes of a run of records"""
+    response = http_client.get(
+        f"{warc_stream.DATA_URL}/{run['filename']}",
+        headers={'Range': warc_stream.record_range(run['offset'], run['length'])},
+        timeout=60
+    )
+    if response.status_code != 206:
+        raise RuntimeError(f"Range request for {run['filename']} returned {response.status_code}")
+    if len(response.content) != run['length']:
+        raise RuntimeError(f"Short read from {run['filename']}: {len(response.content)} of {run['length']} bytes")
+    return response.content
+
+def load_progress(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'records': 0, 'bytes': 0}
+
+def save_progress(path, progress):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(progress, f)
+    os.replace(tmp_path, path)
+
+def write_warc(records, output, progress_path):
+    """Append the records' gzip members to output, resuming from saved progress"""
+    progress = load_progress(progress_path)
+    if not os.path.exists(output):
+        progress = {'records': 0, 'bytes': 0}
+    done = progress['records']
+    if done:
+        logger.info(f"Resuming after {done} records ({progress['bytes']} bytes)")
+
+    runs = plan_runs(records[done:])
+    logger.info(f"Extracting {len(records) - done} records in {len(runs)} range requests")
+
+    mode = 'r+b' if os.path.exists(output) else 'wb'
+    with open(output, mode) as f:
+        # Anything past the last saved point is a partially written run
+        f.truncate(progress['bytes'])
+        f.seek(progress['bytes'])
+        for run_number, run in enumerate(runs, 1):
+            try:
+                data = fetch_run(run)
+            except Exception as e:
+                logger.error(f"Stopping at {run['filename']}:{run['offset']}: {str(e)}; rerun to resume")
+                return False
+            f.write(data)
+            f.flush()
+            progress['records'] += run['count']
+            progress['bytes'] += len(data)
+            save_progress(progress_path, progress)
+            if run_number % 100 == 0:
+                logger.info(f"Wrote {progress['records']}/{len(records)} records")
+    return True
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Extract the Common Crawl records of a URL list into one WARC file')
+    parser.add_argument('urls', help='file of URLs, one per line (or JSONL)')
+    parser.add_argument('-o', '--output', required=True, help='output .warc.gz file')
+    parser.add_argument('-w', '--workers', type=int, default=8, help='domains resolved in parallel (default: 8)')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    # app.py configures DEBUG logging for the web app; a batch job wants less
+    logging.getLogger().setLevel(logging.DEBUG if args.verbose else logging.INFO)
+
+    try:
+        urls = read_urls(args.urls)
+    except ValueError as e:
+        parser.error(str(e))
+    resolved = resolve(urls, args.output + '.resolved.jsonl', args.workers)
+    records = extend_plan(plan_records(resolved), args.output + '.plan.jsonl')
+    found = sum(1 for url in set(urls) if resolved.get(url))
+    logger.info(f"{found} of {len(set(urls))} URLs found; {len(records)} unique records")
+
+    if not write_warc(records, args.output, args.output + '.progress.json'):
+        return 1
+    logger.info(f"Wrote {len(records)} records to {args.output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
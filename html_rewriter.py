@@ -0,0 +1,86 @@
+import re
+import time
+
+import metrics
+
+# src=..., href=... and url(...) references, matched in one pass over raw bytes
+LINK_PATTERN = re.compile(
+    rb'(src|href)=(["\']?)([^"\'\s>]+)'
+    rb'|url\((["\']?)([^"\'\)]+)(["\']?)\)'
+)
+
+class LinkRewriter:
+    """Incrementally rewrites links in an HTML/CSS byte stream.
+
+    rewrite(kind, url) is called for every reference, with kind being
+    'src', 'href' or 'url' and url a str, and returns the replacement URL.
+    Only `lookahead` bytes are held back between chunks, so memory stays
+    bounded; a reference longer than that (e.g. a huge data: URI) that
+    straddles a chunk boundary is passed through unchanged.
+    """
+
+    def __init__(self, rewrite, lookahead=4096):
+        self.rewrite = rewrite
+        self.lookahead = lookahead
+        self._buffer = b''
+
+    def _replace(self, match):
+        if match.group(1) is not None:
+            kind = match.group(1)
+            url = self.rewrite(kind.decode('ascii'), match.group(3).decode('utf-8', errors='ignore'))
+            return kind + b'=' + match.group(2) + url.encode('utf-8')
+        url = self.rewrite('url', match.group(5).decode('utf-8', errors='ignore'))
+        return b'url(' + match.group(4) + url.encode('utf-8') + match.group(6) + b')'
+
+    def _process(self, final):
+        data = self._buffer
+        cut = len(data) if final else len(data) - self.lookahead
+        out = []
+        pos = 0
+        for match in LINK_PATTERN.finditer(data):
+            if match.start() >= cut:
+                break
+            if not final and match.end() >= len(data):
+                # Might continue in the next chunk
+                break
+            out.append(data[pos:match.start()])
+            out.append(self._replace(match))
+            pos = match.end()
+        keep_from = max(pos, cut)
+        out.append(data[pos:keep_from])
+        self._buffer = data[keep_from:]
+        return b''.join(out)
+
+    def feed(self, chunk):
+        """Add a chunk of input and return the output that is now final"""
+        self._buffer += chunk
+        if len(self._buffer) <= self.lookahead:
+            return b''
+        return self._process(final=False)
+
+    def close(self):
+        """Flush whatever is still buffered"""
+        return self._process(final=True)
+
+def rewrite_stream(chunks, rewrite, lookahead=4096):
+    """Yield rewritten output for an iterable of byte chunks.
+
+    Time spent rewriting (not reading chunks or waiting on the consumer)
+    is recorded as the 'rewrite' stage when the stream ends.
+    """
+    rewriter = LinkRewriter(rewrite, lookahead)
+    elapsed = 0.0
+    try:
+        for chunk in chunks:
+            start = time.perf_counter()
+            output = rewriter.feed(chunk)
+            elapsed += time.perf_counter() - start
+            if output:
+                yield output
+        start = time.perf_counter()
+        output = rewriter.close()
+        elapsed += time.perf_counter() - start
+        if output:
+            yield output
+    finally:
+        metrics.record('rewrite', elapsed)
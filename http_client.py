@@ -0,0 +1,217 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, TimeoutError as FutureTimeout, wait
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import config
+import deadline
+import metrics
+import rate_limit
+
+logger = logging.getLogger(__name__)
+
+# Statuses meaning "slow down" rather than "not found"
+THROTTLE_STATUSES = (429, 503)
+
+class Throttled(Exception):
+    """A host kept answering 429/503 after every retry; the request's answer is unknown"""
+
+_session = None
+_session_lock = threading.Lock()
+# Search deadline of the request this thread is sending, for _DeadlineRetry
+_sending = threading.local()
+
+class _DeadlineRetry(Retry):
+    """Retry that stops once the search deadline of the request being sent has passed.
+
+    urllib3 retries a timed out read with the same timeout, which would
+    otherwise run a deadline-bound request several times past its budget.
+    """
+
+    def is_exhausted(self):
+        search_deadline = getattr(_sending, 'deadline', None)
+        return super().is_exhausted() or (search_deadline is not None and search_deadline.expired())
+
+def _build_session():
+    """Create a session with keep-alive pools and retries for every host"""
+    retry = _DeadlineRetry(
+        total=config.HTTP_RETRIES,
+        connect=config.HTTP_RETRIES,
+        read=config.HTTP_RETRIES,
+        backoff_factor=config.HTTP_BACKOFF,
+        status_forcelist=(500, 502, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=config.HTTP_POOL_CONNECTIONS,
+        pool_maxsize=config.HTTP_POOL_SIZE,
+        max_retries=retry,
+        pool_block=False
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'User-Agent': config.USER_AGENT})
+    logger.debug(f"Created HTTP session (pool size {config.HTTP_POOL_SIZE}, retries {config.HTTP_RETRIES})")
+    return session
+
+def get_session():
+    """Return the process-wide pooled session, creating it on first use"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+def get(url, search_deadline=None, **kwargs):
+    """GET through the shared session, applying the default timeout and the host's rate limit.
+
+    429/503 responses are retried after the host's Retry-After (or backoff)
+    period; if the host is still throttling after config.RATE_LIMIT_RETRIES
+    retries, Throttled is raised instead of returning the response. With a
+    search_deadline, no rate-limit or retry wait and no request timeout
+    runs past it: DeadlineExceeded is raised instead.
+    """
+    kwargs.setdefault('timeout', config.HTTP_TIMEOUT)
+    search_deadline = search_deadline or deadline.Deadline(None)
+    timeout = kwargs['timeout']
+    host = urlsplit(url).hostname
+    limiter = rate_limit.get_limiter()
+    for attempt in range(config.RATE_LIMIT_RETRIES + 1):
+        search_deadline.sleep(limiter.reserve(host))
+        kwargs['timeout'] = search_deadline.timeout(timeout)
+        start = time.monotonic()
+        _sending.deadline = search_deadline
+        try:
+            response = get_session().get(url, **kwargs)
+        except requests.RequestException as e:
+            metrics.UPSTREAM_RESPONSES.inc(host, type(e).__name__)
+            limiter.failed(host)
+            raise
+        finally:
+            _sending.deadline = None
+        metrics.UPSTREAM_RESPONSES.inc(host, str(response.status_code))
+        if response.status_code not in THROTTLE_STATUSES:
+            _latency.record(host, time.monotonic() - start)
+            if response.status_code >= 500:
+                limiter.failed(host)
+            else:
+                limiter.succeeded(host)
+            return response
+        delay = limiter.throttled(host, response.headers.get('Retry-After'))
+        response.close()
+        logger.warning(f"{host} answered {response.status_code}, retry {attempt + 1} in {delay:.1f}s")
+    raise Throttled(f"{host} is still throttling after {config.RATE_LIMIT_RETRIES} retries")
+
+def reset_session():
+    """Forget the shared session so the next call builds a new one.
+
+    Runs in every forked child (e.g. gunicorn --preload workers, where
+    crawl_registry.warm() has already used the session): the pooled
+    sockets belong to the parent, so they are dropped without closing,
+    and the lock is replaced in case another parent thread held it.
+    """
+    global _session, _session_lock
+    _session = None
+    _session_lock = threading.Lock()
+
+class LatencyTracker:
+    """Recent request latencies per host, used to pick hedging delays"""
+
+    def __init__(self, samples, min_samples=20):
+        self.samples = samples
+        self.min_samples = min_samples
+        self._latencies = {}
+        self._lock = threading.Lock()
+
+    def record(self, host, seconds):
+        with self._lock:
+            self._latencies.setdefault(host, deque(maxlen=self.samples)).append(seconds)
+
+    def percentile(self, host, percentile):
+        """The host's latency at percentile, or None until enough samples are in"""
+        with self._lock:
+            latencies = sorted(self._latencies.get(host, ()))
+        if len(latencies) < self.min_samples:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percentile / 100))]
+
+_latency = LatencyTracker(config.HEDGE_SAMPLES)
+_hedge_executor = None
+_hedge_lock = threading.Lock()
+hedge_stats = {'requests': 0, 'hedged': 0, 'hedge_won': 0}
+
+def _executor():
+    global _hedge_executor
+    if _hedge_executor is None:
+        with _hedge_lock:
+            if _hedge_executor is None:
+                _hedge_executor = ThreadPoolExecutor(max_workers=config.HEDGE_WORKERS, thread_name_prefix='hedge')
+    return _hedge_executor
+
+def _close_late(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+def hedged_get(url, **kwargs):
+    """get() that sends a duplicate request when the first is slower than usual.
+
+    Once the host's latency at config.HEDGE_PERCENTILE is known, a request
+    still unanswered after that long is hedged with a second identical
+    request; whichever succeeds first is returned. Only for small, idempotent
+    responses (CDX queries), never for streamed ones.
+    """
+    kwargs.setdefault('timeout', config.HTTP_TIMEOUT)
+    host = urlsplit(url).hostname
+    delay = _latency.percentile(host, config.HEDGE_PERCENTILE) if config.HEDGE_ENABLED else None
+    with _hedge_lock:
+        hedge_stats['requests'] += 1
+    if delay is None:
+        return get(url, **kwargs)
+
+    delay = max(delay, config.HEDGE_MIN_DELAY)
+    first = _executor().submit(get, url, **kwargs)
+    try:
+        return first.result(timeout=delay)
+    except FutureTimeout:
+        pass
+
+    # The hedge only gets what is left of the original request's timeout
+    hedge_kwargs = dict(kwargs, timeout=max(0.1, kwargs['timeout'] - delay))
+    second = _executor().submit(get, url, **hedge_kwargs)
+    with _hedge_lock:
+        hedge_stats['hedged'] += 1
+    logger.debug(f"Hedging request to {host} after {delay:.2f}s")
+
+    pending = {first, second}
+    while True:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        succeeded = [future for future in (first, second) if future in done and future.exception() is None]
+        if succeeded or not pending:
+            winner = succeeded[0] if succeeded else first
+            for other in (first, second):
+                if other is not winner:
+                    other.add_done_callback(_close_late)
+            if winner is second:
+                with _hedge_lock:
+                    hedge_stats['hedge_won'] += 1
+            return winner.result()
+
+def _after_fork():
+    global _hedge_executor, _hedge_lock
+    reset_session()
+    # The parent's hedge threads do not exist in the child
+    _hedge_executor = None
+    _hedge_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,155 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def _label_text(self, values, extra=()):
+        pairs = list(zip(self.labels, values)) + list(extra)
+        if not pairs:
+            return ''
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for _, value in pairs)
+        return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self._samples())
+        return lines
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{self._label_text(labels)} {value}" for labels, value in values]
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+        self._values = {}
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            counts, total = self._values.get(label_values) or ([0] * len(self.buckets), [0, 0.0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            total[0] += 1
+            total[1] += value
+            self._values[label_values] = (counts, total)
+
+    def _samples(self):
+        with self._lock:
+            values = sorted((labels, (list(counts), list(total))) for labels, (counts, total) in self._values.items())
+        lines = []
+        for labels, (counts, (count, total)) in values:
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{self._label_text(labels, [('le', bound)])} {bucket_count}")
+            lines.append(f"{self.name}_bucket{self._label_text(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{self._label_text(labels)} {total}")
+            lines.append(f"{self.name}_count{self._label_text(labels)} {count}")
+        return lines
+
+class Gauge(_Metric):
+    """A value read from a callback at scrape time; the callback returns {label values: value}"""
+
+    type = 'gauge'
+
+    def __init__(self, name, help, labels, collect):
+        super().__init__(name, help, labels)
+        self.collect = collect
+
+    def _samples(self):
+        try:
+            values = sorted(self.collect().items())
+        except Exception:
+            return []
+        return [f"{self.name}{self._label_text(labels)} {value}" for labels, value in values]
+
+_registry = []
+
+def _register(metric):
+    _registry.append(metric)
+    return metric
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+def gauge(name, help, labels, collect):
+    """Register a gauge whose values come from collect() at scrape time"""
+    return _register(Gauge(name, help, labels, collect))
+
+STAGE_SECONDS = _register(Histogram('cc_stage_seconds', 'Time spent per stage of a request', ('stage',)))
+REQUEST_SECONDS = _register(Histogram('cc_request_seconds', 'Time to produce a response (streamed bodies excluded)', ('endpoint',)))
+RESPONSES = _register(Counter('cc_responses_total', 'Responses served, by endpoint and status', ('endpoint', 'status')))
+SEARCHES = _register(Counter('cc_searches_total', 'Searches run, by outcome', ('namespace', 'outcome')))
+SEARCH_PROBES = _register(Histogram('cc_search_probes', 'Domain probes per crawl search', ('strategy',),
+                                    buckets=(1, 2, 3, 4, 6, 8, 10, 15, 20, 30)))
+CACHE_LOOKUPS = _register(Counter('cc_cache_lookups_total', 'Cache lookups, by cache and result', ('cache', 'result')))
+UPSTREAM_RESPONSES = _register(Counter('cc_upstream_responses_total', 'Responses from Common Crawl, by host and status', ('host', 'status')))
+FETCHED_BYTES = _register(Counter('cc_fetched_bytes_total', 'Decoded payload bytes read from WARC records', ('source',)))
+
+# Stage timings of the current request, for Server-Timing headers and SSE events
+_timings = contextvars.ContextVar('cc_timings', default=None)
+_timings_lock = threading.Lock()
+
+def start_timings():
+    """Begin collecting stage timings for the request handled by this thread/context"""
+    timings = {}
+    _timings.set(timings)
+    return timings
+
+def current_timings():
+    """Stage timings collected so far in this context, in milliseconds"""
+    timings = _timings.get()
+    with _timings_lock:
+        return {stage: round(seconds * 1000, 1) for stage, seconds in (timings or {}).items()}
+
+def record(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage)
+    timings = _timings.get()
+    if timings is not None:
+        # Worker threads running submit()ted work add to the same dict
+        with _timings_lock:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+def submit(executor, fn, *args, **kwargs):
+    """executor.submit() in a copy of the caller's context, so the work's stage timings count towards its request"""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+@contextmanager
+def timed(stage):
+    """Time a block as one stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+def server_timing(timings_ms):
+    """Format stage timings (ms) as a Server-Timing header value"""
+    return ', '.join(f"{stage};dur={ms}" for stage, ms in timings_ms.items())
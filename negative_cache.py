@@ -0,0 +1,90 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import config
+
+logger = logging.getLogger(__name__)
+
+class NegativeCache:
+    """Bounded in-memory record of lookups that found nothing.
+
+    Entries remember which crawls were checked, by CDX endpoint rather than
+    position, so that when a new crawl is published only that crawl needs
+    to be searched. Oldest entries are dropped beyond max_entries.
+    """
+
+    def __init__(self, max_entries=10000, ttl=86400):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.time():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def domain_search_space(self, domain, indexes):
+        """Return the newest-first prefix of indexes not yet known to lack domain"""
+        checked_through = self.get(('domain', domain))
+        if checked_through is None or checked_through not in indexes:
+            return indexes
+        return indexes[:indexes.index(checked_through)]
+
+    def mark_domain_absent(self, domain, indexes):
+        """Record that domain is in none of indexes (newest first)"""
+        if indexes:
+            self.put(('domain', domain), indexes[0])
+
+    def unchecked_indexes(self, key, indexes, start):
+        """Return indexes[start::-1] minus the crawls already known to lack key"""
+        candidates = indexes[start::-1]
+        checked = self.get(('url', key))
+        if checked is None or checked[0] not in indexes or checked[1] not in indexes:
+            return candidates
+        oldest, newest = indexes.index(checked[0]), indexes.index(checked[1])
+        return [index for position, index in zip(range(start, -1, -1), candidates)
+                if not newest <= position <= oldest]
+
+    def mark_url_absent(self, key, indexes, start):
+        """Record that key is in none of indexes[start::-1], merging with earlier misses"""
+        oldest = start
+        checked = self.get(('url', key))
+        if checked is not None and checked[0] in indexes and checked[1] in indexes:
+            # Ranges are merged only when contiguous with the one just searched
+            if indexes.index(checked[1]) <= start + 1:
+                oldest = max(start, indexes.index(checked[0]))
+        self.put(('url', key), (indexes[oldest], indexes[0]))
+
+_negative_cache = None
+_negative_cache_lock = threading.Lock()
+
+def get_negative_cache():
+    """Return the process-wide negative cache"""
+    global _negative_cache
+    if _negative_cache is None:
+        with _negative_cache_lock:
+            if _negative_cache is None:
+                _negative_cache = NegativeCache(config.NEGATIVE_CACHE_SIZE, config.NEGATIVE_CACHE_TTL)
+    return _negative_cache
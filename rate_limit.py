@@ -0,0 +1,193 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import config
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    host TEXT PRIMARY KEY,
+    state TEXT NOT NULL
+);
+"""
+
+def retry_after_seconds(value):
+    """Parse a Retry-After header (seconds or an HTTP date); None if absent or invalid"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class _MemoryBuckets:
+    """Bucket states for this process, guarded by one lock"""
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def update(self, host, fn):
+        with self._lock:
+            self._states[host], result = fn(self._states.get(host))
+            return result
+
+class _SQLiteBuckets:
+    """Bucket states in a SQLite file, so every worker process draws from the same buckets"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def update(self, host, fn):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT state FROM buckets WHERE host = ?', (host,)).fetchone()
+            state, result = fn(json.loads(row[0]) if row else None)
+            conn.execute('INSERT OR REPLACE INTO buckets (host, state) VALUES (?, ?)', (host, json.dumps(state)))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return result
+
+class RateLimiter:
+    """Adaptive token bucket per host.
+
+    Each host starts at max_rate requests per second (or its own rate in
+    host_rates; 0 means unlimited) with bursts of up to `burst`. A 429/503 halves the host's rate and blocks it for the
+    Retry-After period (or an exponential backoff); other server errors
+    cut the rate more gently, and successes grow it back towards max_rate.
+    reserve() returns how long to wait rather than sleeping, so threaded
+    and asyncio callers can share the same buckets.
+    """
+
+    def __init__(self, buckets, max_rate, burst, min_rate, backoff, max_wait, host_rates=None):
+        self.buckets = buckets
+        self.max_rate = max_rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.backoff = backoff
+        self.max_wait = max_wait
+        self.host_rates = host_rates or {}
+
+    def max_rate_for(self, host):
+        return self.host_rates.get(host, self.max_rate)
+
+    def _state(self, host, state, now):
+        if state is None:
+            state = {'tokens': self.burst, 'updated': now, 'rate': self.max_rate_for(host), 'blocked_until': 0, 'strikes': 0}
+        state['tokens'] = min(self.burst, state['tokens'] + (now - state['updated']) * state['rate'])
+        state['updated'] = now
+        return state
+
+    def reserve(self, host):
+        """Take a token for host and return the seconds to wait before using it"""
+        if self.max_rate_for(host) <= 0:
+            # No token bucket, but a 429/503 still blocks the host until its Retry-After
+            def blocked(state):
+                return state, 0.0 if state is None else max(0.0, state['blocked_until'] - time.time())
+            return self.buckets.update(host, blocked)
+
+        def take(state):
+            now = time.time()
+            state = self._state(host, state, now)
+            state['tokens'] -= 1
+            # Negative tokens are requests already queued ahead of this one
+            wait = max(0.0, -state['tokens'] / state['rate'], state['blocked_until'] - now)
+            return state, wait
+        return self.buckets.update(host, take)
+
+    def wait(self, host):
+        """Block until host may be sent another request"""
+        delay = self.reserve(host)
+        if delay > 0:
+            time.sleep(delay)
+
+    def succeeded(self, host):
+        if self.max_rate_for(host) <= 0:
+            def reset(state):
+                if state is not None:
+                    state['strikes'] = 0
+                return state, None
+            self.buckets.update(host, reset)
+            return
+
+        def grow(state):
+            state = self._state(host, state, time.time())
+            max_rate = self.max_rate_for(host)
+            state['rate'] = min(max_rate, state['rate'] + max_rate / 20)
+            state['strikes'] = 0
+            return state, None
+        self.buckets.update(host, grow)
+
+    def failed(self, host):
+        """A server error or connection failure: back off a little"""
+        if self.max_rate_for(host) <= 0:
+            return
+
+        def shrink(state):
+            state = self._state(host, state, time.time())
+            state['rate'] = max(self.min_rate, state['rate'] * 0.8)
+            return state, None
+        self.buckets.update(host, shrink)
+
+    def throttled(self, host, retry_after=None):
+        """A 429/503: halve the rate, block the host and return the delay before a retry"""
+        def block(state):
+            now = time.time()
+            state = self._state(host, state, now)
+            state['rate'] = max(self.min_rate, state['rate'] / 2)
+            delay = retry_after_seconds(retry_after)
+            if delay is None:
+                delay = self.backoff * (2 ** state['strikes'])
+            delay = min(delay, self.max_wait)
+            state['strikes'] += 1
+            state['blocked_until'] = max(state['blocked_until'], now + delay)
+            state['tokens'] = min(state['tokens'], 0)
+            return state, delay
+        return self.buckets.update(host, block)
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def get_limiter():
+    """Return the process-wide rate limiter"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                if config.RATE_LIMIT_SHARED:
+                    buckets = _SQLiteBuckets(config.RATE_LIMIT_PATH)
+                else:
+                    buckets = _MemoryBuckets()
+                # WARC range fetches get their own (by default no) limit, apart from the CDX servers
+                host_rates = {urlsplit(config.DATA_URL).hostname: config.RATE_LIMIT_DATA_RATE}
+                _limiter = RateLimiter(buckets, config.RATE_LIMIT_RATE, config.RATE_LIMIT_BURST,
+                                       config.RATE_LIMIT_MIN_RATE, config.RATE_LIMIT_BACKOFF,
+                                       config.RATE_LIMIT_MAX_WAIT, host_rates)
+    return _limiter
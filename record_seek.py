@@ -0,0 +1,205 @@
+import logging
+import threading
+import zlib
+from collections import OrderedDict, namedtuple
+
+from flask import Response
+
+import conditional
+import config
+import http_client
+import metrics
+import record_store
+import warc_stream
+
+logger = logging.getLogger(__name__)
+
+Checkpoint = namedtuple('Checkpoint', ['compressed', 'decoded', 'state'])
+
+RecordLayout = namedtuple('RecordLayout', ['status', 'headers', 'content_type', 'payload_start', 'payload_length', 'identity'])
+
+def _new_state():
+    return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+def parse_layout(head):
+    """Parse the WARC and HTTP headers at the start of a decoded record; None if incomplete or not a response"""
+    warc_end = head.find(b'\r\n\r\n')
+    http_end = head.find(b'\r\n\r\n', warc_end + 4) if warc_end != -1 else -1
+    if http_end == -1:
+        return None
+    warc_lines = head[:warc_end].decode('utf-8', errors='replace').split('\r\n')
+    warc_headers = {}
+    for line in warc_lines[1:]:
+        name, _, value = line.partition(':')
+        warc_headers[name.strip().lower()] = value.strip()
+    if warc_headers.get('warc-type') != 'response' or not warc_headers.get('content-length', '').isdigit():
+        return None
+
+    http_lines = head[warc_end + 4:http_end].decode('iso-8859-1').split('\r\n')
+    status = http_lines[0].split(' ', 2)[1] if len(http_lines[0].split(' ')) > 1 else ''
+    headers = []
+    for line in http_lines[1:]:
+        name, _, value = line.partition(':')
+        headers.append((name.strip(), value.strip()))
+    lookup = {name.lower(): value for name, value in headers}
+    http_length = http_end + 4 - (warc_end + 4)
+    identity = not lookup.get('content-encoding') and 'chunked' not in lookup.get('transfer-encoding', '').lower()
+    return RecordLayout(status, headers, lookup.get('content-type'), http_end + 4,
+                        int(warc_headers.get('content-length', 0)) - http_length, identity)
+
+class RecordSeeker:
+    """Serves byte ranges of WARC record payloads without inflating from the record start every time.
+
+    A record is one gzip member, so reaching byte N of its payload means
+    inflating everything before it. While a record is decoded, the inflate
+    state is copied every `interval` decoded bytes; a later range resumes
+    from the nearest checkpoint at or before it and Range-fetches only the
+    compressed bytes from there on. Checkpoints of recently used records
+    are kept, at most max_checkpoints in all (each holds a 32 KiB window).
+    """
+
+    def __init__(self, interval, max_checkpoints, chunk_size):
+        self.interval = interval
+        self.max_checkpoints = max_checkpoints
+        self.chunk_size = chunk_size
+        self._records = OrderedDict()
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def _entry(self, key):
+        with self._lock:
+            entry = self._records.get(key)
+            if entry is None:
+                entry = self._records[key] = {'layout': None, 'checkpoints': [Checkpoint(0, 0, _new_state())]}
+            self._records.move_to_end(key)
+            return entry
+
+    def _save(self, key, checkpoint):
+        with self._lock:
+            entry = self._records.get(key)
+            if entry is None or any(cp.decoded == checkpoint.decoded for cp in entry['checkpoints']):
+                return
+            entry['checkpoints'].append(checkpoint)
+            entry['checkpoints'].sort(key=lambda cp: cp.decoded)
+            self._count += 1
+            while self._count > self.max_checkpoints and self._records:
+                _, evicted = self._records.popitem(last=False)
+                self._count -= len(evicted['checkpoints']) - 1
+
+    def _nearest(self, key, position):
+        entry = self._entry(key)
+        with self._lock:
+            return max((cp for cp in entry['checkpoints'] if cp.decoded <= position), key=lambda cp: cp.decoded)
+
+    def _inflate(self, key, filename, offset, length, checkpoint, until):
+        """Yield (position, data) decoded from checkpoint on until decoded position `until`, saving checkpoints"""
+        state = checkpoint.state.copy()
+        compressed, decoded, saved = checkpoint.compressed, checkpoint.decoded, checkpoint.decoded
+        offset, length = int(offset), int(length)
+        with metrics.timed('range_fetch'):
+            response = http_client.get(f"{warc_stream.DATA_URL}/{filename}",
+                                       headers={'Range': f"bytes={offset + compressed}-{offset + length - 1}"},
+                                       stream=True)
+        if response.status_code != 206:
+            response.close()
+            raise IOError(f"Range fetch of {filename} failed with status {response.status_code}")
+        try:
+            while decoded < until and not state.eof:
+                data = response.raw.read(self.chunk_size)
+                if not data:
+                    out = state.flush()
+                    if out:
+                        yield decoded, out
+                    return
+                while data and decoded < until and not state.eof:
+                    out = state.decompress(data, self.chunk_size)
+                    compressed += len(data) - len(state.unconsumed_tail)
+                    data = state.unconsumed_tail
+                    if out:
+                        yield decoded, out
+                        decoded += len(out)
+                    if decoded - saved >= self.interval:
+                        self._save(key, Checkpoint(compressed, decoded, state.copy()))
+                        saved = decoded
+        finally:
+            response.close()
+
+    def layout(self, filename, offset, length):
+        """Return the RecordLayout of a record, reading its headers on first use; None if it has none"""
+        key = (filename, str(offset), str(length))
+        entry = self._entry(key)
+        if entry['layout'] is None:
+            head = b''
+            inflater = self._inflate(key, filename, offset, length, entry['checkpoints'][0], float('inf'))
+            try:
+                for _, data in inflater:
+                    head += data
+                    if parse_layout(head) is not None or len(head) > 1024 * 1024:
+                        break
+            finally:
+                inflater.close()
+            entry['layout'] = parse_layout(head) or False
+        return entry['layout'] or None
+
+    def iter_range(self, filename, offset, length, start, stop):
+        """Yield bytes [start, stop) of a record's payload, inflating from the nearest checkpoint"""
+        key = (filename, str(offset), str(length))
+        layout = self.layout(filename, offset, length)
+        begin, end = layout.payload_start + start, layout.payload_start + stop
+        for position, data in self._inflate(key, filename, offset, length, self._nearest(key, begin), end):
+            low, high = max(begin - position, 0), min(end - position, len(data))
+            if high > low:
+                metrics.FETCHED_BYTES.inc('warc_range', amount=high - low)
+                yield data[low:high]
+
+_seeker = None
+_seeker_lock = threading.Lock()
+
+def get_seeker():
+    """Return the process-wide record seeker"""
+    global _seeker
+    if _seeker is None:
+        with _seeker_lock:
+            if _seeker is None:
+                _seeker = RecordSeeker(config.RANGE_CHECKPOINT_INTERVAL, config.RANGE_CHECKPOINT_MAX,
+                                       config.STREAM_CHUNK_SIZE)
+    return _seeker
+
+def range_response(req, capture, headers=None):
+    """A 206 (or 416) for the request's byte range of a capture's payload, or None to serve it in full.
+
+    Only used for records not in the record store (stored copies serve
+    ranges straight from disk) and whose payload is sent as captured.
+    """
+    if not req.headers.get('Range') or not all(capture.get(k) for k in ('filename', 'offset', 'length')):
+        return None
+    store = record_store.get_store()
+    if store is not None and store.get(capture.get('digest')) is not None:
+        return None
+    seeker = get_seeker()
+    try:
+        layout = seeker.layout(capture['filename'], capture['offset'], capture['length'])
+    except Exception as e:
+        logger.warning(f"Could not read record layout of {capture['filename']}: {str(e)}")
+        return None
+    if layout is None or not layout.identity:
+        return None
+
+    try:
+        span = conditional.byte_range(req, layout.payload_length, capture)
+    except conditional.RangeNotSatisfiable:
+        return conditional.range_not_satisfiable(layout.payload_length)
+    if span is None:
+        return None
+    start, stop = span
+    chunks = seeker.iter_range(capture['filename'], capture['offset'], capture['length'], start, stop)
+    response = Response(chunks, status=206,
+                        content_type=layout.content_type or capture.get('mime') or 'application/octet-stream')
+    response.headers.update(conditional.validator_headers(capture))
+    response.headers.update({
+        'Content-Range': f"bytes {start}-{stop - 1}/{layout.payload_length}",
+        'Content-Length': str(stop - start),
+        'Accept-Ranges': 'bytes'
+    })
+    response.headers.update(headers or {})
+    return response
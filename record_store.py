@@ -0,0 +1,179 @@
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+import config
+
+logger = logging.getLogger(__name__)
+
+StoredPayload = namedtuple('StoredPayload', ['digest', 'path', 'size', 'content_type', 'headers'])
+
+class RecordStore:
+    """Content-addressed disk store for decoded WARC payloads, keyed by CDX digest.
+
+    Each payload lives in <root>/<xx>/<digest> with its HTTP status line and
+    headers in a .json sidecar. Reads refresh the file's mtime, which is what
+    eviction orders by once the store grows past max_bytes; it then trims
+    down to low_water * max_bytes, so a full store is not rescanned on every
+    write. The running size only counts this process's writes, so it is
+    re-read from disk at least every rescan_interval seconds.
+    """
+
+    def __init__(self, root, max_bytes, max_record_bytes, low_water=0.9, rescan_interval=300):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_record_bytes = max_record_bytes
+        self.low_water = low_water
+        self.rescan_interval = rescan_interval
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._size = self._scan_size()
+        self._scanned = time.monotonic()
+
+    def _scan_size(self):
+        total = 0
+        for path, _ in self._payload_files():
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+        return total
+
+    def _payload_files(self):
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.is_file() and '.' not in entry.name:
+                    yield entry.path, entry
+
+    def _path(self, digest):
+        key = re.sub(r'[^A-Za-z0-9]', '', digest.split(':')[-1])
+        if not key:
+            return None
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, digest):
+        """Return the StoredPayload for digest, or None if it is not in the store"""
+        path = self._path(digest or '')
+        if path is None:
+            return None
+        try:
+            with open(path + '.json') as f:
+                meta = json.load(f)
+            size = os.path.getsize(path)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return StoredPayload(digest, path, size, meta.get('content_type'), meta.get('headers', []))
+
+    def tee(self, digest, record, chunks):
+        """Yield chunks unchanged while writing them into the store under digest.
+
+        The entry only becomes visible once every chunk was written, so an
+        abandoned or failed stream leaves nothing behind.
+        """
+        path = self._path(digest or '')
+        if path is None or os.path.exists(path):
+            yield from chunks
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        written = 0
+        complete = False
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    if written + len(chunk) <= self.max_record_bytes:
+                        f.write(chunk)
+                    written += len(chunk)
+                    yield chunk
+            complete = written <= self.max_record_bytes
+            if complete:
+                self._commit(path, tmp_path, record, written)
+        finally:
+            if not complete and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def put(self, digest, record, chunks):
+        """Store a payload from an iterable of chunks and return its StoredPayload"""
+        for _ in self.tee(digest, record, chunks):
+            pass
+        return self.get(digest)
+
+    def _commit(self, path, tmp_path, record, size):
+        headers = record.http_headers
+        meta = {
+            'status': headers.get_statuscode(),
+            'content_type': headers.get_header('Content-Type'),
+            'headers': headers.headers,
+            'stored': time.time()
+        }
+        with open(path + '.json', 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._size += size
+            # Other workers write to the same directory; their share shows up on a rescan
+            due = self._size > self.max_bytes or time.monotonic() - self._scanned > self.rescan_interval
+        if due:
+            self.evict()
+
+    def evict(self):
+        """Rescan the store and, if it is over budget, delete least recently used payloads down to the low-water mark"""
+        with self._lock:
+            entries = []
+            for path, entry in self._payload_files():
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            target = self.max_bytes * self.low_water if total > self.max_bytes else total
+            entries.sort()
+            removed = 0
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                for victim in (path, path + '.json'):
+                    try:
+                        os.unlink(victim)
+                    except OSError:
+                        pass
+                total -= size
+                removed += 1
+            self._size = total
+            self._scanned = time.monotonic()
+        if removed:
+            logger.debug(f"Record store evicted {removed} payloads, {total} bytes remain")
+
+def iter_stored(stored, chunk_size=None):
+    """Yield a stored payload from disk in chunks"""
+    chunk_size = chunk_size or config.STREAM_CHUNK_SIZE
+    with open(stored.path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """Return the process-wide record store, or None when it is disabled"""
+    global _store
+    if not config.RECORD_STORE_ENABLED:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = RecordStore(config.RECORD_STORE_DIR, config.RECORD_STORE_MAX_BYTES, config.RECORD_STORE_MAX_RECORD)
+    return _store
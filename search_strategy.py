@@ -0,0 +1,157 @@
+import logging
+import threading
+import time
+
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+class SearchStrategy:
+    """How to find the newest crawl position where a probe succeeds.
+
+    Crawls are ordered newest first and, as the binary search always
+    assumed, a probe that succeeds at one position succeeds at every older
+    one. search(count) is a generator: it yields positions to probe, is
+    sent each probe's result (True/False) and returns the first position
+    that succeeds, or None. Keeping the probing out of the strategy lets
+    the same strategies drive both the threaded and the asyncio search.
+    """
+
+    name = None
+
+    def search(self, count):
+        raise NotImplementedError
+
+class BinarySearch(SearchStrategy):
+    """Bisect the whole list; about log2(count) probes wherever the answer is"""
+
+    name = 'binary'
+
+    def search(self, count):
+        left, right = 0, count - 1
+        found = None
+        while left <= right:
+            mid = (left + right) // 2
+            if (yield mid):
+                found = mid
+                right = mid - 1  # Keep searching newer indexes
+            else:
+                left = mid + 1
+        return found
+
+class GallopingSearch(SearchStrategy):
+    """Probe positions 0, 1, 2, 4, 8, ... then bisect the last gap.
+
+    Costs one probe when the newest crawl holds the answer and about
+    2*log2(position) in general, so it wins when answers sit among the
+    newest crawls.
+    """
+
+    name = 'galloping'
+
+    def search(self, count):
+        if count <= 0:
+            return None
+        previous, position = -1, 0
+        while True:
+            if (yield position):
+                break
+            if position == count - 1:
+                return None
+            previous, position = position, min(count - 1, max(1, position * 2))
+
+        # The answer is in (previous, position]; position is known to succeed
+        left, right = previous + 1, position - 1
+        found = position
+        while left <= right:
+            mid = (left + right) // 2
+            if (yield mid):
+                found = mid
+                right = mid - 1
+            else:
+                left = mid + 1
+        return found
+
+STRATEGIES = {}
+
+def register_strategy(strategy):
+    """Make a SearchStrategy selectable by name (CC_SEARCH_STRATEGY)"""
+    STRATEGIES[strategy.name] = strategy
+    return strategy
+
+register_strategy(BinarySearch())
+register_strategy(GallopingSearch())
+
+def get_strategy(name=None):
+    """Return the named strategy, defaulting to config.SEARCH_STRATEGY"""
+    name = name or config.SEARCH_STRATEGY
+    strategy = STRATEGIES.get(name)
+    if strategy is None:
+        logger.warning(f"Unknown search strategy '{name}', using binary")
+        strategy = STRATEGIES['binary']
+    return strategy
+
+class StrategyStats:
+    """Per-strategy totals of searches, probes and time spent probing"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, name, probes, elapsed, found):
+        metrics.SEARCH_PROBES.observe(probes, name)
+        with self._lock:
+            stats = self._stats.setdefault(name, {'searches': 0, 'found': 0, 'probes': 0, 'seconds': 0.0})
+            stats['searches'] += 1
+            stats['found'] += 1 if found else 0
+            stats['probes'] += probes
+            stats['seconds'] += elapsed
+
+    def get_stats(self):
+        with self._lock:
+            report = {}
+            for name, stats in self._stats.items():
+                searches = stats['searches']
+                report[name] = dict(stats,
+                                    probes_per_search=stats['probes'] / searches,
+                                    ms_per_search=1000 * stats['seconds'] / searches)
+            return report
+
+_stats = StrategyStats()
+
+def get_stats():
+    """Return the process-wide strategy statistics"""
+    return _stats
+
+def find_first(count, probe, strategy=None):
+    """Run a strategy with probe(position) -> bool; return the first position found, or None"""
+    strategy = strategy or get_strategy()
+    start = time.monotonic()
+    probes = 0
+    search = strategy.search(count)
+    try:
+        position = next(search)
+        while True:
+            probes += 1
+            position = search.send(bool(probe(position)))
+    except StopIteration as stop:
+        found = stop.value
+    _stats.record(strategy.name, probes, time.monotonic() - start, found is not None)
+    return found
+
+async def find_first_async(count, probe, strategy=None):
+    """find_first for an async probe(position)"""
+    strategy = strategy or get_strategy()
+    start = time.monotonic()
+    probes = 0
+    search = strategy.search(count)
+    try:
+        position = next(search)
+        while True:
+            probes += 1
+            position = search.send(bool(await probe(position)))
+    except StopIteration as stop:
+        found = stop.value
+    _stats.record(strategy.name, probes, time.monotonic() - start, found is not None)
+    return found
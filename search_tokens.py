@@ -0,0 +1,59 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import config
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+class SearchTokens:
+    """Short-lived results of completed searches, handed out as tokens.
+
+    /search-progress runs the search and issues a token for its result;
+    the form submission that follows redeems it instead of searching
+    again. Tokens expire after ttl seconds and are bound to the URL they
+    were issued for.
+    """
+
+    def __init__(self, ttl, max_entries=1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def issue(self, url, result, partial=False):
+        """Store a search result (partial if the search ran out of time) and return its token"""
+        token = uuid.uuid4().hex
+        with self._lock:
+            self._entries[token] = (url, (result, partial), time.time() + self.ttl)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return token
+
+    def redeem(self, token, url):
+        """Return (result, partial) stored under token for url, or MISSING"""
+        with self._lock:
+            entry = self._entries.get(token or '')
+            if entry is None or entry[2] < time.time():
+                self._entries.pop(token or '', None)
+                return MISSING
+        if entry[0] != url:
+            logger.debug(f"Search token {token} was issued for another URL")
+            return MISSING
+        return entry[1]
+
+_tokens = None
+_tokens_lock = threading.Lock()
+
+def get_search_tokens():
+    """Return the process-wide search token store"""
+    global _tokens
+    if _tokens is None:
+        with _tokens_lock:
+            if _tokens is None:
+                _tokens = SearchTokens(config.SEARCH_TOKEN_TTL)
+    return _tokens
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one.
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait for it and get the same result (or exception). Nothing
+    is kept once the call finishes; caching is left to the callers.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {'calls': 0, 'shared': 0}
+
+    def do(self, key, fn):
+        """Return fn(), sharing one execution among concurrent callers with the same key"""
+        with self._lock:
+            self.stats['calls'] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+                self.stats['shared'] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+            if call.waiters:
+                logger.debug(f"Shared {key} with {call.waiters} waiting callers")
+        return call.result
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, in_flight=len(self._calls))
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines; calls are coalesced within one event loop"""
+
+    def __init__(self):
+        self._calls = {}
+        self.stats = {'calls': 0, 'shared': 0}
+
+    async def do(self, key, fn):
+        """Return await fn(), sharing one execution among concurrent callers with the same key"""
+        loop_key = (id(asyncio.get_running_loop()), key)
+        self.stats['calls'] += 1
+        future = self._calls.get(loop_key)
+        if future is not None:
+            self.stats['shared'] += 1
+            # shield: a cancelled waiter must not cancel the call the others share
+            return await asyncio.shield(future)
+
+        future = self._calls[loop_key] = asyncio.ensure_future(fn())
+
+        def forget(_):
+            if self._calls.get(loop_key) is future:
+                del self._calls[loop_key]
+        future.add_done_callback(forget)
+        return await asyncio.shield(future)
+
+_single_flight = SingleFlight()
+_async_single_flight = AsyncSingleFlight()
+
+def get_single_flight():
+    """Return the process-wide SingleFlight"""
+    return _single_flight
+
+def get_async_single_flight():
+    """Return the process-wide AsyncSingleFlight"""
+    return _async_single_flight
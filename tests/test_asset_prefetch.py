@@ -0,0 +1,33 @@
+import asset_prefetch
+
+def resolve(url, crawl, timestamp):
+    return (f'body of {url}'.encode(), 'text/css', None, None)
+
+def test_first_request_after_render_counts_for_that_render():
+    prefetcher = asset_prefetch.AssetPrefetcher(cache_bytes=1 << 20, workers=2)
+    key = ('https://example.com/a.css', None, None)
+    first = prefetcher.new_batch()
+    prefetcher.submit(first, [key], resolve)
+    assert prefetcher.get(key, resolve)[0] == b'body of https://example.com/a.css'
+    # A repeat request (e.g. a revalidation) is no longer the render's doing
+    prefetcher.get(key, resolve)
+    assert first.stats()['hits'] == 1
+
+    second = prefetcher.new_batch()
+    prefetcher.submit(second, [key], resolve)
+    prefetcher.get(key, resolve)
+    assert second.stats()['hits'] == 1 and second.stats()['queued'] == 0
+    assert [batch.id for batch in prefetcher.recent_batches()] == [second.id, first.id]
+
+def test_failed_prefetch_counts_a_miss():
+    prefetcher = asset_prefetch.AssetPrefetcher(cache_bytes=1 << 20, workers=1)
+    key = ('https://example.com/a.js', None, None)
+
+    def broken(*key):
+        raise OSError('data host down')
+
+    batch = prefetcher.new_batch()
+    prefetcher.submit(batch, [key], broken)
+    assert prefetcher.get(key, resolve)[1] == 'text/css'
+    stats = batch.stats()
+    assert (stats['errors'], stats['hits'], stats['misses']) == (1, 0, 1)
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+pytest.importorskip('flask')
+app = pytest.importorskip('app')
+
+INDEXES = ['CC-MAIN-2024-30', 'CC-MAIN-2024-22']
+
+@pytest.fixture
+def searches(monkeypatch):
+    calls = {'domain': [], 'url': []}
+
+    def find_domain_index(base_domain, indexes, progress=None, search_deadline=None):
+        calls['domain'].append(base_domain)
+        if base_domain == 'broken.example':
+            raise RuntimeError('index unavailable')
+        return None if base_domain == 'absent.example' else indexes[0]
+
+    def find_url_from_index(url, indexes, found_index, progress=None, search_deadline=None):
+        calls['url'].append(url)
+        return {'url': url, 'timestamp': '20240301000000', 'filename': f'crawl-data/{found_index}/a.warc.gz',
+                'offset': '0', 'length': '10', 'languages': 'eng'} if 'page' in url else None
+
+    monkeypatch.setattr(app, 'get_available_indexes', lambda: INDEXES)
+    monkeypatch.setattr(app, 'find_domain_index', find_domain_index)
+    monkeypatch.setattr(app, 'find_url_from_index', find_url_from_index)
+    monkeypatch.setattr(app.cdx_cache, 'get_cache', lambda: None)
+    return calls
+
+def lookup(body, **kwargs):
+    response = app.app.test_client().post('/bulk-lookup', data=body, **kwargs)
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()] if response.status_code == 200 else None
+    return response.status_code, lines
+
+def test_every_url_gets_one_line(searches):
+    urls = ['example.com/page1', 'https://example.com/page2', 'example.com/gone', 'absent.example/page',
+            'broken.example/page', 'example.com/page1']
+    status, lines = lookup('\n'.join(urls))
+    assert status == 200
+    assert sorted(line['url'] for line in lines) == sorted(urls)
+    by_url = {line['url']: line for line in lines}
+    assert by_url['example.com/page1']['result']['filename'] == 'crawl-data/CC-MAIN-2024-30/a.warc.gz'
+    assert 'languages' not in by_url['example.com/page1']['result']
+    assert by_url['example.com/gone']['result'] is None and 'error' not in by_url['example.com/gone']
+    assert by_url['absent.example/page']['result'] is None
+    assert by_url['broken.example/page']['error'] == 'index unavailable'
+    # One domain search per domain, one URL search per distinct URL
+    assert sorted(searches['domain']) == ['absent.example', 'broken.example', 'example.com']
+    assert len(searches['url']) == 3
+
+def test_json_and_jsonl_input(searches):
+    status, lines = lookup(json.dumps(['example.com/page1']), content_type='application/json')
+    assert status == 200 and len(lines) == 1
+    status, lines = lookup('{"url": "example.com/page1"}\n"example.com/page2"\n')
+    assert status == 200 and len(lines) == 2
+
+def test_rejects_bad_requests(searches, monkeypatch):
+    assert lookup('')[0] == 400
+    assert lookup('{"link": "example.com"}')[0] == 400
+    assert lookup(json.dumps({'url': 'example.com'}), content_type='application/json')[0] == 400
+    monkeypatch.setattr(app.config, 'BULK_MAX_URLS', 2)
+    assert lookup('a.example\nb.example\nc.example')[0] == 413
@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+pytest.importorskip('requests')
+
+import capture_map
+import config
+
+INDEX = 'https://index.commoncrawl.org/CC-MAIN-2024-10-index'
+
+CAPTURES = [
+    {'url': 'https://www.example.com/a.css', 'timestamp': '20240301000000'},
+    {'url': 'http://example.com/a.css', 'timestamp': '20240302000000'},
+    {'url': 'https://example.com/search?q=1&b=2', 'timestamp': '20240303000000'},
+    {'url': 'https://example.com/b.js', 'timestamp': '20240304000000'},
+]
+
+class FakeResponse:
+    def __init__(self, status_code, body=b''):
+        self.status_code = status_code
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+    def iter_lines(self):
+        return iter(self.body.splitlines())
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def requests_sent(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, 'LOCAL_INDEX_DIR', str(tmp_path))
+    sent = []
+
+    def get(url, params=None, **kwargs):
+        sent.append(params)
+        if params['url'] != 'example.com':
+            return FakeResponse(404)
+        if params.get('showNumPages'):
+            return FakeResponse(200, json.dumps({'pages': 2}).encode())
+        page = CAPTURES[:2] if params['page'] == 0 else CAPTURES[2:]
+        return FakeResponse(200, '\n'.join(json.dumps(c) for c in page).encode())
+
+    monkeypatch.setattr(capture_map.http_client, 'get', get)
+    return sent
+
+def test_lookup_matches_like_the_cdx_server():
+    rows = [(capture_map.url_key(c['url']), json.dumps(c)) for c in CAPTURES]
+    mapped = capture_map.CaptureMap(rows)
+    assert [c['timestamp'] for c in mapped.lookup('https://example.com/a.css')] == ['20240301000000', '20240302000000']
+    assert len(mapped.lookup('https://example.com/search?b=2&q=1')) == 1
+    assert mapped.lookup('https://example.com/missing') == []
+
+def test_one_map_per_host_answers_every_asset(requests_sent):
+    maps = capture_map.CaptureMaps(max_bytes=1 << 20, max_pages=10)
+    assert len(maps.lookup(INDEX, 'https://www.example.com/a.css')) == 2
+    assert len(maps.lookup(INDEX, 'https://example.com/b.js')) == 1
+    assert maps.lookup(INDEX, 'https://example.com/none.png') == []
+    assert len(requests_sent) == 3  # page count plus two pages, once
+
+def test_large_hosts_are_not_mapped(requests_sent):
+    maps = capture_map.CaptureMaps(max_bytes=1 << 20, max_pages=1)
+    assert maps.lookup(INDEX, 'https://example.com/a.css') is None
+    assert maps.lookup(INDEX, 'https://example.com/b.js') is None
+    assert len(requests_sent) == 1
+
+def test_size_bound_evicts_oldest(requests_sent):
+    maps = capture_map.CaptureMaps(max_bytes=1, max_pages=10)
+    maps.lookup(INDEX, 'https://example.com/a.css')
+    maps.lookup(INDEX, 'https://other.example/a.css')
+    assert (INDEX, 'example.com') not in maps._maps
@@ -0,0 +1,65 @@
+import time
+
+import pytest
+
+import cdx_cache
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = cdx_cache.CDXCache(str(tmp_path / 'cdx.sqlite3'), max_bytes=10_000, evict_every=1)
+    monkeypatch.setattr(cdx_cache, 'get_cache', lambda: cache)
+    return cache
+
+def test_get_set_and_expiry(cache):
+    assert cache.get('a') is cdx_cache.MISSING
+    cache.set('a', [{'url': 'https://example.com/'}], ttl=60)
+    cache.set('b', None, ttl=-1)
+    assert cache.get('a') == [{'url': 'https://example.com/'}]
+    assert cache.get('b') is cdx_cache.MISSING
+
+def test_evicts_least_recently_read(cache):
+    cache.touch_interval = 0
+    cache.set('old', 'x' * 4000, ttl=60)
+    cache.set('hot', 'y' * 4000, ttl=60)
+    time.sleep(0.01)
+    cache.get('old')
+    cache.set('new', 'z' * 4000, ttl=60)
+    assert cache.get('hot') is cdx_cache.MISSING
+    assert cache.get('old') != cdx_cache.MISSING
+    assert cache.get('new') != cdx_cache.MISSING
+
+def test_cached_search_caches_hits_and_misses(cache):
+    calls = []
+
+    @cdx_cache.cached_search('test')
+    def search(url):
+        calls.append(url)
+        return {'url': url} if 'found' in url else None
+
+    assert search('https://example.com/found') == {'url': 'https://example.com/found'}
+    assert search('https://example.com/found') == {'url': 'https://example.com/found'}
+    assert search('https://example.com/missing') is None
+    assert search('https://example.com/missing') is None
+    assert calls == ['https://example.com/found', 'https://example.com/missing']
+
+def test_cached_search_skips_miss_after_probe_failure(cache):
+    calls = []
+
+    @cdx_cache.cached_search('test')
+    def search(url):
+        calls.append(url)
+        if len(calls) == 1:
+            cdx_cache.probe_failed()
+        return None
+
+    assert search('https://example.com/') is None
+    assert cache.get(cdx_cache.search_key('test', 'https://example.com/')) is cdx_cache.MISSING
+    assert search('https://example.com/') is None
+    assert search('https://example.com/') is None
+    assert len(calls) == 2
+
+def test_probe_failed_outside_a_search_is_ignored():
+    cdx_cache.probe_failed()
+    with cdx_cache.search_outcome() as outcome:
+        pass
+    assert not outcome.failed
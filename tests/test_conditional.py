@@ -0,0 +1,74 @@
+import pytest
+
+pytest.importorskip('flask')
+
+from flask import Response
+from werkzeug.test import EnvironBuilder
+
+import conditional
+
+CAPTURE = {'digest': 'sha1:ABCDEF', 'timestamp': '20240115120000'}
+PAYLOAD = bytes(range(256)) * 4
+
+def request(**headers):
+    return EnvironBuilder(headers=headers).get_request()
+
+def test_validators():
+    assert conditional.etag('sha1:ABCDEF') == '"ABCDEF"'
+    assert conditional.etag('sha1:ABCDEF', decoded=True) == '"ABCDEF-identity"'
+    assert conditional.etag(None) is None
+    headers = conditional.validator_headers(CAPTURE)
+    assert headers == {'ETag': '"ABCDEF"', 'Last-Modified': 'Mon, 15 Jan 2024 12:00:00 GMT'}
+
+def test_not_modified_by_etag_and_date():
+    assert conditional.not_modified(request(**{'If-None-Match': '"ABCDEF"'}), CAPTURE)
+    assert conditional.not_modified(request(**{'If-None-Match': '"ABCDEF-identity"'}), CAPTURE)
+    assert not conditional.not_modified(request(**{'If-None-Match': '"OTHER"'}), CAPTURE)
+    assert conditional.not_modified(request(**{'If-Modified-Since': 'Mon, 15 Jan 2024 12:00:00 GMT'}), CAPTURE)
+    assert not conditional.not_modified(request(**{'If-Modified-Since': 'Mon, 15 Jan 2024 11:59:59 GMT'}), CAPTURE)
+    assert not conditional.not_modified(request(), CAPTURE)
+
+def test_not_modified_response_echoes_matched_tag():
+    response = conditional.not_modified_response(request(**{'If-None-Match': '"ABCDEF-identity"'}), CAPTURE,
+                                                 {'Cache-Control': 'public'})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == '"ABCDEF-identity"'
+    assert response.headers['Cache-Control'] == 'public'
+
+def test_byte_range():
+    assert conditional.byte_range(request(), 100, CAPTURE) is None
+    assert conditional.byte_range(request(Range='bytes=10-19'), 100, CAPTURE) == (10, 20)
+    assert conditional.byte_range(request(Range='bytes=-10'), 100, CAPTURE) == (90, 100)
+    assert conditional.byte_range(request(Range='bytes=90-'), 100, CAPTURE) == (90, 100)
+    assert conditional.byte_range(request(Range='bytes=0-1,5-6'), 100, CAPTURE) is None
+    with pytest.raises(conditional.RangeNotSatisfiable):
+        conditional.byte_range(request(Range='bytes=100-'), 100, CAPTURE)
+
+def test_byte_range_if_range():
+    assert conditional.byte_range(request(Range='bytes=0-9', **{'If-Range': '"ABCDEF"'}), 100, CAPTURE) == (0, 10)
+    assert conditional.byte_range(request(Range='bytes=0-9', **{'If-Range': '"OTHER"'}), 100, CAPTURE) is None
+    assert conditional.byte_range(request(Range='bytes=0-9', **{'If-Range': 'Mon, 15 Jan 2024 12:00:00 GMT'}),
+                                  100, CAPTURE) == (0, 10)
+    assert conditional.byte_range(request(Range='bytes=0-9', **{'If-Range': 'Sun, 14 Jan 2024 12:00:00 GMT'}),
+                                  100, CAPTURE) is None
+
+def ranged(**headers):
+    response = Response(PAYLOAD, headers=conditional.validator_headers(CAPTURE))
+    return conditional.make_ranged(response, request(**headers), len(PAYLOAD))
+
+def test_make_ranged_round_trip():
+    for start, stop in [(0, 1), (5, 300), (1000, 1024), (0, 1024)]:
+        response = ranged(Range=f'bytes={start}-{stop - 1}')
+        assert response.status_code == 206
+        assert response.headers['Content-Range'] == f'bytes {start}-{stop - 1}/{len(PAYLOAD)}'
+        assert response.get_data() == PAYLOAD[start:stop]
+
+def test_make_ranged_full_and_unsatisfiable():
+    response = ranged()
+    assert response.status_code == 200
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.get_data() == PAYLOAD
+    assert ranged(Range='bytes=0-9', **{'If-Range': '"OTHER"'}).status_code == 200
+    response = ranged(Range='bytes=5000-')
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{len(PAYLOAD)}'
@@ -0,0 +1,42 @@
+import time
+
+import pytest
+
+import deadline
+
+def test_no_budget_never_expires():
+    search_deadline = deadline.Deadline(None)
+    assert search_deadline.remaining() is None
+    assert search_deadline.timeout(5) == 5
+    search_deadline.check()
+
+def test_timeout_cut_to_what_is_left():
+    search_deadline = deadline.Deadline(1)
+    assert 0.5 < search_deadline.timeout(5) <= 1
+    assert search_deadline.timeout(0.1) == 0.1
+
+def test_sleep_past_budget_raises_at_once():
+    search_deadline = deadline.Deadline(1)
+    start = time.monotonic()
+    with pytest.raises(deadline.DeadlineExceeded):
+        search_deadline.sleep(30)
+    assert time.monotonic() - start < 0.5
+
+def test_expired_budget():
+    search_deadline = deadline.Deadline(0.01)
+    time.sleep(0.02)
+    assert search_deadline.expired()
+    with pytest.raises(deadline.DeadlineExceeded):
+        search_deadline.timeout(5)
+
+def test_http_retries_stop_at_deadline():
+    http_client = pytest.importorskip('http_client')
+    retry = http_client._DeadlineRetry(total=2)
+    assert not retry.is_exhausted()
+    search_deadline = deadline.Deadline(0.01)
+    time.sleep(0.02)
+    http_client._sending.deadline = search_deadline
+    try:
+        assert retry.is_exhausted()
+    finally:
+        http_client._sending.deadline = None
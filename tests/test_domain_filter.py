@@ -0,0 +1,42 @@
+import config
+import domain_filter
+import zipnum
+
+INDEX = 'https://index.commoncrawl.org/CC-MAIN-2024-10-index'
+
+def test_bloom_has_no_false_negatives():
+    bloom = domain_filter.BloomFilter.for_capacity(1000, 0.01)
+    domains = [f"site{n}.example" for n in range(1000)]
+    for domain in domains:
+        bloom.add(domain)
+    assert all(domain in bloom for domain in domains)
+    false_positives = sum(f"other{n}.example" in bloom for n in range(1000))
+    assert false_positives < 50
+
+def test_learned_filter_only_answers_hits(tmp_path):
+    filters = domain_filter.DomainFilters(str(tmp_path), capacity=1000, fp_rate=0.01, verify_rate=0)
+    assert filters.check(INDEX, 'example.com') is None
+    filters.record(INDEX, 'www.example.com', True)
+    filters.record(INDEX, 'missing.example', False)
+    assert filters.check(INDEX, 'example.com') is True
+    assert filters.check(INDEX, 'missing.example') is None
+    assert filters.check('https://example.com/not-a-crawl', 'example.com') is None
+    assert filters.get_stats()['saved_present'] == 1
+
+def test_learned_filter_survives_restart(tmp_path):
+    filters = domain_filter.DomainFilters(str(tmp_path), capacity=1000, fp_rate=0.01, verify_rate=0)
+    filters.record(INDEX, 'example.com', True)
+    filters.save()
+    reloaded = domain_filter.DomainFilters(str(tmp_path), capacity=1000, fp_rate=0.01, verify_rate=0)
+    assert reloaded.check(INDEX, 'example.com') is True
+
+def test_complete_filter_from_local_index(tmp_path, monkeypatch):
+    records = [{'url': url, 'timestamp': '20240301000000'} for url in
+               ('https://blog.example.com/a', 'https://example.org:8080/', 'http://www.example.net/x')]
+    zipnum.write_zipnum(str(tmp_path / 'indexes' / 'CC-MAIN-2024-10'), records)
+    monkeypatch.setattr(config, 'LOCAL_INDEX_DIR', str(tmp_path / 'indexes'))
+    filters = domain_filter.DomainFilters(str(tmp_path / 'filters'), capacity=1000, fp_rate=0.001, verify_rate=0)
+    filters.add_complete('CC-MAIN-2024-10', domain_filter.build_from_local_index('CC-MAIN-2024-10'))
+    for domain in ('blog.example.com', 'example.com', 'example.org', 'www.example.net', 'example.net'):
+        assert filters.check(INDEX, domain) is True
+    assert filters.check(INDEX, 'example.info') is False
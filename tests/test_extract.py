@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+pytest.importorskip('flask')
+extract = pytest.importorskip('extract')
+
+def test_read_urls_text_and_jsonl(tmp_path):
+    path = tmp_path / 'urls.txt'
+    path.write_text('# comment\nexample.com/a\n\n"example.com/b"\n{"url": "example.com/c", "tag": 1}\n')
+    assert extract.read_urls(str(path)) == ['example.com/a', 'example.com/b', 'example.com/c']
+
+@pytest.mark.parametrize('line', ['{"link": "example.com/a"}', '{"url": null}', '{"url": ', '""'])
+def test_read_urls_rejects_entries_without_a_url(tmp_path, line):
+    path = tmp_path / 'urls.jsonl'
+    path.write_text(f'example.com/a\n{line}\n')
+    with pytest.raises(ValueError, match=':2:'):
+        extract.read_urls(str(path))
+
+def test_main_reports_bad_url_file(tmp_path, capsys):
+    path = tmp_path / 'urls.jsonl'
+    path.write_text('{"link": "example.com/a"}\n')
+    with pytest.raises(SystemExit) as exit:
+        extract.main([str(path), '-o', str(tmp_path / 'out.warc.gz')])
+    assert exit.value.code == 2
+    assert 'invalid URL entry' in capsys.readouterr().err
+
+def test_plan_is_sorted_unique_and_coalesced():
+    resolved = {
+        'a': {'filename': 'f2', 'offset': '0', 'length': '10'},
+        'b': {'filename': 'f1', 'offset': '10', 'length': '5'},
+        'c': {'filename': 'f1', 'offset': '0', 'length': '10'},
+        'd': {'filename': 'f1', 'offset': '0', 'length': '10'},
+        'e': None,
+    }
+    records = extract.plan_records(resolved)
+    assert records == [('f1', 0, 10), ('f1', 10, 5), ('f2', 0, 10)]
+    runs = extract.plan_runs(records)
+    assert [(run['filename'], run['offset'], run['length'], run['count']) for run in runs] == \
+        [('f1', 0, 15, 2), ('f2', 0, 10, 1)]
+
+def test_extend_plan_keeps_earlier_order(tmp_path):
+    plan_path = str(tmp_path / 'out.plan.jsonl')
+    assert extract.extend_plan([('f2', 0, 10)], plan_path) == [('f2', 0, 10)]
+    assert extract.extend_plan([('f1', 0, 10), ('f2', 0, 10)], plan_path) == [('f2', 0, 10), ('f1', 0, 10)]
+    with open(plan_path) as f:
+        assert [tuple(json.loads(line)) for line in f] == [('f2', 0, 10), ('f1', 0, 10)]
+
+def test_write_warc_resumes_after_failure(tmp_path, monkeypatch):
+    records = [('f1', 0, 4), ('f2', 0, 4), ('f3', 0, 4)]
+    output, progress = str(tmp_path / 'out.warc.gz'), str(tmp_path / 'out.progress.json')
+    fetched = []
+
+    def fetch_run(run):
+        if run['filename'] == 'f2' and not fetched.count('f2'):
+            fetched.append('f2')
+            raise RuntimeError('connection reset')
+        fetched.append(run['filename'])
+        return run['filename'].encode() + b'..'
+
+    monkeypatch.setattr(extract, 'fetch_run', fetch_run)
+    assert extract.write_warc(records, output, progress) is False
+    assert extract.write_warc(records, output, progress) is True
+    with open(output, 'rb') as f:
+        assert f.read() == b'f1..f2..f3..'
+    assert fetched == ['f1', 'f2', 'f2', 'f3']
@@ -0,0 +1,42 @@
+import random
+import time
+
+import pytest
+
+pytest.importorskip('requests')
+
+import cdx
+import deadline
+
+def make_lookup(answers, delays):
+    def lookup(position):
+        time.sleep(delays[position])
+        answer = answers[position]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+    return lookup
+
+@pytest.mark.parametrize('seed', range(10))
+def test_concurrent_answer_matches_serial_order(seed):
+    rng = random.Random(seed)
+    answers = [rng.choice([None, None, None, f'hit-{i}', RuntimeError('boom')]) for i in range(12)]
+    delays = [rng.random() * 0.02 for _ in answers]
+    probes = [(i,) for i in range(len(answers))]
+    lookup = make_lookup(answers, delays)
+    assert cdx.find_first_match(probes, lookup, max_workers=6) == cdx.find_first_match(probes, lookup)
+
+def test_errors_count_as_misses():
+    answers = [RuntimeError('boom'), None, 'hit']
+    probes = [(i,) for i in range(3)]
+    assert cdx.find_first_match(probes, make_lookup(answers, [0, 0, 0]), max_workers=3) == 'hit'
+
+def test_unknown_answer_before_a_hit_raises():
+    answers = [None, deadline.DeadlineExceeded(), 'hit']
+    probes = [(i,) for i in range(3)]
+    with pytest.raises(deadline.DeadlineExceeded) as raised:
+        cdx.find_first_match(probes, make_lookup(answers, [0, 0.01, 0]), max_workers=3)
+    assert raised.value.partial == 'hit'
+
+def test_no_probes():
+    assert cdx.find_first_match([], lambda: 'hit', max_workers=4) is None
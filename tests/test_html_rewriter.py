@@ -0,0 +1,34 @@
+import html_rewriter
+
+PAGE = (b'<html><head><link href="/style.css" rel=stylesheet><script src=\'app.js\'></script>'
+        b'<style>body{background:url("/img/bg.png")} .x{background:url(i.gif)}</style></head>'
+        b'<body><img src=https://example.com/a.png><a href="/next">next</a></body></html>')
+
+def rewrite(kind, url):
+    return f'/asset?kind={kind}&url={url}'
+
+def rewrite_all(chunks, lookahead=64):
+    return b''.join(html_rewriter.rewrite_stream(iter(chunks), rewrite, lookahead=lookahead))
+
+def test_rewrites_every_reference():
+    out = rewrite_all([PAGE])
+    for kind, url in [('href', '/style.css'), ('src', 'app.js'), ('url', '/img/bg.png'), ('url', 'i.gif'),
+                      ('src', 'https://example.com/a.png'), ('href', '/next')]:
+        assert f'/asset?kind={kind}&url={url}'.encode() in out
+
+def test_output_does_not_depend_on_chunking():
+    expected = rewrite_all([PAGE])
+    for size in range(1, 40):
+        chunks = [PAGE[i:i + size] for i in range(0, len(PAGE), size)]
+        assert rewrite_all(chunks) == expected, size
+    for cut in range(len(PAGE)):
+        assert rewrite_all([PAGE[:cut], PAGE[cut:]]) == expected, cut
+
+def test_holds_back_at_most_lookahead_bytes():
+    rewriter = html_rewriter.LinkRewriter(rewrite, lookahead=32)
+    emitted = b''
+    for i in range(0, 4096, 100):
+        emitted += rewriter.feed(b'x' * 100)
+        assert len(rewriter._buffer) <= 32 + 100
+    emitted += rewriter.close()
+    assert emitted == b'x' * 4100
@@ -0,0 +1,16 @@
+import os
+
+import pytest
+
+http_client = pytest.importorskip('http_client')
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_forked_child_builds_its_own_session():
+    parent_session = http_client.get_session()
+    pid = os.fork()
+    if pid == 0:
+        ok = http_client._session is None and http_client.get_session() is not parent_session
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert http_client.get_session() is parent_session
@@ -0,0 +1,35 @@
+import pytest
+
+pytest.importorskip('flask')
+app = pytest.importorskip('app')
+
+RESULT = {
+    'url': 'https://example.com/', 'timestamp': '20240115123000', 'status': '200', 'mime': 'text/html',
+    'filename': 'crawl-data/CC-MAIN-2024-10/segments/1/warc/a.warc.gz', 'offset': '100', 'length': '2000',
+    'digest': 'sha1:ABCDEF'
+}
+
+@pytest.fixture
+def client():
+    return app.app.test_client()
+
+def test_post_renders_found_result(client, monkeypatch):
+    monkeypatch.setattr(app, 'search_common_crawl', lambda url: RESULT)
+    response = client.post('/', data={'url': 'example.com'})
+    assert response.status_code == 200
+    html = response.get_data(as_text=True)
+    assert 'CC-MAIN-2024-10' in html
+    assert 'sha1:ABCDEF' in html
+
+def test_post_redeems_search_token(client, monkeypatch):
+    def search(url):
+        raise AssertionError('searched again despite a search token')
+    monkeypatch.setattr(app, 'search_common_crawl', search)
+    token = app.search_tokens.get_search_tokens().issue(app.normalize_url('example.com'), RESULT)
+    response = client.post('/', data={'url': 'example.com', 'search_token': token})
+    assert response.status_code == 200
+    assert 'sha1:ABCDEF' in response.get_data(as_text=True)
+
+def test_post_renders_miss(client, monkeypatch):
+    monkeypatch.setattr(app, 'search_common_crawl', lambda url: None)
+    assert client.post('/', data={'url': 'example.com'}).status_code == 200
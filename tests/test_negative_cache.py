@@ -0,0 +1,37 @@
+import negative_cache
+
+INDEXES = ['CC-MAIN-2024-30', 'CC-MAIN-2024-22', 'CC-MAIN-2024-18', 'CC-MAIN-2024-10']
+
+def test_absent_domain_searches_only_new_crawls():
+    cache = negative_cache.NegativeCache()
+    assert cache.domain_search_space('example.com', INDEXES) == INDEXES
+    cache.mark_domain_absent('example.com', INDEXES)
+    assert cache.domain_search_space('example.com', INDEXES) == []
+    # A crawl published since then is the only one left to check
+    assert cache.domain_search_space('example.com', ['CC-MAIN-2024-33'] + INDEXES) == ['CC-MAIN-2024-33']
+
+def test_absent_url_skips_checked_crawls():
+    cache = negative_cache.NegativeCache()
+    key = ('app', 'https://example.com/a')
+    assert cache.unchecked_indexes(key, INDEXES, 2) == ['CC-MAIN-2024-18', 'CC-MAIN-2024-22', 'CC-MAIN-2024-30']
+    cache.mark_url_absent(key, INDEXES, 2)
+    assert cache.unchecked_indexes(key, INDEXES, 2) == []
+    assert cache.unchecked_indexes(key, INDEXES, 3) == ['CC-MAIN-2024-10']
+    assert cache.unchecked_indexes(key, ['CC-MAIN-2024-33'] + INDEXES, 3) == ['CC-MAIN-2024-33']
+
+def test_contiguous_misses_merge():
+    cache = negative_cache.NegativeCache()
+    key = ('app', 'https://example.com/a')
+    cache.mark_url_absent(key, INDEXES, 1)
+    cache.mark_url_absent(key, ['CC-MAIN-2024-33'] + INDEXES, 0)
+    assert cache.unchecked_indexes(key, ['CC-MAIN-2024-33'] + INDEXES, 2) == []
+
+def test_bounded_and_expiring():
+    cache = negative_cache.NegativeCache(max_entries=2, ttl=60)
+    for domain in ('a.com', 'b.com', 'c.com'):
+        cache.mark_domain_absent(domain, INDEXES)
+    assert cache.get(('domain', 'a.com')) is None
+    assert cache.get(('domain', 'c.com')) == INDEXES[0]
+    expired = negative_cache.NegativeCache(ttl=-1)
+    expired.mark_domain_absent('a.com', INDEXES)
+    assert expired.domain_search_space('a.com', INDEXES) == INDEXES
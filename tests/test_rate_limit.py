@@ -0,0 +1,89 @@
+import pytest
+
+import rate_limit
+
+def make_limiter(buckets, rate=10, host_rates=None):
+    return rate_limit.RateLimiter(buckets, max_rate=rate, burst=2, min_rate=0.5, backoff=1.0,
+                                  max_wait=60, host_rates=host_rates)
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def buckets(request, tmp_path):
+    if request.param == 'memory':
+        return rate_limit._MemoryBuckets()
+    return rate_limit._SQLiteBuckets(str(tmp_path / 'rate_limit.sqlite3'))
+
+def test_burst_then_paced(buckets):
+    limiter = make_limiter(buckets)
+    assert limiter.reserve('index.example') == 0
+    assert limiter.reserve('index.example') == 0
+    assert limiter.reserve('index.example') == pytest.approx(0.1, abs=0.02)
+
+def test_throttled_blocks_for_retry_after(buckets):
+    limiter = make_limiter(buckets)
+    assert limiter.throttled('index.example', '30') == 30
+    assert limiter.reserve('index.example') == pytest.approx(30, abs=1)
+    assert limiter.reserve('other.example') == 0
+
+def test_unlimited_host_never_waits(buckets):
+    limiter = make_limiter(buckets, host_rates={'data.example': 0})
+    assert all(limiter.reserve('data.example') == 0 for _ in range(50))
+
+def test_unlimited_host_honours_retry_after(buckets):
+    limiter = make_limiter(buckets, host_rates={'data.example': 0})
+    assert limiter.throttled('data.example', '30') == 30
+    assert limiter.reserve('data.example') == pytest.approx(30, abs=1)
+
+def test_rate_zero_honours_backoff(buckets):
+    limiter = make_limiter(buckets, rate=0)
+    assert limiter.throttled('index.example') == 1.0
+    assert limiter.throttled('index.example') == 2.0
+    assert limiter.reserve('index.example') == pytest.approx(2.0, abs=0.5)
+    # A success ends the run of strikes, so the next backoff starts over
+    limiter.succeeded('index.example')
+    assert limiter.throttled('index.example') == 1.0
+
+def test_retry_after_date():
+    assert rate_limit.retry_after_seconds('Wed, 21 Oct 2015 07:28:00 GMT') == 0
+    assert rate_limit.retry_after_seconds('5') == 5
+    assert rate_limit.retry_after_seconds('soon') is None
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def close(self):
+        pass
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+
+    def get(self, url, **kwargs):
+        return self.responses.pop(0)
+
+def test_get_waits_out_429_on_unlimited_host(monkeypatch):
+    http_client = pytest.importorskip('http_client')
+    import deadline
+
+    limiter = make_limiter(rate_limit._MemoryBuckets(), host_rates={'data.example': 0})
+    session = FakeSession([FakeResponse(429, {'Retry-After': '2'}), FakeResponse(200)])
+    monkeypatch.setattr(http_client.rate_limit, 'get_limiter', lambda: limiter)
+    monkeypatch.setattr(http_client, 'get_session', lambda: session)
+    sleeps = []
+    monkeypatch.setattr(deadline.time, 'sleep', sleeps.append)
+
+    assert http_client.get('https://data.example/crawl-data/x.warc.gz').status_code == 200
+    assert sleeps[-1] == pytest.approx(2, abs=0.5)
+
+def test_get_stops_at_search_deadline(monkeypatch):
+    http_client = pytest.importorskip('http_client')
+    import deadline
+
+    limiter = make_limiter(rate_limit._MemoryBuckets(), host_rates={'data.example': 0})
+    session = FakeSession([FakeResponse(429, {'Retry-After': '60'}), FakeResponse(200)])
+    monkeypatch.setattr(http_client.rate_limit, 'get_limiter', lambda: limiter)
+    monkeypatch.setattr(http_client, 'get_session', lambda: session)
+
+    with pytest.raises(deadline.DeadlineExceeded):
+        http_client.get('https://data.example/crawl-data/x.warc.gz', search_deadline=deadline.Deadline(5))
@@ -0,0 +1,108 @@
+import gzip
+import io
+import random
+
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('requests')
+pytest.importorskip('warcio')
+
+from werkzeug.test import EnvironBuilder
+
+import record_seek
+import record_store
+
+PREFIX = b'earlier records' * 100
+
+def warc_record(body, content_type='video/mp4', extra_headers=''):
+    http = (f"HTTP/1.1 200 OK\r\nContent-Type: {content_type}\r\n{extra_headers}"
+            f"Content-Length: {len(body)}\r\n\r\n").encode('ascii') + body
+    head = ("WARC/1.0\r\nWARC-Type: response\r\nWARC-Target-URI: https://example.com/v.mp4\r\n"
+            f"Content-Type: application/http; msgtype=response\r\nContent-Length: {len(http)}\r\n\r\n")
+    return gzip.compress(head.encode('ascii') + http + b'\r\n\r\n')
+
+class FakeResponse:
+    def __init__(self, data):
+        self.status_code = 206
+        self.raw = io.BytesIO(data)
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def warc(monkeypatch):
+    """A WARC file holding one record after some other bytes, served to Range requests"""
+    rng = random.Random(3)
+    payload = bytes(rng.choice(b'abcdefgh') for _ in range(300000))
+    record = warc_record(payload)
+    data = PREFIX + record + b'later records'
+    fetched = []
+
+    def get(url, headers=None, **kwargs):
+        start, end = headers['Range'][len('bytes='):].split('-')
+        fetched.append(int(start))
+        return FakeResponse(data[int(start):int(end) + 1])
+
+    monkeypatch.setattr(record_seek.http_client, 'get', get)
+    capture = {'filename': 'crawl/warc.gz', 'offset': str(len(PREFIX)), 'length': str(len(record)),
+               'digest': 'sha1:PAYLOAD', 'timestamp': '20240115120000'}
+    return payload, capture, fetched
+
+def test_parse_layout():
+    head = gzip.decompress(warc_record(b'x' * 10, 'text/css'))
+    layout = record_seek.parse_layout(head)
+    assert layout.content_type == 'text/css'
+    assert layout.payload_length == 10
+    assert head[layout.payload_start:layout.payload_start + 10] == b'x' * 10
+    assert layout.identity
+    assert not record_seek.parse_layout(gzip.decompress(warc_record(b'x', extra_headers='Content-Encoding: gzip\r\n'))).identity
+    assert record_seek.parse_layout(head.replace(b'WARC-Type: response', b'WARC-Type: request')) is None
+    assert record_seek.parse_layout(head[:40]) is None
+
+def test_ranges_round_trip(warc):
+    payload, capture, fetched = warc
+    seeker = record_seek.RecordSeeker(interval=16 * 1024, max_checkpoints=100, chunk_size=4096)
+    args = (capture['filename'], capture['offset'], capture['length'])
+    rng = random.Random(1)
+    spans = [(0, 1), (len(payload) - 1, len(payload)), (0, len(payload))]
+    spans += [sorted((rng.randrange(len(payload)), rng.randrange(len(payload) + 1))) for _ in range(30)]
+    for start, stop in spans:
+        assert b''.join(seeker.iter_range(*args, start, stop)) == payload[start:stop], (start, stop)
+
+def test_later_seeks_resume_from_checkpoints(warc):
+    payload, capture, fetched = warc
+    seeker = record_seek.RecordSeeker(interval=16 * 1024, max_checkpoints=100, chunk_size=4096)
+    args = (capture['filename'], capture['offset'], capture['length'])
+    b''.join(seeker.iter_range(*args, 0, len(payload)))
+    fetched.clear()
+    assert b''.join(seeker.iter_range(*args, 250000, 250100)) == payload[250000:250100]
+    # Resumed well inside the record rather than at its start
+    assert fetched[0] > len(PREFIX) + 1000
+
+def test_checkpoints_are_bounded(warc):
+    payload, capture, fetched = warc
+    seeker = record_seek.RecordSeeker(interval=4096, max_checkpoints=10, chunk_size=4096)
+    args = (capture['filename'], capture['offset'], capture['length'])
+    assert b''.join(seeker.iter_range(*args, 0, len(payload))) == payload
+    assert seeker._count <= 10
+
+def test_range_response(warc, monkeypatch):
+    payload, capture, fetched = warc
+    seeker = record_seek.RecordSeeker(interval=16 * 1024, max_checkpoints=100, chunk_size=4096)
+    monkeypatch.setattr(record_seek, 'get_seeker', lambda: seeker)
+    monkeypatch.setattr(record_store, 'get_store', lambda: None)
+
+    request = EnvironBuilder(headers={'Range': 'bytes=1000-1999'}).get_request()
+    response = record_seek.range_response(request, capture, {'Cache-Control': 'public'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 1000-1999/{len(payload)}'
+    assert response.headers['ETag'] == '"PAYLOAD"'
+    assert response.mimetype == 'video/mp4'
+    assert response.get_data() == payload[1000:2000]
+
+    request = EnvironBuilder(headers={'Range': f'bytes={len(payload)}-'}).get_request()
+    assert record_seek.range_response(request, capture).status_code == 416
+    assert record_seek.range_response(EnvironBuilder().get_request(), capture) is None
+    request = EnvironBuilder(headers={'Range': 'bytes=0-9', 'If-Range': '"OTHER"'}).get_request()
+    assert record_seek.range_response(request, capture) is None
@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+
+import search_strategy
+
+@pytest.mark.parametrize('name', sorted(search_strategy.STRATEGIES))
+def test_finds_newest_position_holding_the_answer(name):
+    strategy = search_strategy.get_strategy(name)
+    for count in range(0, 20):
+        # answer: first position (newest crawl) where the probe succeeds, or None
+        for answer in list(range(count)) + [None]:
+            probed = []
+
+            def probe(position):
+                probed.append(position)
+                return answer is not None and position >= answer
+
+            assert search_strategy.find_first(count, probe, strategy) == answer
+            assert all(0 <= position < count for position in probed)
+            assert len(probed) == len(set(probed))
+
+@pytest.mark.parametrize('name', sorted(search_strategy.STRATEGIES))
+def test_async_matches_sync(name):
+    strategy = search_strategy.get_strategy(name)
+
+    async def probe(position):
+        return position >= 5
+
+    assert asyncio.run(search_strategy.find_first_async(12, probe, strategy)) == 5
+
+def test_galloping_probes_once_for_newest_crawl():
+    probed = []
+    found = search_strategy.find_first(100, lambda position: probed.append(position) or True,
+                                       search_strategy.get_strategy('galloping'))
+    assert found == 0 and probed == [0]
+
+def test_unknown_strategy_falls_back_to_binary():
+    assert search_strategy.get_strategy('nope').name == 'binary'
@@ -0,0 +1,60 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import single_flight
+
+def test_concurrent_calls_share_one_run():
+    flight = single_flight.SingleFlight()
+    release = threading.Event()
+    runs = []
+
+    def fn():
+        runs.append(1)
+        release.wait(5)
+        return 'result'
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(flight.do, 'key', fn) for _ in range(4)]
+        while flight.get_stats()['calls'] < 4:
+            time.sleep(0.001)
+        release.set()
+        assert [future.result() for future in futures] == ['result'] * 4
+    assert len(runs) == 1
+    assert flight.get_stats() == {'calls': 4, 'shared': 3, 'in_flight': 0}
+
+def test_waiters_get_the_error_and_nothing_is_kept():
+    flight = single_flight.SingleFlight()
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise ValueError('boom')
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(flight.do, 'key', fail) for _ in range(2)]
+        while flight.get_stats()['calls'] < 2:
+            time.sleep(0.001)
+        release.set()
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result()
+    assert flight.do('key', lambda: 'again') == 'again'
+
+def test_async_calls_share_one_run():
+    flight = single_flight.AsyncSingleFlight()
+    runs = []
+
+    async def fn():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        return 'result'
+
+    async def main():
+        return await asyncio.gather(*(flight.do('key', fn) for _ in range(3)))
+
+    assert asyncio.run(main()) == ['result'] * 3
+    assert len(runs) == 1 and flight.stats['shared'] == 2
@@ -0,0 +1,80 @@
+import random
+
+import pytest
+
+import config
+import zipnum
+
+HOSTS = ['example.com', 'www.example.com', 'shop.example.com', 'example.org', 'www2.example.net', 'examples.com']
+PATHS = ['/', '/a', '/a/b.css', '/A/B.css', '/img/logo.png', '/search?q=1&b=2', '/search?b=2&q=1', '/zz']
+
+def make_records(count=600, seed=7):
+    rng = random.Random(seed)
+    records = []
+    for _ in range(count):
+        url = f"{rng.choice(['http', 'https'])}://{rng.choice(HOSTS)}{rng.choice(PATHS)}"
+        timestamp = f"20{rng.randint(10, 24)}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}{rng.randint(0, 235959):06d}"
+        records.append({'url': url, 'timestamp': timestamp, 'mime': 'text/html', 'status': '200'})
+    return records
+
+def host_part(url):
+    return zipnum.surt(url).split(')', 1)[0]
+
+def brute_force(records, url, match_type):
+    """Expected answer of a CDX query, from a scan of every record"""
+    key = zipnum.surt(url)
+    host = host_part(url)
+    if match_type == 'exact':
+        keep = lambda r: zipnum.surt(r['url']) == key
+    elif match_type == 'prefix':
+        keep = lambda r: zipnum.surt(r['url']).startswith(key)
+    elif match_type == 'host':
+        keep = lambda r: host_part(r['url']) == host
+    else:
+        keep = lambda r: host_part(r['url']) == host or host_part(r['url']).startswith(host + ',')
+    return sorted((zipnum.surt(r['url']), r['timestamp'], r['url']) for r in records if keep(r))
+
+@pytest.fixture(scope='module')
+def shard(tmp_path_factory):
+    records = make_records()
+    directory = tmp_path_factory.mktemp('zipnum')
+    # Small blocks and shards, so queries cross block and file boundaries
+    zipnum.write_zipnum(str(directory), records, lines_per_block=17, shard_size=100)
+    return records, zipnum.ZipNumIndex(str(directory))
+
+def test_surt_canonicalises_like_the_cdx_server():
+    assert zipnum.surt('https://www.Example.com/Path?b=2&a=1') == 'com,example)/path?a=1&b=2'
+    assert zipnum.surt('example.com') == 'com,example)/'
+    assert zipnum.surt('http://example.com:8080/x') == 'com,example:8080)/x'
+    assert zipnum.surt('http://example.com:80/x') == 'com,example)/x'
+
+@pytest.mark.parametrize('match_type', ['exact', 'prefix', 'host', 'domain'])
+def test_query_matches_brute_force(shard, match_type):
+    records, index = shard
+    queries = [f"http://{host}{path}" for host in HOSTS + ['missing.example.com', 'a.com'] for path in PATHS]
+    for url in queries:
+        got = [(r['urlkey'], r['timestamp'], r['url']) for r in index.query(url, match_type)]
+        assert got == brute_force(records, url, match_type), (url, match_type)
+
+def test_query_limit(shard):
+    records, index = shard
+    expected = brute_force(records, 'example.com', 'domain')
+    got = index.query('example.com', 'domain', limit=5)
+    assert [(r['urlkey'], r['timestamp'], r['url']) for r in got] == expected[:5]
+
+def test_host_keys(shard):
+    records, index = shard
+    keys = list(index.host_keys())
+    assert keys == sorted(set(keys))
+    assert set(keys) == {host_part(r['url']) for r in records}
+
+def test_local_index_found_after_startup(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'LOCAL_INDEX_DIR', str(tmp_path))
+    monkeypatch.setattr(zipnum, '_indexes', {})
+    api = 'https://index.commoncrawl.org/CC-MAIN-2024-10-index'
+    assert zipnum.get_local_index(api) is None
+
+    zipnum.write_zipnum(str(tmp_path / 'CC-MAIN-2024-10'), make_records(20))
+    index = zipnum.get_local_index(api)
+    assert index is not None
+    assert zipnum.get_local_index(api) is index
@@ -0,0 +1,83 @@
+import logging
+
+from warcio.archiveiterator import ArchiveIterator
+
+import config
+import http_client
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DATA_URL = config.DATA_URL.rstrip('/')
+
+# Content-Encodings a payload can be sent in as captured, rather than decoded
+PASSTHROUGH_ENCODINGS = ('gzip', 'deflate')
+
+def record_range(offset, length):
+    offset = int(offset)
+    return f"bytes={offset}-{offset + int(length) - 1}"
+
+def open_record(filename, offset, length):
+    """Range-fetch a WARC record and return (response, record) for its HTTP response.
+
+    The gzip member is decompressed and parsed incrementally as the caller
+    reads from record.content_stream(); nothing is buffered up front. The
+    caller owns the response and must close it. Returns (None, None) if the
+    fetch fails or holds no response record.
+    """
+    with metrics.timed('range_fetch'):
+        response = http_client.get(
+            f"{DATA_URL}/{filename}",
+            headers={'Range': record_range(offset, length)},
+            stream=True
+        )
+    if response.status_code != 206:
+        logger.error(f"Failed to fetch WARC record from {filename}. Status: {response.status_code}")
+        response.close()
+        return None, None
+
+    try:
+        for record in ArchiveIterator(response.raw):
+            if record.rec_type == 'response' and record.http_headers is not None:
+                return response, record
+    except Exception:
+        response.close()
+        raise
+
+    logger.warning(f"No response record at {filename}:{offset}")
+    response.close()
+    return None, None
+
+def content_encoding(record):
+    """The payload's Content-Encoding if it can be sent as captured, else None.
+
+    Chunked payloads still need their transfer framing removed, so they are
+    always decoded.
+    """
+    encoding = (record.http_headers.get_header('Content-Encoding') or '').strip().lower()
+    transfer = (record.http_headers.get_header('Transfer-Encoding') or '').lower()
+    if encoding in PASSTHROUGH_ENCODINGS and 'chunked' not in transfer:
+        return encoding
+    return None
+
+def iter_payload(response, record, chunk_size=None, raw=False):
+    """Yield the decoded HTTP payload of a record, closing the response when done.
+
+    With raw=True the payload is yielded as captured, still in its
+    Content-Encoding (see content_encoding()).
+    """
+    chunk_size = chunk_size or config.STREAM_CHUNK_SIZE
+    try:
+        stream = record.raw_stream if raw else record.content_stream()
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            metrics.FETCHED_BYTES.inc('warc', amount=len(chunk))
+            yield chunk
+    finally:
+        response.close()
+
+def content_type(record, default='application/octet-stream'):
+    """Return the record's Content-Type header, or default"""
+    return record.http_headers.get_header('Content-Type') or default
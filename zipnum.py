@@ -0,0 +1,191 @@
+import gzip
+import json
+import logging
+import mmap
+import os
+import re
+import threading
+import zlib
+from urllib.parse import urlsplit
+
+import config
+
+logger = logging.getLogger(__name__)
+
+def surt(url):
+    """Return the SURT sort key Common Crawl indexes a URL under, e.g. com,example)/path?a=1"""
+    url = url.strip()
+    if '://' not in url:
+        url = 'http://' + url
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower().strip('.')
+    host = ','.join(reversed(re.sub(r'^www\d*\.', '', host).split('.')))
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    key = host + ')' + (parts.path or '/').lower()
+    if parts.query:
+        key += '?' + '&'.join(sorted(parts.query.lower().split('&')))
+    return key
+
+def key_range(url, match_type):
+    """Return the [start, end) SURT key range a CDX query covers"""
+    key = surt(url)
+    if match_type == 'exact':
+        return key, key + '!'  # '!' sorts right after the ' ' that ends a key
+    if match_type == 'prefix':
+        return key, key + '\xff'
+    host_key = key.split(')', 1)[0]
+    if match_type == 'host':
+        return host_key + ')', host_key + ')\xff'
+    if match_type == 'domain':
+        # The domain itself ("com,example)") and its subdomains ("com,example,www)")
+        return host_key, host_key + '-'
+    raise ValueError(f"Unsupported matchType: {match_type}")
+
+class ZipNumIndex:
+    """One crawl's ZipNum CDX index on local disk.
+
+    cluster.idx, the secondary index, is memory-mapped and binary-searched
+    for the first compressed block that can hold the key range; only the
+    gzip blocks overlapping the range are read and decompressed.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'cluster.idx'), 'rb') as f:
+            self._idx = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _line_start(self, pos):
+        """Return the offset of the start of the line containing pos"""
+        return self._idx.rfind(b'\n', 0, pos) + 1
+
+    def _line(self, start):
+        end = self._idx.find(b'\n', start)
+        if end == -1:
+            end = len(self._idx)
+        return self._idx[start:end], end + 1
+
+    def _first_block(self, key):
+        """Offset of the last idx line whose key sorts before key (or 0)"""
+        low, high = 0, len(self._idx)
+        target = key.encode('utf-8')
+        best = 0
+        while low < high:
+            mid = (low + high) // 2
+            start = self._line_start(mid)
+            line, next_start = self._line(start)
+            if line.split(b'\t', 1)[0] < target:
+                best = start
+                low = next_start
+            else:
+                high = start
+        return best
+
+    def _blocks(self, start_key):
+        pos = self._first_block(start_key)
+        while pos < len(self._idx):
+            line, pos = self._line(pos)
+            if not line:
+                continue
+            fields = line.decode('utf-8').split('\t')
+            yield fields[0], fields[1], int(fields[2]), int(fields[3])
+
+    def _read_block(self, filename, offset, length):
+        with open(os.path.join(self.directory, filename), 'rb') as f:
+            f.seek(offset)
+            data = f.read(length)
+        return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+    def query(self, url, match_type='exact', limit=None):
+        """Return the CDX records for url, in index order, as the CDX server would"""
+        start, end = key_range(url, match_type)
+        start_bytes, end_bytes = start.encode('utf-8'), end.encode('utf-8')
+        records = []
+        for block_key, filename, offset, length in self._blocks(start):
+            if block_key.encode('utf-8') >= end_bytes:
+                break
+            for line in self._read_block(filename, offset, length).splitlines():
+                key = line.split(b' ', 1)[0]
+                if key < start_bytes:
+                    continue
+                if line >= end_bytes:
+                    return records
+                urlkey, timestamp, data = line.decode('utf-8').split(' ', 2)
+                record = json.loads(data)
+                record.setdefault('urlkey', urlkey)
+                record.setdefault('timestamp', timestamp)
+                records.append(record)
+                if limit is not None and len(records) >= limit:
+                    return records
+        return records
+
+    def host_keys(self):
+        """Yield the SURT host key of every capture in the index, without repeats in a row"""
+        previous = None
+        pos = 0
+        while pos < len(self._idx):
+            line, pos = self._line(pos)
+            if not line:
+                continue
+            _, filename, offset, length = line.decode('utf-8').split('\t')[:4]
+            for record in self._read_block(filename, int(offset), int(length)).splitlines():
+                host_key = record.split(b')', 1)[0]
+                if host_key != previous:
+                    previous = host_key
+                    yield host_key.decode('utf-8')
+
+def write_zipnum(directory, records, lines_per_block=3000, shard_size=None):
+    """Write records (dicts with at least url and timestamp) as a ZipNum index.
+
+    Produces cluster.idx plus cdx-NNNNN.gz shards in the Common Crawl layout;
+    useful for building small local indexes to test and benchmark against.
+    """
+    os.makedirs(directory, exist_ok=True)
+    lines = sorted(
+        f"{surt(record['url'])} {record['timestamp']} {json.dumps(record)}"
+        for record in records
+    )
+    shard_size = shard_size or max(len(lines), 1)
+    idx_lines = []
+    for shard_number, shard_start in enumerate(range(0, len(lines), shard_size)):
+        filename = f"cdx-{shard_number:05d}.gz"
+        offset = 0
+        with open(os.path.join(directory, filename), 'wb') as f:
+            shard = lines[shard_start:shard_start + shard_size]
+            for block_start in range(0, len(shard), lines_per_block):
+                block = shard[block_start:block_start + lines_per_block]
+                data = gzip.compress(('\n'.join(block) + '\n').encode('utf-8'))
+                f.write(data)
+                first_key = ' '.join(block[0].split(' ', 2)[:2])
+                idx_lines.append(f"{first_key}\t{filename}\t{offset}\t{len(data)}\t{len(idx_lines) + 1}")
+                offset += len(data)
+    with open(os.path.join(directory, 'cluster.idx'), 'w') as f:
+        f.write('\n'.join(idx_lines) + '\n')
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def crawl_id_of_index(cdx_api):
+    """Map a CDX endpoint such as https://index.commoncrawl.org/CC-MAIN-2024-10-index to its crawl id"""
+    match = re.search(r'(CC-MAIN-[\d-]+?)(?:-index)?/?$', cdx_api)
+    return match.group(1) if match else None
+
+def get_local_index(cdx_api):
+    """Return the local ZipNumIndex for a CDX endpoint, or None if that crawl is not on disk.
+
+    Only indexes found are remembered; a crawl that is missing is looked
+    for again on the next call, so indexes downloaded later are picked up.
+    """
+    if not config.LOCAL_INDEX_DIR:
+        return None
+    crawl_id = crawl_id_of_index(cdx_api)
+    if crawl_id is None:
+        return None
+    with _indexes_lock:
+        if crawl_id not in _indexes:
+            directory = os.path.join(config.LOCAL_INDEX_DIR, crawl_id)
+            if not os.path.exists(os.path.join(directory, 'cluster.idx')):
+                return None
+            logger.info(f"Using local ZipNum index for {crawl_id}")
+            _indexes[crawl_id] = ZipNumIndex(directory)
+        return _indexes[crawl_id]